@@ -26,6 +26,10 @@ variable "role_name_suffix" { type = string }
 # Log-Retention
 variable "log_retention_days" { type = number }
 
+# Near-Duplicate-Erkennung (MinHash/LSH-Buckets in S3; leer = aus)
+variable "neardup_bucket" { type = string, default = "" }
+variable "neardup_prefix" { type = string, default = "neardup/" }
+
 ############################
 # Umgebung
 ############################
@@ -33,6 +37,16 @@ data "aws_partition"       "current" {}
 data "aws_caller_identity" "current" {}
 data "aws_region"          "current"  {}
 
+locals {
+  env_final = merge(
+    var.neardup_bucket != "" ? {
+      NEARDUP_BUCKET = var.neardup_bucket
+      NEARDUP_PREFIX = var.neardup_prefix
+    } : {},
+    var.env
+  )
+}
+
 ############################
 # Validations
 ############################
@@ -70,6 +84,28 @@ resource "aws_iam_role_policy_attachment" "basic_exec" {
   policy_arn = "arn:${data.aws_partition.current.partition}:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
 }
 
+# S3: LSH-Buckets lesen/schreiben (nur Prefix)
+resource "aws_iam_role_policy" "neardup" {
+  count = var.neardup_bucket != "" ? 1 : 0
+  name  = "NearDuplicateS3"
+  role  = aws_iam_role.role.id
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Sid      = "AllowNearDupBuckets",
+      Effect   = "Allow",
+      Action   = ["s3:GetObject", "s3:PutObject"],
+      Resource = "arn:${data.aws_partition.current.partition}:s3:::${var.neardup_bucket}/${var.neardup_prefix}*"
+    }, {
+      Sid       = "AllowNearDupList",                   # sonst liefert GetObject bei Miss 403 statt 404
+      Effect    = "Allow",
+      Action    = ["s3:ListBucket"],
+      Resource  = "arn:${data.aws_partition.current.partition}:s3:::${var.neardup_bucket}",
+      Condition = { StringLike = { "s3:prefix" = ["${var.neardup_prefix}*"] } }
+    }]
+  })
+}
+
 ############################
 # CloudWatch Logs
 ############################
@@ -112,12 +148,12 @@ resource "aws_lambda_function" "fn" {
 
   ephemeral_storage { size = var.ephemeral_storage_size }
 
-  environment { variables = var.env }
+  environment { variables = local.env_final }
 
-  depends_on = [
-    aws_cloudwatch_log_group.lg,
-    aws_iam_role_policy_attachment.basic_exec
-  ]
+  depends_on = concat(
+    [aws_cloudwatch_log_group.lg, aws_iam_role_policy_attachment.basic_exec],
+    aws_iam_role_policy.neardup
+  )
 
   tags = var.tags
 }
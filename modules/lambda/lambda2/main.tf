@@ -32,6 +32,37 @@ variable "security_group_ids" { type = list(string) }
 
 # Bedrock (Inline-Policy nur auf dieses Modell)
 variable "bedrock_model_id" { type = string }            # z.B. "amazon.titan-embed-text-v2:0"
+variable "embed_dimensions" { type = number, default = 0 }   # 0 = Modell-Default; Titan v2: 256 | 512 | 1024
+variable "bedrock_rps"      { type = number, default = 0 }   # Requests/s pro Container (0 = ohne Limiter)
+variable "bedrock_tpm"      { type = number, default = 0 }   # Input-Tokens/min pro Container (0 = ohne Limiter)
+
+# Embedding-Cache in S3 (optional, leer = aus)
+variable "embed_cache_bucket" { type = string, default = "" }
+variable "embed_cache_prefix" { type = string, default = "embeddings/cache/" }
+
+# Vektor-Claim-Check in S3 (optional, leer = Floatliste inline)
+variable "vector_bucket" { type = string, default = "" }
+variable "vector_prefix" { type = string, default = "embeddings/vectors/" }
+variable "vector_dtype"  { type = string, default = "float32" }   # float32 | float16 | int8
+
+# Vektor-Index pro Tenant (optional, leer = aus) + zeitgesteuerter Flush der Pending-Vektoren
+variable "vector_index_bucket"  { type = string, default = "" }
+variable "vector_index_prefix"  { type = string, default = "embeddings/index/" }
+variable "index_flush_schedule" { type = string, default = "" }   # z.B. "rate(5 minutes)", leer = kein Schedule
+variable "layers"               { type = list(string), default = [] }   # z.B. NumPy-Layer für die Index-Suche
+
+# Index-Wartung (Merge + IVF-Training + GC) als eigene Funktion mit mehr Speicher/Laufzeit,
+# gleicher Code/Rolle; leer = keine Wartung (Index bleibt Brute Force mit vielen kleinen Segmenten)
+variable "index_train_schedule"               { type = string, default = "" }   # z.B. "rate(1 hour)"
+variable "index_train_memory_size"            { type = number, default = 3008 }
+variable "index_train_timeout"                { type = number, default = 900 }
+variable "index_train_ephemeral_storage_size" { type = number, default = 10240 }
+
+# Suche (action=search) als eigene Funktion: Segment-Cache in /tmp + Ids/IVF-Listen im RAM
+# (INDEX_MEM_CACHE_ROWS = 25 % von memory_size -> 2048 MB reichen für ~2,6M Vektoren)
+variable "index_search_memory_size"            { type = number, default = 2048 }
+variable "index_search_timeout"                { type = number, default = 30 }
+variable "index_search_ephemeral_storage_size" { type = number, default = 10240 }
 
 ############################
 # Validations
@@ -62,6 +93,27 @@ data "aws_caller_identity" "current" {}
 locals {
   role_name         = var.role_name_suffix
   bedrock_model_arn = "arn:${data.aws_partition.current.partition}:bedrock:${data.aws_region.current.name}::foundation-model/${var.bedrock_model_id}"
+
+  # ENV final: optionale Settings nur setzen, wenn konfiguriert
+  env_final = merge(
+    var.embed_dimensions > 0 ? { EMBED_DIMENSIONS = tostring(var.embed_dimensions) } : {},
+    var.bedrock_rps > 0 ? { BEDROCK_RPS = tostring(var.bedrock_rps) } : {},
+    var.bedrock_tpm > 0 ? { BEDROCK_TPM = tostring(var.bedrock_tpm) } : {},
+    var.embed_cache_bucket != "" ? {
+      EMBED_CACHE_BUCKET = var.embed_cache_bucket
+      EMBED_CACHE_PREFIX = var.embed_cache_prefix
+    } : {},
+    var.vector_bucket != "" ? {
+      VECTOR_BUCKET = var.vector_bucket
+      VECTOR_PREFIX = var.vector_prefix
+      VECTOR_DTYPE  = var.vector_dtype
+    } : {},
+    var.vector_index_bucket != "" ? {
+      VECTOR_INDEX_BUCKET = var.vector_index_bucket
+      VECTOR_INDEX_PREFIX = var.vector_index_prefix
+    } : {},
+    var.env
+  )
 }
 
 ############################
@@ -110,6 +162,66 @@ resource "aws_iam_role_policy" "bedrock_invoke" {
   })
 }
 
+# S3: Embedding-Cache lesen/schreiben (nur Prefix)
+resource "aws_iam_role_policy" "embed_cache" {
+  count = var.embed_cache_bucket != "" ? 1 : 0
+  name  = "EmbeddingCacheS3"
+  role  = aws_iam_role.role.id
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Sid      = "AllowEmbeddingCache",
+      Effect   = "Allow",
+      Action   = ["s3:GetObject", "s3:PutObject"],
+      Resource = "arn:${data.aws_partition.current.partition}:s3:::${var.embed_cache_bucket}/${var.embed_cache_prefix}*"
+    }, {
+      Sid       = "AllowEmbeddingCacheList",           # sonst liefert GetObject bei Miss 403 statt 404
+      Effect    = "Allow",
+      Action    = ["s3:ListBucket"],
+      Resource  = "arn:${data.aws_partition.current.partition}:s3:::${var.embed_cache_bucket}",
+      Condition = { StringLike = { "s3:prefix" = ["${var.embed_cache_prefix}*"] } }
+    }]
+  })
+}
+
+# S3: Vektor-Claim-Checks schreiben (nur Prefix)
+resource "aws_iam_role_policy" "vector_store" {
+  count = var.vector_bucket != "" ? 1 : 0
+  name  = "EmbeddingVectorsS3"
+  role  = aws_iam_role.role.id
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Sid      = "AllowVectorClaimCheck",
+      Effect   = "Allow",
+      Action   = ["s3:GetObject", "s3:PutObject"],
+      Resource = "arn:${data.aws_partition.current.partition}:s3:::${var.vector_bucket}/${var.vector_prefix}*"
+    }]
+  })
+}
+
+# S3: Vektor-Index lesen/schreiben/aufräumen (nur Prefix)
+resource "aws_iam_role_policy" "vector_index" {
+  count = var.vector_index_bucket != "" ? 1 : 0
+  name  = "EmbeddingIndexS3"
+  role  = aws_iam_role.role.id
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Sid      = "AllowVectorIndex",
+      Effect   = "Allow",
+      Action   = ["s3:GetObject", "s3:PutObject", "s3:DeleteObject"],
+      Resource = "arn:${data.aws_partition.current.partition}:s3:::${var.vector_index_bucket}/${var.vector_index_prefix}*"
+    }, {
+      Sid       = "AllowVectorIndexList",
+      Effect    = "Allow",
+      Action    = ["s3:ListBucket"],
+      Resource  = "arn:${data.aws_partition.current.partition}:s3:::${var.vector_index_bucket}",
+      Condition = { StringLike = { "s3:prefix" = ["${var.vector_index_prefix}*"] } }
+    }]
+  })
+}
+
 ############################
 # CloudWatch LogGroup
 ############################
@@ -150,6 +262,8 @@ resource "aws_lambda_function" "fn" {
   memory_size = var.memory_size
   timeout     = var.timeout
 
+  layers = var.layers
+
   ephemeral_storage { size = var.ephemeral_storage_size }
 
   dynamic "vpc_config" {
@@ -160,18 +274,166 @@ resource "aws_lambda_function" "fn" {
     }
   }
 
-  environment { variables = var.env }
+  environment { variables = local.env_final }
 
   depends_on = concat(
     [aws_cloudwatch_log_group.lg, aws_iam_role_policy_attachment.basic_exec, aws_iam_role_policy.bedrock_invoke],
-    var.attach_vpc_access ? [aws_iam_role_policy_attachment.vpc_access] : []
+    var.attach_vpc_access ? [aws_iam_role_policy_attachment.vpc_access] : [],
+    aws_iam_role_policy.embed_cache,
+    aws_iam_role_policy.vector_store,
+    aws_iam_role_policy.vector_index
   )
 
   tags = var.tags
 }
 
+############################
+# Index-Flush (EventBridge Schedule)
+############################
+resource "aws_cloudwatch_event_rule" "index_flush" {
+  count               = var.vector_index_bucket != "" && var.index_flush_schedule != "" ? 1 : 0
+  name                = "${var.function_name}-index-flush"
+  description         = "Hängt wartende Embeddings als Segmente an den Vektor-Index an"
+  schedule_expression = var.index_flush_schedule
+  tags                = var.tags
+}
+
+resource "aws_cloudwatch_event_target" "index_flush" {
+  count = var.vector_index_bucket != "" && var.index_flush_schedule != "" ? 1 : 0
+  rule  = aws_cloudwatch_event_rule.index_flush[0].name
+  arn   = aws_lambda_function.fn.arn
+  input = jsonencode({ action = "index_flush" })
+}
+
+resource "aws_lambda_permission" "index_flush" {
+  count         = var.vector_index_bucket != "" && var.index_flush_schedule != "" ? 1 : 0
+  statement_id  = "AllowEventBridgeIndexFlush"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.fn.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.index_flush[0].arn
+}
+
+############################
+# Index-Wartung (eigene Funktion + EventBridge Schedule)
+############################
+locals {
+  index_train_enabled = var.vector_index_bucket != "" && var.index_train_schedule != ""
+}
+
+resource "aws_cloudwatch_log_group" "index_train" {
+  count             = local.index_train_enabled ? 1 : 0
+  name              = "/aws/lambda/${var.function_name}-index-train"
+  retention_in_days = var.log_retention_days
+  tags              = var.tags
+}
+
+resource "aws_lambda_function" "index_train" {
+  count         = local.index_train_enabled ? 1 : 0
+  function_name = "${var.function_name}-index-train"
+  role          = aws_iam_role.role.arn
+  runtime       = var.runtime
+  handler       = var.handler
+
+  filename         = local.code_filename
+  source_code_hash = local.code_source_hash
+
+  description = "${var.description} (Vektor-Index: Merge, IVF-Training, GC)"
+  memory_size = var.index_train_memory_size
+  timeout     = var.index_train_timeout
+
+  layers = var.layers
+
+  ephemeral_storage { size = var.index_train_ephemeral_storage_size }
+
+  dynamic "vpc_config" {
+    for_each = var.attach_vpc_access && length(var.subnet_ids) > 0 && length(var.security_group_ids) > 0 ? [1] : []
+    content {
+      subnet_ids         = var.subnet_ids
+      security_group_ids = var.security_group_ids
+    }
+  }
+
+  # Rest-Budget knapp unter dem Timeout, damit kein Tenant mitten im Training abbricht
+  environment { variables = merge(local.env_final, { INDEX_FLUSH_MIN_REMAINING_MS = "120000" }) }
+
+  depends_on = [aws_cloudwatch_log_group.index_train, aws_iam_role_policy.vector_index]
+
+  tags = var.tags
+}
+
+############################
+# Index-Suche (eigene Funktion, Aufruf direkt per Invoke mit action=search)
+############################
+resource "aws_cloudwatch_log_group" "index_search" {
+  count             = var.vector_index_bucket != "" ? 1 : 0
+  name              = "/aws/lambda/${var.function_name}-index-search"
+  retention_in_days = var.log_retention_days
+  tags              = var.tags
+}
+
+resource "aws_lambda_function" "index_search" {
+  count         = var.vector_index_bucket != "" ? 1 : 0
+  function_name = "${var.function_name}-index-search"
+  role          = aws_iam_role.role.arn
+  runtime       = var.runtime
+  handler       = var.handler
+
+  filename         = local.code_filename
+  source_code_hash = local.code_source_hash
+
+  description = "${var.description} (Vektor-Index: Suche)"
+  memory_size = var.index_search_memory_size
+  timeout     = var.index_search_timeout
+
+  layers = var.layers
+
+  ephemeral_storage { size = var.index_search_ephemeral_storage_size }
+
+  dynamic "vpc_config" {
+    for_each = var.attach_vpc_access && length(var.subnet_ids) > 0 && length(var.security_group_ids) > 0 ? [1] : []
+    content {
+      subnet_ids         = var.subnet_ids
+      security_group_ids = var.security_group_ids
+    }
+  }
+
+  environment { variables = local.env_final }
+
+  depends_on = [aws_cloudwatch_log_group.index_search, aws_iam_role_policy.vector_index]
+
+  tags = var.tags
+}
+
+resource "aws_cloudwatch_event_rule" "index_train" {
+  count               = local.index_train_enabled ? 1 : 0
+  name                = "${var.function_name}-index-train"
+  description         = "Mergt Segmente, trainiert IVF und räumt unreferenzierte Indexdateien auf"
+  schedule_expression = var.index_train_schedule
+  tags                = var.tags
+}
+
+resource "aws_cloudwatch_event_target" "index_train" {
+  count = local.index_train_enabled ? 1 : 0
+  rule  = aws_cloudwatch_event_rule.index_train[0].name
+  arn   = aws_lambda_function.index_train[0].arn
+  input = jsonencode({ action = "index_train" })
+}
+
+resource "aws_lambda_permission" "index_train" {
+  count         = local.index_train_enabled ? 1 : 0
+  statement_id  = "AllowEventBridgeIndexTrain"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.index_train[0].function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.index_train[0].arn
+}
+
 ############################
 # Outputs
 ############################
 output "lambda_function_arn" { value = aws_lambda_function.fn.arn }
 output "lambda_role_arn"     { value = aws_iam_role.role.arn }
+output "index_search_function_arn" {
+  value = var.vector_index_bucket != "" ? aws_lambda_function.index_search[0].arn : ""
+}
@@ -30,6 +30,13 @@ variable "api_gateway_ids"   { type = list(string), default = [] } # z.B. ["tp6t
 variable "api_resource_path" { type = string,       default = "s3-storage" }
 variable "api_methods"       { type = list(string), default = ["GET","PUT","DELETE"] }
 
+# Index-Compactor (EventBridge-Schedule, leer = aus), z.B. "rate(5 minutes)"
+variable "index_compaction_schedule" { type = string, default = "" }
+
+# S3-Rechte für Segment-Index/Compactor/Key-Migration (List + Delete unter tenants/),
+# leer = keine Inline-Policy (Rolle muss die Rechte dann selbst haben)
+variable "index_bucket" { type = string, default = "" }
+
 # --- Providers/Env ---
 data "aws_caller_identity" "current" {}
 data "aws_region"          "current" {}
@@ -61,6 +68,29 @@ data "aws_iam_role" "existing" {
   name = var.existing_role_name
 }
 
+# Segment-Index: Compactor listet/löscht Segmente, Leser listen offene Segmente,
+# migrate_keys kopiert/löscht PDFs. Die Konsolen-Rolle hat nur Get/Put.
+resource "aws_iam_role_policy" "ki_index" {
+  count = var.index_bucket != "" ? 1 : 0
+  name  = "KiResultsIndexS3"
+  role  = data.aws_iam_role.existing.name
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Sid      = "AllowKiIndexObjects",
+      Effect   = "Allow",
+      Action   = ["s3:GetObject", "s3:PutObject", "s3:DeleteObject"],
+      Resource = "arn:${data.aws_partition.current.partition}:s3:::${var.index_bucket}/tenants/*"
+    }, {
+      Sid       = "AllowKiIndexList",
+      Effect    = "Allow",
+      Action    = ["s3:ListBucket"],
+      Resource  = "arn:${data.aws_partition.current.partition}:s3:::${var.index_bucket}",
+      Condition = { StringLike = { "s3:prefix" = ["tenants/", "tenants/*"] } }
+    }]
+  })
+}
+
 ############################
 # Code-Paket
 ############################
@@ -137,6 +167,33 @@ resource "aws_lambda_permission" "apigw_invoke" {
   source_arn   = "arn:${data.aws_partition.current.partition}:execute-api:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:${each.value.api}/*/${each.value.method}/${var.api_resource_path}"
 }
 
+############################
+# Schedule: KI_Results-Index kompaktieren
+############################
+resource "aws_cloudwatch_event_rule" "index_compaction" {
+  count               = var.index_compaction_schedule != "" ? 1 : 0
+  name                = "${var.function_name}-index-compaction"
+  description         = "Mischt KI_Results-Indexsegmente in files.json/index.json"
+  schedule_expression = var.index_compaction_schedule
+  tags                = var.tags
+}
+
+resource "aws_cloudwatch_event_target" "index_compaction" {
+  count = var.index_compaction_schedule != "" ? 1 : 0
+  rule  = aws_cloudwatch_event_rule.index_compaction[0].name
+  arn   = aws_lambda_function.fn.arn
+  input = jsonencode({ action = "compact_index" })
+}
+
+resource "aws_lambda_permission" "index_compaction" {
+  count         = var.index_compaction_schedule != "" ? 1 : 0
+  statement_id  = "AllowEventBridgeIndexCompaction"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.fn.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.index_compaction[0].arn
+}
+
 ############################
 # Outputs
 ############################
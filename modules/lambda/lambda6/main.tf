@@ -42,6 +42,8 @@ variable "attach_vpc_access"  { type = bool, default = true }
 variable "kms_key_alias"        { type = string, default = "alias/kms-tenant-master-key" }
 variable "layer_arns"           { type = list(string), default = [] }   # z. B. ["arn:...:layer:pymysql-layer:4"]
 variable "s3_read_bucket_names" { type = list(string), default = ["miraedrive-assets"] }
+variable "s3_write_bucket_names" { type = list(string), default = [] }  # z. B. Archiv-/Export-Uploads (PutObject)
+variable "s3_write_prefixes"    { type = list(string), default = ["tenants/*/archive/", "analytics/file_sync/"] }  # ARCHIVE_PREFIX_TEMPLATE / EXPORT_TARGET
 variable "add_elbv2_describe"   { type = bool, default = true }
 
 # Invoke permissions
@@ -77,6 +79,10 @@ locals {
   role_name      = var.role_name_suffix
   kms_key_arn    = data.aws_kms_alias.env_key.target_key_arn
   s3_object_arns = [for b in var.s3_read_bucket_names : "arn:${data.aws_partition.current.partition}:s3:::${b}/*"]
+  # nur unter den Archiv-/Export-Prefixen schreiben: der Bucket enthält auch Roh-Mails und PDFs
+  s3_write_arns  = flatten([for b in var.s3_write_bucket_names : [
+    for p in var.s3_write_prefixes : "arn:${data.aws_partition.current.partition}:s3:::${b}/${p}*"
+  ]])
 }
 
 ############################
@@ -139,6 +145,28 @@ resource "aws_iam_role_policy" "s3_read" {
   })
 }
 
+resource "aws_iam_role_policy" "s3_write" {
+  count = length(local.s3_write_arns) > 0 ? 1 : 0
+  name  = "S3WriteObjects"
+  role  = aws_iam_role.role.id
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Effect   = "Allow",
+      # GetObject: Export-Checkpoint (_checkpoint.json) liegt unter dem Export-Prefix
+      Action   = ["s3:PutObject", "s3:GetObject", "s3:AbortMultipartUpload"],
+      Resource = local.s3_write_arns
+    }, {
+      # ohne ListBucket liefert GetObject auf fehlende Keys 403 statt 404 (Export-Checkpoint;
+      # der Handler wertet 403 dort ebenfalls als "kein Checkpoint")
+      Effect    = "Allow",
+      Action    = ["s3:ListBucket"],
+      Resource  = [for b in var.s3_write_bucket_names : "arn:${data.aws_partition.current.partition}:s3:::${b}"]
+      Condition = { StringLike = { "s3:prefix" = [for p in var.s3_write_prefixes : "${p}*"] } }
+    }]
+  })
+}
+
 resource "aws_iam_role_policy" "elbv2_describe" {
   count = var.add_elbv2_describe ? 1 : 0
   name  = "ELBv2Describe"
@@ -211,6 +239,7 @@ resource "aws_lambda_function" "fn" {
     [aws_cloudwatch_log_group.lg, aws_iam_role_policy_attachment.basic_exec, aws_iam_role_policy.kms_access],
     var.attach_vpc_access ? [aws_iam_role_policy_attachment.vpc_access] : [],
     length(local.s3_object_arns) == 0 ? [] : [aws_iam_role_policy.s3_read],
+    length(local.s3_write_arns) == 0 ? [] : [aws_iam_role_policy.s3_write],
     var.add_elbv2_describe ? [aws_iam_role_policy.elbv2_describe] : []
   )
 
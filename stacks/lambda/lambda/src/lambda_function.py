@@ -1,4 +1,4 @@
-import os, json, boto3, email
+import os, json, boto3, email, hashlib
 from email.utils import getaddresses
 from urllib.parse import unquote_plus
 
@@ -6,6 +6,7 @@ s3 = boto3.client('s3')
 sf = boto3.client('stepfunctions')
 
 SM_ARN = os.environ['STATE_MACHINE_ARN']
+KEY_SHARD_CHARS = int(os.environ.get('KEY_SHARD_CHARS', '0'))  # Default, falls routing nichts vorgibt
 
 def _first_recipient(msg) -> str | None:
     # zieh To/Delivered-To/X-Original-To; nimm erste Adresse ohne Namen
@@ -23,25 +24,37 @@ def _start_sfn(bucket: str, key: str, recipient: str):
     resp = sf.start_execution(stateMachineArn=SM_ARN, input=json.dumps(inp))
     print(f"[SFN] gestartet: {resp['executionArn']}")
 
-def _move_email(bucket: str, key: str, tenant_id: str, routing: dict | None):
+def _physical_key(logical_key: str, tenant_id: str, shard_chars: int) -> str:
+    # tenants/<id>/emails/x.eml -> tenants/<id>/<shard>/emails/x.eml, shard = sha256(logischer Key)
+    # (gleiches Schema wie Lambda3 _physical_key; Tenant-Prefix bleibt vorne)
+    parts = logical_key.split('/')
+    if shard_chars <= 0 or tenant_id not in parts[:-1]:
+        return logical_key
+    i = parts.index(tenant_id) + 1
+    shard = hashlib.sha256(logical_key.encode('utf-8')).hexdigest()[:shard_chars]
+    return '/'.join(parts[:i] + [shard] + parts[i:])
+
+def _move_email(bucket: str, key: str, tenant_id: str, routing: dict | None) -> str:
     routing = routing or {}
     # bevorzugt Prefix aus Lambda6, sonst Standard
     prefix = routing.get('s3_prefix') or f"{tenant_id}/emails/"
     # Dateiname aus Quell-Key extrahieren (egal, ob der in emails/ lag)
     filename = key.split('/')[-1]
-    new_key = f"{prefix}{filename}"
+    shard_chars = int(routing.get('s3_shard_chars', KEY_SHARD_CHARS) or 0)
+    new_key = _physical_key(f"{prefix}{filename}", tenant_id, shard_chars)
 
     # idempotent: wenn Ziel existiert, nichts tun
     try:
         s3.head_object(Bucket=bucket, Key=new_key)
         print(f"[MOVE] Ziel existiert schon: s3://{bucket}/{new_key}")
-        return
+        return new_key
     except s3.exceptions.ClientError:
         pass
 
     s3.copy_object(Bucket=bucket, CopySource={'Bucket': bucket, 'Key': key}, Key=new_key)
     s3.delete_object(Bucket=bucket, Key=key)
     print(f"[MOVE] Verschoben: s3://{bucket}/{new_key}")
+    return new_key
 
 def lambda_handler(event, context):
     print("Eingehendes Event:", json.dumps(event))
@@ -61,12 +74,12 @@ def lambda_handler(event, context):
         if not bucket or not key or not tenant_id:
             print("[move] fehlende Felder"); return
 
-        _move_email(bucket, key, tenant_id, routing)
+        new_key = _move_email(bucket, key, tenant_id, routing)
 
         return{
                 "status": "moved",
                 "tenant_id": tenant_id,
-                "new_key": f"{routing.get('s3_prefix', tenant_id + '/emails/')}{key.split('/')[-1]}"
+                "new_key": new_key
             }
 
 
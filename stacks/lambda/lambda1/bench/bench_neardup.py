@@ -0,0 +1,81 @@
+"""
+Lokaler Benchmark: CPU-Zeit und Genauigkeit der MinHash-Signatur (_shingles + _minhash) je
+Textlänge, ohne Kappung (NEARDUP_MAX_SHINGLES=0) vs. mit Stichprobe.
+
+  python stacks/lambda/lambda1/bench/bench_neardup.py
+
+Lambda teilt CPU proportional zum Speicher zu (1769 MB = 1 vCPU). Die Spalte "@<MB>" rechnet
+die lokale Zeit auf BENCH_MEMORY_MB hoch (Default 128 = Stack-Default von lambda1, Timeout 3 s);
+das ist eine Schätzung, kein Lauf in Lambda. Genauigkeit: Paare mit BENCH_EDIT Anteil
+ersetzter Wörter, geschätzte Ähnlichkeit (Signatur) gegen exakte Jaccard-Ähnlichkeit der
+vollständigen Shingle-Mengen.
+"""
+import os, sys, time, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import lambda_function as L
+
+MEMORY_MB = int(os.environ.get("BENCH_MEMORY_MB", "128"))
+CAPS = [int(x) for x in os.environ.get("BENCH_CAPS", "0,256,1024").split(",")]
+LENGTHS = [int(x) for x in os.environ.get("BENCH_CHARS", "2000,20000,60000").split(",")]
+EDITS = [float(x) for x in os.environ.get("BENCH_EDIT", "0.01,0.03,0.1").split(",")]
+PAIRS = int(os.environ.get("BENCH_PAIRS", "20"))
+
+rng = random.Random(7)
+VOCAB = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyzäöü") for _ in range(rng.randint(2, 10)))
+         for _ in range(5000)]
+
+def _text(chars: int) -> list:
+    words, n = [], 0
+    while n < chars:
+        w = rng.choice(VOCAB)
+        words.append(w)
+        n += len(w) + 1
+    return words
+
+def _edit(words: list, frac: float) -> list:
+    out = list(words)
+    for i in rng.sample(range(len(out)), max(1, int(len(out) * frac))):
+        out[i] = rng.choice(VOCAB)
+    return out
+
+def _sig(text: str):
+    return L._minhash(L._shingles(text))
+
+def _best_of(fn, n=3) -> float:
+    best = float("inf")
+    for _ in range(n):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def main():
+    scale = 1769 / MEMORY_MB
+    print(f"perms={L.NEARDUP_PERMS} shingle={L.NEARDUP_SHINGLE} threshold={L.NEARDUP_THRESHOLD} "
+          f"memory={MEMORY_MB} MB (x{scale:.1f} CPU-Zeit)")
+    for chars in LENGTHS:
+        base = _text(chars)
+        text = " ".join(base)
+        print(f"chars={len(text):6d} shingles={len(L._shingles(text)):6d}")
+        for cap in CAPS:
+            L.NEARDUP_MAX_SHINGLES = cap
+            dt = _best_of(lambda: _sig(text))
+            errs = []
+            for frac in EDITS:
+                diffs = []
+                for _ in range(PAIRS):
+                    other = " ".join(_edit(base, frac))
+                    a, b = L._shingles(text), L._shingles(other)
+                    exact = len(a & b) / len(a | b)
+                    sa, sb = L._minhash(a), L._minhash(b)
+                    est = sum(1 for x, y in zip(sa, sb) if x == y) / len(sa)
+                    diffs.append((exact, est - exact))
+                ex = sum(e for e, _ in diffs) / len(diffs)
+                mae = sum(abs(d) for _, d in diffs) / len(diffs)
+                errs.append(f"edit {frac:.2f}: J={ex:.3f} |err|={mae:.3f}")
+            print(f"  cap={cap or 'aus':>5}  local={dt * 1000:7.1f} ms  @{MEMORY_MB}MB~{dt * scale * 1000:7.0f} ms  "
+                  + "  ".join(errs))
+
+if __name__ == "__main__":
+    main()
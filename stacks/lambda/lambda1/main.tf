@@ -21,6 +21,10 @@ module "lambda1" {
   env              = var.env
   tags             = var.tags
   role_name_suffix = var.role_name_suffix
+
+  # Near-Duplicate-Erkennung (optional)
+  neardup_bucket = var.neardup_bucket
+  neardup_prefix = var.neardup_prefix
 }
 
 output "lambda_function_arn" { value = module.lambda1.lambda_function_arn }
@@ -1,8 +1,18 @@
 # lambda_function.py
 import os
+import sys
 import json
 import re
+import struct
+import random
+import base64
+import hashlib
+import heapq
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Tuple
+import boto3
+from botocore.exceptions import ClientError
 
 # ----------------------------
 # Konfiguration über Env-Vars
@@ -16,6 +26,25 @@ REQ_META_FIELDS    = [f.strip() for f in os.getenv("REQUIRE_META_FIELDS", "subje
 
 # robust gegen leere/fehlende Werte
 MAX_TEXT_LEN = int(os.getenv("MAX_TEXT_LEN", "20000") or "20000")  # harte Kappung, Schutz gegen Jumbo-Events
+# Embedding-Text separat: Lambda2 chunkt lange Texte selbst; Grenze nur wegen 256 KB Step-Functions-Payload
+MAX_EMBED_TEXT_LEN = int(os.getenv("MAX_EMBED_TEXT_LEN", "60000") or "60000")
+# Zeichen-Grenzen reichen nicht (Umlaute/Escapes, Attachments, Entities): Ergebnis wird gemessen
+# und notfalls gekürzt (_fit_payload). Luft zu 262144 für den Step-Functions-State drumherum.
+MAX_PAYLOAD_BYTES = int(os.getenv("MAX_PAYLOAD_BYTES", "240000") or "240000")
+
+# Near-Duplicate-Erkennung (siehe _near_duplicate); leerer Bucket = aus
+NEARDUP_BUCKET       = os.getenv("NEARDUP_BUCKET", "")
+NEARDUP_PREFIX       = os.getenv("NEARDUP_PREFIX", "neardup/")
+NEARDUP_THRESHOLD    = float(os.getenv("NEARDUP_THRESHOLD", "0.85"))    # geschätzte Jaccard-Ähnlichkeit
+NEARDUP_SHINGLE      = int(os.getenv("NEARDUP_SHINGLE", "5"))           # Wörter pro Shingle
+NEARDUP_PERMS        = int(os.getenv("NEARDUP_PERMS", "128"))           # MinHash-Signaturlänge
+NEARDUP_BANDS        = int(os.getenv("NEARDUP_BANDS", "0"))             # 0 = aus Threshold ableiten
+NEARDUP_BUCKET_MAX   = int(os.getenv("NEARDUP_BUCKET_MAX", "50"))       # Einträge pro LSH-Bucket
+NEARDUP_MIN_SHINGLES = int(os.getenv("NEARDUP_MIN_SHINGLES", "8"))      # kürzere Texte nicht prüfen
+NEARDUP_MAX_SHINGLES = int(os.getenv("NEARDUP_MAX_SHINGLES", "256"))    # Stichprobe für lange Texte (CPU bei 128 MB)
+NEARDUP_MASK_DIGITS  = os.getenv("NEARDUP_MASK_DIGITS", "1") == "1"
+
+s3 = boto3.client("s3") if NEARDUP_BUCKET else None
 
 # ----------------------------
 # Hilfsfunktionen
@@ -87,18 +116,196 @@ def _pick_text_for_embedding(meta: Dict[str, Any], brx: Dict[str, Any]) -> str:
     1) Bedrock summary
     2) meta.text (falls vorhanden)
     3) meta.subject + from + to (fallback)
+    Gekappt auf MAX_EMBED_TEXT_LEN (nicht MAX_TEXT_LEN), damit lange Threads ihren Schluss behalten.
     """
     if brx.get("summary"):
-        return brx["summary"][:MAX_TEXT_LEN]
+        return brx["summary"][:MAX_EMBED_TEXT_LEN]
 
     if isinstance(meta.get("text"), str) and meta["text"].strip():
-        return meta["text"][:MAX_TEXT_LEN]
+        return meta["text"][:MAX_EMBED_TEXT_LEN]
 
     subj = (meta.get("subject") or "").strip()
     frm  = (meta.get("from") or "").strip()
     to   = (meta.get("to") or "").strip()
     base = " | ".join([p for p in [subj, frm, to] if p])
-    return base[:MAX_TEXT_LEN] if base else ""
+    return base[:MAX_EMBED_TEXT_LEN] if base else ""
+
+def _json_size(v: Any) -> int:
+    # wie die Lambda-Runtime serialisiert (ensure_ascii): \uXXXX zählt 6 Bytes -> obere Schranke
+    return len(json.dumps(v))
+
+def _cut_to(s: str, max_bytes: int) -> str:
+    """Längstes Präfix von s, dessen JSON-Literal höchstens max_bytes groß ist."""
+    lo, hi = 0, len(s)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _json_size(s[:mid]) <= max_bytes:
+            lo = mid
+        else:
+            hi = mid - 1
+    return s[:lo]
+
+def _fit_payload(result: Dict[str, Any], reserve: int = 512) -> List[str]:
+    """
+    Kürzt das Ergebnis, bis es serialisiert unter MAX_PAYLOAD_BYTES - reserve liegt (reserve:
+    Platz für die Warnung danach). Immer das größte der Textfelder (Embedding-Text, meta.text,
+    Summary) höchstens halbieren, Anfang bleibt erhalten. Unter 8 KB je Text werden zuerst
+    Attachments/Entities entfernt, erst danach die Texte weiter gekürzt.
+    Gibt die gekürzten Felder zurück.
+    """
+    over = _json_size(result) - (MAX_PAYLOAD_BYTES - reserve)
+    cut: List[str] = []
+    texts = ((result["normalized"], "text_for_embedding", "normalized.text_for_embedding"),
+             (result["meta"], "text", "meta.text"),
+             (result["analysis"]["bedrock"], "summary", "analysis.bedrock.summary"))
+
+    def shrink_texts(floor: int) -> None:
+        nonlocal over
+        while over > 0:
+            cands = [(_json_size(p[k]), i) for i, (p, k, _) in enumerate(texts) if isinstance(p.get(k), str)]
+            size, i = max(cands, default=(0, -1))
+            if size <= floor:
+                return
+            parent, key, name = texts[i]
+            parent[key] = _cut_to(parent[key], max(size - over, size // 2, floor))
+            over -= size - _json_size(parent[key])
+            if name not in cut:
+                cut.append(name)
+
+    shrink_texts(8192)
+    for parent, key, name in ((result["meta"], "attachments", "meta.attachments"),
+                              (result["analysis"]["bedrock"], "entities", "analysis.bedrock.entities")):
+        if over > 0 and parent.get(key):
+            over -= _json_size(parent[key]) - _json_size([])
+            parent[key] = []
+            cut.append(name)
+    shrink_texts(2)
+    return cut
+
+# ----------------------------
+# Near-Duplicate-Erkennung (MinHash + LSH pro Tenant)
+# ----------------------------
+# Text -> normalisierte Wort-Shingles -> MinHash-Signatur (NEARDUP_PERMS Werte). Die Signatur
+# wird in Bänder zerlegt; jedes Band ist ein S3-Objekt
+#   NEARDUP_PREFIX/<tenant>/lsh/<band>/<bandhash>.json  {"items": [{"id", "sig", "receivedAt"}, ...]}
+# Kandidaten = alle Einträge in den eigenen Band-Buckets; Treffer, wenn die geschätzte
+# Jaccard-Ähnlichkeit >= NEARDUP_THRESHOLD. Nur Originale werden eingetragen.
+_MH_PRIME = (1 << 61) - 1
+_mh_rng = random.Random(0x5EED)   # fester Seed: Signaturen müssen über Deployments vergleichbar bleiben
+_MH_PARAMS = [(_mh_rng.randrange(1, _MH_PRIME), _mh_rng.randrange(0, _MH_PRIME)) for _ in range(NEARDUP_PERMS)]
+_WORD_RE = re.compile(r"\w+")
+_DIGITS_RE = re.compile(r"\d+")
+
+def _lsh_shape(perms: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows): größtes rows, dessen LSH-Schwelle (1/b)^(1/r) noch klar unter threshold liegt."""
+    if NEARDUP_BANDS > 0:
+        return NEARDUP_BANDS, perms // NEARDUP_BANDS
+    best = (perms, 1)
+    for rows in range(1, perms + 1):
+        if perms % rows:
+            continue
+        bands = perms // rows
+        if (1.0 / bands) ** (1.0 / rows) <= threshold * 0.9:   # Puffer für Recall, Verifikation folgt
+            best = (bands, rows)
+    return best
+
+_LSH_BANDS, _LSH_ROWS = _lsh_shape(NEARDUP_PERMS, NEARDUP_THRESHOLD)
+
+def _shingles(text: str) -> set:
+    t = text.lower()
+    if NEARDUP_MASK_DIGITS:
+        t = _DIGITS_RE.sub("0", t)   # Beträge/Daten/Nummern unterscheiden Benachrichtigungen kaum
+    words = _WORD_RE.findall(t)
+    k = NEARDUP_SHINGLE
+    return {" ".join(words[i:i + k]) for i in range(max(0, len(words) - k + 1))}
+
+def _minhash(shingles: set) -> List[int]:
+    xs = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles]
+    # Kosten ~ NEARDUP_PERMS x Shingles. Lange Texte: nur die NEARDUP_MAX_SHINGLES kleinsten Hashes
+    # (Bottom-k-Stichprobe mit demselben Hash für alle Dokumente -> ähnliche Texte behalten
+    # weitgehend dieselben Shingles, die Jaccard-Schätzung bleibt brauchbar)
+    if 0 < NEARDUP_MAX_SHINGLES < len(xs):
+        xs = heapq.nsmallest(NEARDUP_MAX_SHINGLES, xs)
+    # 32 Bit reichen für die Gleichheitsvergleiche und halbieren die gespeicherte Größe
+    return [min((a * x + b) % _MH_PRIME for x in xs) & 0xFFFFFFFF for a, b in _MH_PARAMS]
+
+def _sig_encode(sig: List[int]) -> str:
+    arr = array("I", sig)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return base64.b64encode(arr.tobytes()).decode("ascii")
+
+def _sig_decode(s: str) -> List[int]:
+    arr = array("I")
+    arr.frombytes(base64.b64decode(s))
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tolist()
+
+def _band_key(tenant: str, band: int, sig: List[int]) -> str:
+    rows = sig[band * _LSH_ROWS:(band + 1) * _LSH_ROWS]
+    h = hashlib.sha1(struct.pack(f"<{len(rows)}I", *rows)).hexdigest()[:20]
+    return f"{NEARDUP_PREFIX}{tenant}/lsh/{band:03d}/{h}.json"
+
+def _band_get(key: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    try:
+        obj = s3.get_object(Bucket=NEARDUP_BUCKET, Key=key)
+        return json.loads(obj["Body"].read()).get("items") or [], obj.get("ETag")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return [], None
+        raise
+
+def _band_add(key: str, entry: Dict[str, Any]) -> bool:
+    """Eintrag vorne anfügen (neueste zuerst, max. NEARDUP_BUCKET_MAX); Konflikt -> neu lesen.
+    False, wenn nach 3 Versuchen weiter Konflikte auftreten (Eintrag fehlt in diesem Band)."""
+    for _ in range(3):
+        items, etag = _band_get(key)
+        items = [entry] + [i for i in items if i.get("id") != entry["id"]][:NEARDUP_BUCKET_MAX - 1]
+        cond = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            s3.put_object(Bucket=NEARDUP_BUCKET, Key=key, Body=json.dumps({"items": items}).encode("utf-8"),
+                             ContentType="application/json", **cond)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise
+    print(f"[neardup] band update gave up after conflicts: {key}")
+    return False
+
+def _near_duplicate(tenant: str, doc_id: str, text: str,
+                    received_at: Optional[str]) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Sucht ein Near-Duplicate im Tenant; Original (kein Treffer) wird eingetragen.
+    Rückgabe: (Treffer oder None, False wenn der Eintrag nicht in allen Bändern gelandet ist).
+    """
+    sh = _shingles(text)
+    if len(sh) < NEARDUP_MIN_SHINGLES:
+        return None, True   # zu kurz für belastbare Jaccard-Werte
+    sig = _minhash(sh)
+    keys = [_band_key(tenant, b, sig) for b in range(_LSH_BANDS)]
+    with ThreadPoolExecutor(max_workers=min(16, len(keys))) as ex:
+        bands = list(ex.map(lambda k: _band_get(k)[0], keys))
+
+    best: Optional[Dict[str, Any]] = None
+    seen = set()
+    for items in bands:
+        for it in items:
+            cid = it.get("id")
+            if not cid or cid == doc_id or cid in seen:   # eigener Eintrag (Retry) zählt nicht
+                continue
+            seen.add(cid)
+            other = _sig_decode(it["sig"])
+            sim = sum(1 for x, y in zip(sig, other) if x == y) / len(sig)
+            if sim >= NEARDUP_THRESHOLD and (best is None or sim > best["similarity"]):
+                best = {"id": cid, "similarity": round(sim, 4), "receivedAt": it.get("receivedAt")}
+    if best:
+        return best, True
+
+    entry = {"id": doc_id, "sig": _sig_encode(sig), "receivedAt": received_at}
+    with ThreadPoolExecutor(max_workers=min(16, len(keys))) as ex:
+        added = list(ex.map(lambda k: _band_add(k, entry), keys))
+    return None, all(added)
 
 # ----------------------------
 # Lambda-Handler
@@ -143,6 +350,18 @@ def handler(event, context):
     # 4) Text für Embedding bestimmen
     text_for_embed = _pick_text_for_embedding(meta, brx)
 
+    # 4b) Near-Duplicate (optional): Downstream kann Embedding/PDF des Originals übernehmen
+    duplicate_of: Optional[Dict[str, Any]] = None
+    doc_id = str(s3info.get("key") or "") if isinstance(s3info, dict) else ""
+    if NEARDUP_BUCKET and tenant and doc_id and text_for_embed:
+        try:
+            duplicate_of, indexed = _near_duplicate(tenant, doc_id, text_for_embed, received_at)
+            if not indexed:
+                warnings.append("neardup_index_incomplete")   # spätere Duplikate evtl. nicht erkannt
+        except Exception as e:
+            print(f"[neardup] failed: {e}")
+            warnings.append("neardup_failed")
+
     # 5) Validierungsergebnis
     ok = len(errors) == 0
 
@@ -176,6 +395,7 @@ def handler(event, context):
         "normalized": {
             "text_for_embedding": text_for_embed
         },
+        "duplicate_of": duplicate_of,   # {id, similarity, receivedAt} des Originals oder None
         "errors": errors,
         "warnings": warnings,
         "_debug": {
@@ -183,6 +403,14 @@ def handler(event, context):
         }
     }
 
+    # 6) Payload-Grenze (Step Functions 256 KB) am serialisierten Ergebnis prüfen
+    truncated = _fit_payload(result)
+    if truncated:
+        warnings.append("payload_truncated:" + ",".join(truncated))
+        if _json_size(result) > MAX_PAYLOAD_BYTES:
+            errors.append("payload_too_large")
+            result["ok"] = result["validated"] = ok = False
+
     # Bei stricter Validierung Lauf abbrechen (Step Functions-Task schlägt fehl -> greift Retry/Fehlerpfad)
     if not ok and STRICT_VALIDATION:
         raise Exception("validation_failed: " + ";".join(errors))
@@ -30,6 +30,10 @@ variable "env" {
   }
 }
 
+# Near-Duplicate-Erkennung (leer = aus); Schwelle etc. über env (NEARDUP_THRESHOLD, ...)
+variable "neardup_bucket" { type = string, default = "" }
+variable "neardup_prefix" { type = string, default = "neardup/" }
+
 # Rolle (eindeutiger Name, replizierbar)
 variable "role_name_suffix" { type = string, default = "Lambda1-role" }
 
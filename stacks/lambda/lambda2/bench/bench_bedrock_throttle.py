@@ -0,0 +1,91 @@
+"""
+Lokaler Benchmark: Goodput der Bedrock-Drosselung (user-024) bei 10-facher Überlast.
+
+  python stacks/lambda/lambda2/bench/bench_bedrock_throttle.py
+
+Stub-Bedrock im Prozess (ersetzt den Modul-Client lambda_function.bedrock): höchstens
+BENCH_CAPACITY Requests pro gleitender Sekunde, darüber ThrottlingException; sonst
+BENCH_LATENCY_MS Antwortzeit. Last: BENCH_SECONDS lang je Sekunde 10 x BENCH_CAPACITY
+Einzel-Embeddings in eigenen Threads (wie parallele Events in einem Container).
+Verglichen werden: ohne Retry, nur adaptive Retries (Full Jitter), Retries + Token Bucket
+(BEDROCK_RPS = BENCH_LIMIT_FACTOR x Kapazität). Deadline je Request = BEDROCK_DEADLINE_MS.
+"""
+import os, io, sys, json, time, threading
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import lambda_function as L
+from botocore.exceptions import ClientError
+
+CAPACITY = int(os.environ.get("BENCH_CAPACITY", "20"))
+LATENCY_MS = int(os.environ.get("BENCH_LATENCY_MS", "20"))
+SECONDS = int(os.environ.get("BENCH_SECONDS", "3"))
+OVERLOAD = int(os.environ.get("BENCH_OVERLOAD", "10"))
+LIMIT_FACTOR = float(os.environ.get("BENCH_LIMIT_FACTOR", "0.9"))
+
+class _StubBedrock:
+    def __init__(self):
+        self.window: "deque[float]" = deque()
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def invoke_model(self, modelId, body, **kw):
+        with self.lock:
+            self.calls += 1
+            now = time.monotonic()
+            while self.window and now - self.window[0] > 1.0:
+                self.window.popleft()
+            if len(self.window) >= CAPACITY:
+                raise ClientError({"Error": {"Code": "ThrottlingException"}}, "InvokeModel")
+            self.window.append(now)
+        time.sleep(LATENCY_MS / 1000.0)
+        dim = json.loads(body).get("dimensions") or 8
+        return {"body": io.BytesIO(json.dumps({"embedding": [0.1] * dim, "inputTextTokenCount": 3}).encode())}
+
+def _run(name: str, retries: int, rps: float):
+    L.bedrock = stub = _StubBedrock()
+    L.BEDROCK_MAX_RETRIES = retries
+    L._RPS_BUCKET = L._TokenBucket(rps, max(1.0, rps)) if rps else None
+    L._BEDROCK_STATS.clear()
+    ok, fail, lat = [0], [0], []
+    lock = threading.Lock()
+
+    def client(i: int):
+        t0 = time.monotonic()
+        try:
+            L._embed(f"bench text {i}")
+            with lock:
+                ok[0] += 1
+                lat.append((time.monotonic() - t0) * 1000)
+        except Exception:
+            with lock:
+                fail[0] += 1
+
+    t_start, threads = time.monotonic(), []
+    for s in range(SECONDS):
+        for i in range(CAPACITY * OVERLOAD):
+            th = threading.Thread(target=client, args=(s * 100000 + i,))
+            th.start()
+            threads.append(th)
+        time.sleep(max(0.0, t_start + s + 1 - time.monotonic()))
+    for th in threads:
+        th.join()
+    elapsed = time.monotonic() - t_start
+    st = L._bedrock_stats()["models"].get(L.EMBED_MODEL, {})
+    lat.sort()
+    p50 = lat[len(lat) // 2] if lat else 0
+    p95 = lat[int(len(lat) * 0.95)] if lat else 0
+    print(f"{name:>22}: ok {ok[0]:>4}/{ok[0] + fail[0]}  goodput {ok[0] / elapsed:5.1f}/s  "
+          f"Bedrock-Calls {stub.calls:>5} (throttled {st.get('throttles', 0)})  "
+          f"lokal abgewiesen {st.get('rate_limited', 0)}  p50 {p50:6.0f} ms  p95 {p95:6.0f} ms")
+
+def main():
+    offered = CAPACITY * OVERLOAD * SECONDS
+    print(f"Kapazität {CAPACITY}/s, Last {CAPACITY * OVERLOAD}/s über {SECONDS}s ({offered} Requests), "
+          f"Deadline {L.BEDROCK_DEADLINE_MS} ms; Obergrenze goodput ~{CAPACITY}/s")
+    _run("ohne Retry", 0, 0)
+    _run("Retries (Full Jitter)", 6, 0)
+    _run(f"Retries + RPS {CAPACITY * LIMIT_FACTOR:g}", 6, CAPACITY * LIMIT_FACTOR)
+
+if __name__ == "__main__":
+    main()
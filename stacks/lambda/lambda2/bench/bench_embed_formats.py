@@ -0,0 +1,83 @@
+"""
+Lokaler Benchmark: Speichergröße, Suchlatenz und Recall@10 je Konfiguration
+EMBED_DIMENSIONS (256/512/1024) x VECTOR_DTYPE (float32/float16/int8).
+
+  python stacks/lambda/lambda2/bench/bench_embed_formats.py
+  BENCH_TEXTS=corpus.txt python stacks/lambda/lambda2/bench/bench_embed_formats.py   # echte Titan-v2-Embeddings
+
+Ohne BENCH_TEXTS: fester synthetischer Korpus (Gauß-Mischung, Seed fest) je Dimension;
+Recall@10 dann nur gegen float32 derselben Dimension (Verlust durch das Format).
+Mit BENCH_TEXTS (eine Zeile = ein Dokument, die ersten BENCH_QUERIES Zeilen sind die Anfragen)
+werden alle Texte je Dimension über _embed (Bedrock, kostet!) eingebettet; zusätzlich
+Recall@10 gegen 1024 x float32 (Verlust durch die reduzierte Dimension).
+Bytes = Claim-Check-Objekt aus _pack_claim inkl. 16 Byte Header. Latenz = Brute Force je
+Anfrage (float32) über die mit load_vector gelesene Matrix (int8 dequantisiert -> float32), 1 Thread, bestes von 3.
+"""
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import numpy as np
+import lambda_function as L
+
+DIMS = [int(x) for x in os.environ.get("BENCH_DIMS", "256,512,1024").split(",")]
+DTYPES = ("float32", "float16", "int8")
+N = int(os.environ.get("BENCH_N", "20000"))
+QUERIES = int(os.environ.get("BENCH_QUERIES", "200"))
+TEXTS = os.environ.get("BENCH_TEXTS", "")
+K = 10
+
+def _synthetic(dim: int):
+    rng = np.random.default_rng(22)
+    centers = L._normalize(rng.standard_normal((500, dim), dtype=np.float32))
+    pick = centers[rng.integers(0, len(centers), size=N + QUERIES)]
+    x = pick + rng.standard_normal((N + QUERIES, dim), dtype=np.float32) / np.sqrt(dim)
+    return x[QUERIES:], x[:QUERIES]
+
+def _bedrock(dim: int, texts):
+    L.EMBED_DIMENSIONS = dim
+    x = np.asarray([L._embed(t)["vector"] for t in texts], dtype=np.float32)
+    return x[QUERIES:], x[:QUERIES]
+
+def _topk_all(mat, queries, repeat: int = 3):
+    mat, queries = L._normalize(mat), L._normalize(queries)
+    best = None
+    for _ in range(repeat):
+        out, t0 = [], time.perf_counter()
+        for q in queries:
+            out.append(set(L._topk(mat @ q, K).tolist()))
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return out, best * 1000 / len(queries)
+
+def _recall(truth, got) -> float:
+    return sum(len(t & g) for t, g in zip(truth, got)) / (K * len(truth))
+
+def main():
+    texts = None
+    if TEXTS:
+        with open(TEXTS, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()][:N + QUERIES]
+    full_truth = None
+    if texts and 1024 in DIMS:
+        full_truth, _ = _topk_all(*_bedrock(1024, texts))
+
+    print(f"korpus={'bedrock:' + TEXTS if texts else 'synthetisch'} n={N} queries={QUERIES}")
+    print(f"{'dim':>5} {'dtype':>8} {'B/Vektor':>9} {'MB/1M':>7} {'ms/query':>9} {'recall@10':>10}"
+          + ("  vs-1024" if full_truth else ""))
+    for dim in DIMS:
+        docs, queries = _bedrock(dim, texts) if texts else _synthetic(dim)
+        truth = None
+        for dtype in DTYPES:
+            blobs = [L._pack_claim(v.tolist(), dtype) for v in docs]
+            mat = np.stack([L.load_vector(b) for b in blobs]).astype(np.float32)
+            got, ms = _topk_all(mat, queries)     # Anfragen bleiben float32 (frisch vom Modell)
+            truth = truth or got                     # float32 zuerst -> Referenz dieser Dimension
+            size = len(blobs[0])
+            line = (f"{dim:>5} {dtype:>8} {size:>9} {size * 1e6 / 2**20:>7.0f} {ms:>9.3f} "
+                    f"{_recall(truth, got):>10.3f}")
+            if full_truth:
+                line += f"  {_recall(full_truth, got):7.3f}"
+            print(line)
+
+if __name__ == "__main__":
+    main()
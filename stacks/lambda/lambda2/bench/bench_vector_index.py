@@ -0,0 +1,136 @@
+"""
+Lokaler Benchmark: Vektorindex (user-021) – Recall@k und Queries/s für Brute Force vs. IVF
+bei 10k, 100k und 1M Vektoren.
+
+  python stacks/lambda/lambda2/bench/bench_vector_index.py
+  BENCH_SIZES=10000,100000 BENCH_DIM=256 python stacks/lambda/lambda2/bench/bench_vector_index.py
+
+Läuft über die Handler-Funktionen (_write_segment/_vi_commit, _index_train, _index_search) gegen
+einen In-Memory-S3-Client; Segmentdateien landen wie in Lambda unter VECTOR_INDEX_DIR.
+Korpus: Gauß-Mischung (BENCH_CLUSTERS Zentren + Rauschen) statt Gleichverteilung, weil echte
+Embeddings geclustert sind und IVF auf gleichverteilten Daten nichts aussagt. Grundwahrheit ist
+die Brute-Force-Suche vor dem Training (exakt). QPS inkl. Manifest-Read und Id-Auflösung, 1 Thread,
+Prozess-Cache wie in der index-search-Funktion dimensioniert (_vi_mem_limit bei BENCH_MEMORY_MB,
+Default 2048 = Modul-Default); BENCH_MEM_ROWS setzt INDEX_MEM_CACHE_ROWS direkt.
+Speicher: ca. 2 x rows x dim x 4 Bytes (S3-Kopie + lokale Datei), 1M x 256 -> ~2 GB.
+"""
+import os, io, sys, time, json, shutil, tempfile
+from datetime import datetime, timezone
+
+BENCH_DIR = tempfile.mkdtemp(prefix="vindex-bench-")
+os.environ["VECTOR_INDEX_BUCKET"] = "bench-bucket"
+os.environ["VECTOR_INDEX_DIR"] = os.path.join(BENCH_DIR, "vindex")
+os.environ["AWS_LAMBDA_FUNCTION_MEMORY_SIZE"] = os.environ.get("BENCH_MEMORY_MB", "2048")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import numpy as np
+import lambda_function as L
+from botocore.exceptions import ClientError
+
+SIZES = [int(x) for x in os.environ.get("BENCH_SIZES", "10000,100000,1000000").split(",")]
+DIM = int(os.environ.get("BENCH_DIM", "256"))
+CLUSTERS = int(os.environ.get("BENCH_CLUSTERS", "2000"))
+NOISE = float(os.environ.get("BENCH_NOISE", "1.0"))      # relativ zur Zentrumsnorm; größer = schwerer
+QUERIES = int(os.environ.get("BENCH_QUERIES", "200"))
+K = int(os.environ.get("BENCH_K", "10"))
+NPROBES = [int(x) for x in os.environ.get("BENCH_NPROBES", "4,8,16,32").split(",")]
+MEM_ROWS = int(os.environ.get("BENCH_MEM_ROWS", "0"))     # INDEX_MEM_CACHE_ROWS; 0 = aus memory_size
+SEG_ROWS = 100000                                        # Zeilen pro Segment (wie große Flushes)
+
+class _MemS3:
+    def __init__(self):
+        self.objects: dict = {}
+
+    def _err(self, code):
+        return ClientError({"Error": {"Code": code}}, "S3")
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, **kw):
+        cur = self.objects.get(Key)
+        if (IfNoneMatch == "*" and cur) or (IfMatch and (not cur or cur[1] != IfMatch)):
+            raise self._err("PreconditionFailed")
+        self.objects[Key] = (bytes(Body), f'"{len(self.objects)}-{len(Body)}"', datetime.now(timezone.utc))
+        return {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self._err("NoSuchKey")
+        body, etag, _ = self.objects[Key]
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def download_file(self, Bucket, Key, Filename):
+        with open(Filename, "wb") as f:
+            f.write(self.get_object(Bucket, Key)["Body"].read())
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, **kw):
+        keys = sorted(k for k in self.objects if k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + MaxKeys]
+        r = {"Contents": [{"Key": k, "LastModified": self.objects[k][2]} for k in page],
+             "IsTruncated": start + MaxKeys < len(keys)}
+        if r["IsTruncated"]:
+            r["NextContinuationToken"] = str(start + MaxKeys)
+        return r
+
+    def delete_objects(self, Bucket, Delete):
+        for o in Delete["Objects"]:
+            self.objects.pop(o["Key"], None)
+        return {}
+
+def _corpus(n: int, rng, centers):
+    for start in range(0, n, SEG_ROWS):
+        rows = min(SEG_ROWS, n - start)
+        c = centers[rng.integers(0, len(centers), size=rows)]
+        yield start, (c + rng.standard_normal((rows, DIM), dtype=np.float32) * (NOISE / np.sqrt(DIM))).astype(np.float32)
+
+def _search_all(tenant, queries, nprobe=None):
+    t0 = time.perf_counter()
+    res = [L._index_search(tenant, q.tolist(), K, nprobe) for q in queries]
+    return res, len(queries) / (time.perf_counter() - t0)
+
+def _recall(truth, got) -> float:
+    hit = sum(len({r["id"] for r in t["results"]} & {r["id"] for r in g["results"]}) for t, g in zip(truth, got))
+    return hit / (K * len(truth))
+
+def run(n: int):
+    rng = np.random.default_rng(21)
+    centers = L._normalize(rng.standard_normal((CLUSTERS, DIM), dtype=np.float32))
+    L.s3 = _MemS3()
+    L.INDEX_MEM_CACHE_ROWS = MEM_ROWS
+    tenant = f"bench{n}"
+    man = {"dim": DIM, "count": 0, "segments": [], "ivf": None}
+
+    t0 = time.perf_counter()
+    for start, mat in _corpus(n, rng, centers):
+        man["segments"].append(L._write_segment(tenant, L._normalize(mat), [f"d{start + i}" for i in range(len(mat))]))
+    man["count"] = n
+    assert L._vi_commit(tenant, man, None, [])
+    t_load = time.perf_counter() - t0
+
+    queries = next(_corpus(QUERIES, rng, centers))[1]
+    truth, qps_brute = _search_all(tenant, queries)
+
+    L.IVF_MIN_VECTORS = 0           # auch 10k trainieren, damit beide Modi vergleichbar sind
+    t0 = time.perf_counter()
+    tr = L._index_train(tenant)
+    t_train = time.perf_counter() - t0
+
+    print(f"n={n:>8} dim={DIM} segs={len(man['segments'])} load={t_load:6.1f}s train={t_train:6.1f}s "
+          f"lists={tr.get('lists')} mem_rows={L._vi_mem_limit()}")
+    print(f"  {'brute':>10}: recall@{K}=1.000  qps={qps_brute:8.1f}  scanned={n}")
+    for nprobe in NPROBES:
+        got, qps = _search_all(tenant, queries, nprobe)
+        scanned = sum(g["searched"] for g in got) / len(got)
+        print(f"  {'ivf/' + str(nprobe):>10}: recall@{K}={_recall(truth, got):.3f}  qps={qps:8.1f}  "
+              f"scanned={scanned:.0f} ({scanned / n:.1%})")
+    shutil.rmtree(os.path.join(L.VECTOR_INDEX_DIR, tenant), ignore_errors=True)
+    L._VI_CACHE.clear()
+    L._VI_MEM.clear()
+
+def main():
+    try:
+        for n in SIZES:
+            run(n)
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,31 @@ module "lambda2" {
 
   # Bedrock (IAM strikt nur für dieses Modell)
   bedrock_model_id = var.bedrock_model_id
+  embed_dimensions = var.embed_dimensions
+  bedrock_rps      = var.bedrock_rps
+  bedrock_tpm      = var.bedrock_tpm
+
+  # Embedding-Cache (optional)
+  embed_cache_bucket = var.embed_cache_bucket
+  embed_cache_prefix = var.embed_cache_prefix
+
+  # Vektor-Claim-Check (optional)
+  vector_bucket = var.vector_bucket
+  vector_prefix = var.vector_prefix
+  vector_dtype  = var.vector_dtype
+
+  # Vektor-Index pro Tenant (optional)
+  vector_index_bucket  = var.vector_index_bucket
+  vector_index_prefix  = var.vector_index_prefix
+  index_flush_schedule = var.index_flush_schedule
+  layers               = var.layers
+
+  index_train_schedule    = var.index_train_schedule
+  index_train_memory_size = var.index_train_memory_size
+  index_train_timeout     = var.index_train_timeout
+
+  index_search_memory_size = var.index_search_memory_size
+  index_search_timeout     = var.index_search_timeout
 
   # VPC (optional)
   attach_vpc_access  = var.attach_vpc_access
@@ -33,3 +58,4 @@ module "lambda2" {
 
 output "lambda_function_arn" { value = module.lambda2.lambda_function_arn }
 output "lambda_role_arn"     { value = module.lambda2.lambda_role_arn }
+output "index_search_function_arn" { value = module.lambda2.index_search_function_arn }
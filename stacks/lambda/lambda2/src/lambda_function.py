@@ -1,16 +1,92 @@
 import os
+import re
+import sys
 import json
-from typing import Any, Dict
+import math
+import time
+import uuid
+import random
+import shutil
+import threading
+import base64
+import struct
+import sqlite3
+import hashlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 import boto3
 from botocore.config import Config
-
-# Kurze Timeouts + wenige Retries (hängt nicht fest, wenn Endpoint fehlt)
-_BOTO_CFG = Config(connect_timeout=2, read_timeout=5, retries={'max_attempts': 2})
+from botocore.exceptions import ClientError
 
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 EMBED_MODEL = os.getenv("BEDROCK_EMBED_MODEL_ID", "amazon.titan-embed-text-v2:0")
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "0"))              # 0 = Modell-Default; Titan v2: 256 | 512 | 1024
+
+# Vektor-Claim-Check: Vektor als Binärobjekt nach S3, in der Antwort nur Pointer + Prüfsumme
+VECTOR_BUCKET = os.getenv("VECTOR_BUCKET", "")                          # leer = Floatliste inline (alt)
+VECTOR_PREFIX = os.getenv("VECTOR_PREFIX", "embeddings/vectors/")
+VECTOR_DTYPE  = os.getenv("VECTOR_DTYPE", "float32")                    # float32 | float16 | int8 (Skalar je Vektor)
+VECTOR_INLINE = os.getenv("VECTOR_INLINE", "0") == "1"                  # Übergang: Liste zusätzlich mitliefern
+if VECTOR_DTYPE not in ("float32", "float16", "int8"):
+    VECTOR_DTYPE = "float32"
+
+# Batch-Modus
+EMBED_WORKERS   = int(os.getenv("EMBED_WORKERS", "8"))      # paralleler Fan-out (Titan) / Cohere-Requests
+COHERE_MAX_TEXTS = 96                                       # API-Limit pro Cohere-Request
+
+# Lange Texte: Chunks unter Token-Budget, parallel embeddet, längengewichtet gepoolt
+# (Cohere v3 schneidet bei 512 Tokens ab; Titan v2 kann 8k, kleinere Chunks = mehr Parallelität)
+EMBED_CHUNK_TOKENS = int(os.getenv("EMBED_CHUNK_TOKENS", "0")) or (512 if "cohere.embed" in EMBED_MODEL.lower() else 1024)
+EMBED_INDEX_CHUNKS = os.getenv("EMBED_INDEX_CHUNKS", "0") == "1"        # Chunk-Vektoren zusätzlich in den Index
+
+# Kurze Timeouts + wenige Retries (hängt nicht fest, wenn Endpoint fehlt);
+# Pool so groß wie der Fan-out, sonst warten Threads auf Verbindungen
+_BOTO_CFG = Config(connect_timeout=2, read_timeout=5, retries={'max_attempts': 2},
+                   max_pool_connections=max(10, EMBED_WORKERS))
+# Bedrock: Retries macht _invoke_bedrock selbst (Rate-Limit + Jitter), botocore nur 1 Versuch
+_BEDROCK_CFG = Config(connect_timeout=2, read_timeout=5, retries={'total_max_attempts': 1},
+                      max_pool_connections=max(10, EMBED_WORKERS))
 
-bedrock = boto3.client("bedrock-runtime", region_name=AWS_REGION, config=_BOTO_CFG)
+# Bedrock-Drosselung (siehe _invoke_bedrock); 0 = kein Limit
+BEDROCK_RPS = float(os.getenv("BEDROCK_RPS", "0"))                      # Requests/s pro Container
+BEDROCK_TPM = float(os.getenv("BEDROCK_TPM", "0"))                      # Input-Tokens/min pro Container
+BEDROCK_MAX_RETRIES     = int(os.getenv("BEDROCK_MAX_RETRIES", "6"))
+BEDROCK_BACKOFF_BASE_MS = int(os.getenv("BEDROCK_BACKOFF_BASE_MS", "50"))
+BEDROCK_BACKOFF_MAX_MS  = int(os.getenv("BEDROCK_BACKOFF_MAX_MS", "1000"))
+BEDROCK_DEADLINE_MS     = int(os.getenv("BEDROCK_DEADLINE_MS", "2000"))  # Warten + Retries je Request (< Lambda-Timeout)
+BEDROCK_MIN_RATE_FACTOR = 0.1                                            # Untergrenze der adaptiven Rate
+
+# Embedding-Cache (siehe _embed_cached)
+EMBED_CACHE_MAX    = int(os.getenv("EMBED_CACHE_MAX", "1024"))          # Einträge im Prozess-LRU
+EMBED_CACHE_BUCKET = os.getenv("EMBED_CACHE_BUCKET", "")                # persistenter Store in S3 (leer = aus)
+EMBED_CACHE_PREFIX = os.getenv("EMBED_CACHE_PREFIX", "embeddings/cache/")
+EMBED_CACHE_SQLITE = os.getenv("EMBED_CACHE_SQLITE", "")                # alternativ lokale SQLite-Datei
+# Near-Duplicates (Lambda1 duplicate_of): Vektor des Originals aus dem Store übernehmen
+EMBED_REUSE_DUPLICATES = os.getenv("EMBED_REUSE_DUPLICATES", "0") == "1"
+
+# Vektor-Index pro Tenant (siehe _index_flush/_index_search; Suche braucht NumPy als Layer)
+VECTOR_INDEX_BUCKET = os.getenv("VECTOR_INDEX_BUCKET", "")              # leer = kein Index
+VECTOR_INDEX_PREFIX = os.getenv("VECTOR_INDEX_PREFIX", "embeddings/index/")
+VECTOR_INDEX_DIR    = os.getenv("VECTOR_INDEX_DIR", "/tmp/vindex")       # lokaler Cache der Segmentdateien
+INDEX_FLUSH_MAX     = int(os.getenv("INDEX_FLUSH_MAX", "1000"))          # Pending-Objekte pro Flush/Tenant
+INDEX_FLUSH_MIN_REMAINING_MS = int(os.getenv("INDEX_FLUSH_MIN_REMAINING_MS", "1500"))
+INDEX_SEGMENT_MIN_ROWS = int(os.getenv("INDEX_SEGMENT_MIN_ROWS", "5000"))  # kleinere Segmente werden gemergt ...
+INDEX_MERGE_AFTER   = int(os.getenv("INDEX_MERGE_AFTER", "8"))             # ... sobald es so viele gibt
+IVF_MIN_VECTORS     = int(os.getenv("IVF_MIN_VECTORS", "50000"))         # darunter Brute Force
+IVF_LISTS           = int(os.getenv("IVF_LISTS", "0"))                   # 0 = auto (~4*sqrt(n))
+IVF_NPROBE          = int(os.getenv("IVF_NPROBE", "8"))
+IVF_TRAIN_ITERS     = int(os.getenv("IVF_TRAIN_ITERS", "10"))
+IVF_TRAIN_SAMPLE    = int(os.getenv("IVF_TRAIN_SAMPLE", "65536"))         # Zeilen-Stichprobe fürs k-means
+IVF_RETRAIN_FACTOR  = float(os.getenv("IVF_RETRAIN_FACTOR", "4"))         # neu trainieren ab count >= Faktor * trainiert
+INDEX_GC_GRACE_S    = int(os.getenv("INDEX_GC_GRACE_S", "3600"))          # unreferenzierte Dateien erst danach löschen
+VECTOR_INDEX_CACHE_MB = int(os.getenv("VECTOR_INDEX_CACHE_MB", "0"))      # 0 = 80 % des Dateisystems unter VECTOR_INDEX_DIR
+INDEX_MEM_CACHE_ROWS = int(os.getenv("INDEX_MEM_CACHE_ROWS", "0"))       # Ids + IVF-Listen im RAM; 0 = 25 % von memory_size
+SEARCH_CHUNK_ROWS   = 65536                                              # Brute Force blockweise (RAM)
+
+bedrock = boto3.client("bedrock-runtime", region_name=AWS_REGION, config=_BEDROCK_CFG)
+s3 = boto3.client("s3", region_name=AWS_REGION, config=_BOTO_CFG)
 
 def _take_detail(evt: Dict[str, Any]) -> Dict[str, Any]:
     if isinstance(evt, dict) and isinstance(evt.get("detail"), dict):
@@ -48,21 +124,18 @@ def _pick_text(evt: Dict[str, Any]) -> str:
     return base
 
 def _embed_titan(text: str) -> Dict[str, Any]:
-    body = {"inputText": text}
-    resp = bedrock.invoke_model(modelId=EMBED_MODEL, body=json.dumps(body))
-    payload = json.loads(resp["body"].read())
+    body: Dict[str, Any] = {"inputText": text}
+    if EMBED_DIMENSIONS and "titan-embed-text-v2" in EMBED_MODEL.lower():
+        body["dimensions"] = EMBED_DIMENSIONS   # v1 kennt keine reduzierten Dimensionen
+    payload = _invoke_bedrock(body, _est_tokens(text))
     # Titan liefert {"embedding":[...]}
     vec = payload.get("embedding") or []
     return {"vector": vec, "dim": len(vec), "raw": payload}
 
 def _embed_cohere(text: str) -> Dict[str, Any]:
-    body = {"texts": [text], "input_type": "search_document"}
-    resp = bedrock.invoke_model(modelId=EMBED_MODEL, body=json.dumps(body))
-    payload = json.loads(resp["body"].read())
-    # Cohere liefert {"embeddings":[[...]]}
-    arr = payload.get("embeddings") or []
-    vec = arr[0] if arr and isinstance(arr[0], list) else []
-    return {"vector": vec, "dim": len(vec), "raw": payload}
+    # Cohere liefert {"embeddings":[[...]]}; Einzeltext = Batch der Größe 1
+    vec = _embed_cohere_batch([text])[0]
+    return {"vector": vec, "dim": len(vec)}
 
 def _embed(text: str) -> Dict[str, Any]:
     mid = EMBED_MODEL.lower()
@@ -73,7 +146,1203 @@ def _embed(text: str) -> Dict[str, Any]:
     # Default: versuche Titan
     return _embed_titan(text)
 
+# ----------------------------
+# Bedrock-Drosselung (Token Bucket + adaptive Retries)
+# ----------------------------
+# Zwei Buckets pro Container: Requests/s und Tokens/min. Bei Throttling halbiert sich die
+# Rate (max. einmal pro Sekunde, bis BEDROCK_MIN_RATE_FACTOR x Budget), jeder Erfolg hebt sie
+# um 5 % des Budgets wieder an (AIMD).
+# Das Budget gilt pro Container -> bei N parallelen Instanzen Account-Quota / N setzen.
+_THROTTLE_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+_RETRY_CODES = _THROTTLE_CODES | {"ServiceUnavailableException", "ModelNotReadyException",
+                                  "ModelTimeoutException", "InternalServerException"}
+_LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class _TokenBucket:
+    def __init__(self, rate_per_s: float, burst: float):
+        self.max_rate = rate_per_s
+        self.rate = rate_per_s
+        self.burst = burst
+        self.level = burst
+        self.stamp = time.monotonic()
+        self.cut_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, n: float, deadline: float) -> bool:
+        """Wartet, bis n Einheiten frei sind; False, wenn das vor deadline (monotonic) nicht klappt."""
+        n = min(n, self.burst)   # Einzelrequest größer als der Burst: sonst nie erfüllbar
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.level = min(self.burst, self.level + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.level >= n:
+                    self.level -= n
+                    return True
+                wait = (n - self.level) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def refund(self, n: float) -> None:
+        """Gibt per acquire genommene Einheiten zurück (Request wurde nicht gesendet)."""
+        with self.lock:
+            self.level = min(self.burst, self.level + min(n, self.burst))
+
+    def throttled(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.level = 0.0   # angesparten Burst verwerfen, sonst feuern alle Threads sofort wieder
+            # höchstens eine Halbierung pro Sekunde: parallele Throttles derselben Welle zählen einmal
+            if now - self.cut_at >= 1.0:
+                self.rate = max(self.max_rate * BEDROCK_MIN_RATE_FACTOR, self.rate / 2)
+                self.cut_at = now
+
+    def succeeded(self) -> None:
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+# RPS: Burst = 1 s Budget; TPM: Burst = 10 s Budget
+_RPS_BUCKET = _TokenBucket(BEDROCK_RPS, max(1.0, BEDROCK_RPS)) if BEDROCK_RPS > 0 else None
+_TPM_BUCKET = _TokenBucket(BEDROCK_TPM / 60.0, BEDROCK_TPM / 6.0) if BEDROCK_TPM > 0 else None
+_BEDROCK_STATS: Dict[str, Dict[str, Any]] = {}
+_STATS_LOCK = threading.Lock()
+
+def _stat(model: str, **inc: float) -> None:
+    with _STATS_LOCK:
+        st = _BEDROCK_STATS.setdefault(model, {
+            "requests": 0, "ok": 0, "throttles": 0, "retries": 0, "errors": 0, "rate_limited": 0,
+            "wait_ms": 0.0,
+            "latency_ms": {**{f"le_{b}": 0 for b in _LATENCY_BUCKETS_MS}, "inf": 0},
+        })
+        for k, v in inc.items():
+            st[k] += v
+
+def _observe_latency(model: str, ms: float) -> None:
+    label = next((f"le_{b}" for b in _LATENCY_BUCKETS_MS if ms <= b), "inf")
+    with _STATS_LOCK:
+        _BEDROCK_STATS[model]["latency_ms"][label] += 1
+
+def _bedrock_stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        models = json.loads(json.dumps(_BEDROCK_STATS))
+    limiter: Dict[str, float] = {}
+    if _RPS_BUCKET is not None:
+        limiter["rps"] = round(_RPS_BUCKET.rate, 2)          # aktuelle (adaptierte) Rate
+    if _TPM_BUCKET is not None:
+        limiter["tpm"] = round(_TPM_BUCKET.rate * 60)
+    return {"models": models, "limiter": limiter}
+
+def _invoke_bedrock(body: Dict[str, Any], tokens: int) -> Dict[str, Any]:
+    """
+    invoke_model mit Rate-Limit, adaptiven Retries (exponentiell, Full Jitter) und Metriken.
+    Retries nur für Throttling/transiente Fehler und nur bis BEDROCK_DEADLINE_MS.
+    """
+    deadline = time.monotonic() + BEDROCK_DEADLINE_MS / 1000.0
+    buckets = [(b, n) for b, n in ((_RPS_BUCKET, 1), (_TPM_BUCKET, tokens)) if b is not None]
+    attempt = 0
+    while True:
+        t0 = time.monotonic()
+        taken: List[Tuple[_TokenBucket, int]] = []
+        for b, n in buckets:
+            if not b.acquire(n, deadline):
+                for tb, tn in taken:   # RPS-Token nicht verfallen lassen, wenn das TPM-Budget fehlt
+                    tb.refund(tn)
+                _stat(EMBED_MODEL, rate_limited=1)
+                raise RuntimeError("bedrock rate limit: no budget before deadline")
+            taken.append((b, n))
+        t1 = time.monotonic()
+        _stat(EMBED_MODEL, requests=1, wait_ms=(t1 - t0) * 1000)
+        try:
+            resp = bedrock.invoke_model(modelId=EMBED_MODEL, body=json.dumps(body))
+            payload = json.loads(resp["body"].read())
+        except ClientError as e:
+            _observe_latency(EMBED_MODEL, (time.monotonic() - t1) * 1000)
+            code = e.response.get("Error", {}).get("Code", "")
+            if code in _THROTTLE_CODES:
+                _stat(EMBED_MODEL, throttles=1)
+                for b, _ in buckets:
+                    b.throttled()
+            attempt += 1
+            backoff = random.uniform(0, min(BEDROCK_BACKOFF_MAX_MS, BEDROCK_BACKOFF_BASE_MS * 2 ** attempt)) / 1000.0
+            if code not in _RETRY_CODES or attempt > BEDROCK_MAX_RETRIES or time.monotonic() + backoff > deadline:
+                _stat(EMBED_MODEL, errors=1)
+                raise
+            _stat(EMBED_MODEL, retries=1)
+            time.sleep(backoff)
+            continue
+        except Exception:
+            _observe_latency(EMBED_MODEL, (time.monotonic() - t1) * 1000)
+            _stat(EMBED_MODEL, errors=1)
+            raise
+        _observe_latency(EMBED_MODEL, (time.monotonic() - t1) * 1000)
+        _stat(EMBED_MODEL, ok=1)
+        for b, _ in buckets:
+            b.succeeded()
+        return payload
+
+# ----------------------------
+# Embedding-Cache (Prozess-LRU + persistenter Store)
+# ----------------------------
+# Key = sha256(EMBED_MODEL + "\n" + text). Persistiert wird kompakt binär:
+#   b"EMB1" | uint32 dim | dim x float32 (little endian)
+# Store: S3 (EMBED_CACHE_BUCKET, von allen Instanzen geteilt) oder lokal SQLite
+# (EMBED_CACHE_SQLITE, z. B. /tmp/... -> überlebt nur warme Container).
+_CACHE_MAGIC = b"EMB1"
+_MEM_CACHE: "OrderedDict[str, List[float]]" = OrderedDict()
+_CACHE_STATS = {"memory": 0, "s3": 0, "sqlite": 0, "miss": 0, "duplicate": 0}
+_SQLITE_LOCAL = threading.local()     # eine Verbindung pro Thread (_embed_many-Pool), nie geteilt
+
+def _cache_key(text: str) -> str:
+    # Dimension gehört zum Modell-Teil des Keys (ohne EMBED_DIMENSIONS bleiben alte Keys gültig)
+    model = f"{EMBED_MODEL}@{EMBED_DIMENSIONS}" if EMBED_DIMENSIONS else EMBED_MODEL
+    return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+def _pack_vector(vec: List[float]) -> bytes:
+    return _CACHE_MAGIC + struct.pack("<I", len(vec)) + array("f", vec).tobytes()
+
+def _unpack_vector(blob: bytes) -> Optional[List[float]]:
+    if len(blob) < 8 or blob[:4] != _CACHE_MAGIC:
+        return None
+    (dim,) = struct.unpack_from("<I", blob, 4)
+    arr = array("f")
+    arr.frombytes(blob[8:8 + 4 * dim])
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tolist() if len(arr) == dim else None
+
+def _mem_put(key: str, vec: List[float]) -> None:
+    _MEM_CACHE[key] = vec
+    _MEM_CACHE.move_to_end(key)
+    while len(_MEM_CACHE) > EMBED_CACHE_MAX:
+        _MEM_CACHE.popitem(last=False)
+
+def _sqlite():
+    conn = getattr(_SQLITE_LOCAL, "conn", None)
+    if conn is None:
+        # WAL: Leser blockieren Schreiber nicht; timeout wartet auf den Schreib-Lock anderer Threads
+        conn = sqlite3.connect(EMBED_CACHE_SQLITE, isolation_level=None, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS embeddings (k TEXT PRIMARY KEY, v BLOB NOT NULL)")
+        _SQLITE_LOCAL.conn = conn
+    return conn
+
+def _store_get(key: str) -> Tuple[Optional[List[float]], Optional[str]]:
+    if EMBED_CACHE_BUCKET:
+        try:
+            obj = s3.get_object(Bucket=EMBED_CACHE_BUCKET, Key=f"{EMBED_CACHE_PREFIX}{key}")
+            return _unpack_vector(obj["Body"].read()), "s3"
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                print(f"[cache] s3 get failed: {e}")
+            return None, None
+    if EMBED_CACHE_SQLITE:
+        row = _sqlite().execute("SELECT v FROM embeddings WHERE k = ?", (key,)).fetchone()
+        return (_unpack_vector(row[0]), "sqlite") if row else (None, None)
+    return None, None
+
+def _store_put(key: str, vec: List[float]) -> None:
+    blob = _pack_vector(vec)
+    try:
+        if EMBED_CACHE_BUCKET:
+            s3.put_object(Bucket=EMBED_CACHE_BUCKET, Key=f"{EMBED_CACHE_PREFIX}{key}",
+                          Body=blob, ContentType="application/octet-stream")
+        elif EMBED_CACHE_SQLITE:
+            _sqlite().execute("INSERT OR REPLACE INTO embeddings (k, v) VALUES (?, ?)", (key, blob))
+    except Exception as e:
+        # Cache darf den Haupt-Flow nie brechen
+        print(f"[cache] store put failed: {e}")
+
+def _embed_cached(text: str) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Wie _embed, aber über den Cache; zweiter Wert = Trefferquelle (None = Miss)."""
+    key = _cache_key(text)
+    vec = _MEM_CACHE.get(key)
+    if vec is not None:
+        _MEM_CACHE.move_to_end(key)
+        _CACHE_STATS["memory"] += 1
+        return {"vector": vec, "dim": len(vec)}, "memory"
+
+    try:
+        vec, src = _store_get(key)
+    except Exception as e:
+        print(f"[cache] store get failed: {e}")
+        vec, src = None, None
+    if vec is not None:
+        _mem_put(key, vec)
+        _CACHE_STATS[src] += 1
+        return {"vector": vec, "dim": len(vec)}, src
+
+    _CACHE_STATS["miss"] += 1
+    out = _embed(text)
+    if out["vector"]:
+        _mem_put(key, out["vector"])
+        _store_put(key, out["vector"])
+    return out, None
+
+def _doc_alias(doc_id: str) -> str:
+    # eigener Key-Raum neben den Text-Keys, gleiche Modell-/Dimensionsbindung
+    return _cache_key(f"\0doc\0{doc_id}")
+
+def _reuse_duplicate(d: Dict[str, Any]) -> Optional[List[float]]:
+    """Vektor des Originals, wenn Lambda1 ein Near-Duplicate gemeldet hat und er im Store liegt."""
+    dup = d.get("duplicate_of") if isinstance(d, dict) else None
+    if not (EMBED_REUSE_DUPLICATES and isinstance(dup, dict) and dup.get("id")):
+        return None
+    try:
+        vec, _ = _store_get(_doc_alias(str(dup["id"])))
+    except Exception as e:
+        print(f"[cache] duplicate lookup failed: {e}")
+        return None
+    if vec is not None:
+        _CACHE_STATS["duplicate"] += 1
+    return vec
+
+def _remember_doc(d: Dict[str, Any], vec: List[float]) -> None:
+    """Vektor zusätzlich unter der Roh-Mail-Id ablegen, damit spätere Near-Duplicates ihn finden."""
+    doc_id = (d.get("s3") or {}).get("key") if isinstance(d, dict) else None
+    if EMBED_REUSE_DUPLICATES and doc_id and vec and not d.get("duplicate_of"):
+        _store_put(_doc_alias(str(doc_id)), vec)
+
+# ----------------------------
+# Vektor-Claim-Check (S3 statt JSON-Floatliste)
+# ----------------------------
+# Objektformat (16 Byte Header, danach die Werte little endian, 16-Byte-aligned):
+#   b"VEC1" | dtype b"f4"/b"f2"/b"i1" | 2 Byte 0 | uint32 dim | float32 scale | dim x float32/float16/int8
+# scale nur bei int8 (symmetrisch: wert = int8 * scale, scale = max|v| / 127), sonst 0.
+# Key ist inhaltsadressiert (gleicher Cache-Key wie oben) -> Retries schreiben dasselbe Objekt.
+_VEC_MAGIC = b"VEC1"
+_VEC_HEADER = 16
+_VEC_DTYPES = {"float32": (b"f4", "f", "<f4"), "float16": (b"f2", "e", "<f2"), "int8": (b"i1", "b", "i1")}
+
+def _quantize_int8(vec: List[float]) -> Tuple[List[int], float]:
+    """Symmetrische Skalar-Quantisierung mit eigenem Skalar pro Vektor."""
+    peak = max((abs(x) for x in vec), default=0.0)
+    scale = peak / 127.0 if peak else 1.0
+    return [max(-127, min(127, round(x / scale))) for x in vec], scale
+
+def _pack_claim(vec: List[float], dtype: str) -> bytes:
+    code, fmt, _ = _VEC_DTYPES[dtype]
+    scale = 0.0
+    if dtype == "int8":
+        vec, scale = _quantize_int8(vec)
+    header = _VEC_MAGIC + code + b"\0\0" + struct.pack("<If", len(vec), scale)
+    return header + struct.pack(f"<{len(vec)}{fmt}", *vec)
+
+def _claim_check(tenant: str, key: str, vec: List[float]) -> Dict[str, Any]:
+    blob = _pack_claim(vec, VECTOR_DTYPE)
+    ext = _VEC_DTYPES[VECTOR_DTYPE][0].decode("ascii")
+    s3_key = f"{VECTOR_PREFIX}{tenant}/{key}.{ext}"
+    checksum = hashlib.sha256(blob).hexdigest()
+    s3.put_object(Bucket=VECTOR_BUCKET, Key=s3_key, Body=blob, ContentType="application/octet-stream",
+                  Metadata={"dim": str(len(vec)), "dtype": VECTOR_DTYPE, "model": EMBED_MODEL})
+    return {
+        "dim": len(vec),
+        "dtype": VECTOR_DTYPE,
+        "s3_uri": f"s3://{VECTOR_BUCKET}/{s3_key}",
+        "bytes": len(blob),
+        "checksum": f"sha256:{checksum}",
+    }
+
+def _embedding_payload(tenant: str, text: str, out: Dict[str, Any]) -> Dict[str, Any]:
+    """Claim-Check, wenn VECTOR_BUCKET gesetzt ist, sonst inline (Floatliste bzw. int8 + scale)."""
+    if not VECTOR_BUCKET:
+        if VECTOR_DTYPE == "int8":
+            q, scale = _quantize_int8(out["vector"])
+            return {"dim": out["dim"], "dtype": "int8", "scale": scale, "vector": q}
+        return {"dim": out["dim"], "vector": out["vector"]}  # groß! In Prod evtl. nicht loggen
+    emb = _claim_check(tenant, _cache_key(text), out["vector"])
+    if VECTOR_INLINE:
+        emb["vector"] = out["vector"]
+    return emb
+
+def load_vector(blob, verify: Optional[str] = None, dequantize: bool = True):
+    """
+    Claim-Check-Objekt -> NumPy-Array ohne Kopie (np.frombuffer auf den Bytes).
+    int8 wird dequantisiert (float32, dann mit Kopie); dequantize=False liefert die Rohwerte.
+    blob: bytes/bytearray/memoryview; verify: optional "sha256:<hex>" aus der Antwort.
+    """
+    import numpy as np   # nur für Konsumenten; Lambda2 selbst braucht kein NumPy
+    mv = memoryview(blob)
+    if bytes(mv[:4]) != _VEC_MAGIC:
+        raise ValueError("not a VEC1 vector object")
+    if verify and f"sha256:{hashlib.sha256(mv).hexdigest()}" != verify:
+        raise ValueError("vector checksum mismatch")
+    code = bytes(mv[4:6])
+    dim, scale = struct.unpack_from("<If", mv, 8)
+    dt = next(np_dt for c, _, np_dt in _VEC_DTYPES.values() if c == code)
+    arr = np.frombuffer(mv, dtype=dt, count=dim, offset=_VEC_HEADER)
+    if code == b"i1" and dequantize:
+        return arr.astype(np.float32) * np.float32(scale)
+    return arr
+
+def fetch_vector(s3_uri: str, verify: Optional[str] = None, dequantize: bool = True):
+    """Lädt einen Claim-Check aus S3 und gibt ihn via load_vector zurück."""
+    bucket, key = s3_uri[len("s3://"):].split("/", 1)
+    return load_vector(s3.get_object(Bucket=bucket, Key=key)["Body"].read(), verify, dequantize)
+
+# ----------------------------
+# Vektor-Index pro Tenant (NumPy, memory-mapped)
+# ----------------------------
+# Layout unter VECTOR_INDEX_PREFIX/<tenant>/:
+#   manifest.json                 {"dim", "count", "segments": [{"name", "rows", "assign"}], "ivf": {...}|null}
+#   seg-<id>.f32                  rows x dim float32, L2-normalisiert (Cosinus = Skalarprodukt)
+#   seg-<id>.ids.json             Id-Sidecar, gleiche Reihenfolge wie die Zeilen
+#   seg-<id>.ivf-<cid>.i32        (nur mit IVF) Listen-Zuordnung je Zeile zu den Zentroiden <cid>
+#   ivf-<cid>.f32                 (nur mit IVF) Zentroiden lists x dim
+#   pending/<ms>_<rand>.json      neue Vektoren, bis index_flush sie als Segment anhängt
+# Segmente sind unveränderlich -> lokal unter VECTOR_INDEX_DIR gecacht (LRU, VECTOR_INDEX_CACHE_MB)
+# und per np.memmap gelesen. index_flush hängt nur an (passt in die kleine Embedding-Lambda);
+# Mergen, IVF-Training und das Aufräumen unreferenzierter Dateien macht index_train in einer
+# eigenen Funktion mit mehr Speicher/Laufzeit (Modul: index_train_schedule). search läuft ebenfalls
+# in einer eigenen Funktion (<name>-index-search, 2048 MB / 30 s / 10 GB /tmp): Ids und IVF-Listen
+# bleiben dort im Prozess-Cache (_vi_mem_limit), die 128-MB-Embedding-Lambda reicht dafür nicht.
+#
+# Größen: 1M Vektoren x 1024 float32 = 4 GB -> ephemeral_storage entsprechend oder
+# EMBED_DIMENSIONS=256 (1 GB); ist der Cache kleiner als der Index, lädt jede Suche nach.
+def _np():
+    import numpy as np   # erst hier: Embedding-Pfad läuft ohne NumPy-Layer
+    return np
+
+def _vi_base(tenant: str) -> str:
+    return f"{VECTOR_INDEX_PREFIX}{tenant}/"
+
+def _doc_id(d: Dict[str, Any], text_key: str) -> str:
+    # bevorzugt der Roh-Mail-Key (eindeutig je Mail), sonst explizite Id, sonst Text-Hash
+    return str(d.get("id") or (d.get("s3") or {}).get("key") or text_key)
+
+def _index_enqueue(tenant: str, ids: List[str], vecs: List[List[float]]) -> None:
+    """Ein Pending-Objekt pro Aufruf (Batch: alle Vektoren eines Tenants)."""
+    rows = array("f")
+    for v in vecs:
+        rows.extend(v)
+    if sys.byteorder != "little":
+        rows.byteswap()
+    key = f"{_vi_base(tenant)}pending/{int(time.time()*1000):013d}_{uuid.uuid4().hex[:12]}.json"
+    body = {"ids": ids, "dim": len(vecs[0]), "v": base64.b64encode(rows.tobytes()).decode("ascii")}
+    s3.put_object(Bucket=VECTOR_INDEX_BUCKET, Key=key, Body=json.dumps(body).encode("utf-8"),
+                  ContentType="application/json")
+
+def _vi_manifest(tenant: str) -> Tuple[Dict[str, Any], Optional[str]]:
+    try:
+        obj = s3.get_object(Bucket=VECTOR_INDEX_BUCKET, Key=f"{_vi_base(tenant)}manifest.json")
+        return json.loads(obj["Body"].read()), obj.get("ETag")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return {"dim": None, "count": 0, "segments": [], "ivf": None}, None
+        raise
+
+def _vi_commit(tenant: str, man: Dict[str, Any], etag: Optional[str], written: List[str]) -> bool:
+    """Manifest per If-Match/If-None-Match; bei Konflikt die eben geschriebenen Dateien wieder weg."""
+    cond = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        s3.put_object(Bucket=VECTOR_INDEX_BUCKET, Key=f"{_vi_base(tenant)}manifest.json",
+                      Body=json.dumps(man).encode("utf-8"), ContentType="application/json", **cond)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise
+    keys = [f"{_vi_base(tenant)}{n}" for n in written]
+    for i in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=VECTOR_INDEX_BUCKET, Delete={
+            "Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True})
+    return False
+
+_VI_CACHE: "OrderedDict[str, int]" = OrderedDict()   # lokale Datei -> Bytes, LRU-Reihenfolge
+_VI_CACHE_LOCK = threading.Lock()
+_VI_CACHE_STATS = {"hits": 0, "downloads": 0, "evicted": 0}
+
+def _vi_cache_limit() -> int:
+    if VECTOR_INDEX_CACHE_MB > 0:
+        return VECTOR_INDEX_CACHE_MB * 2**20
+    os.makedirs(VECTOR_INDEX_DIR, exist_ok=True)
+    return int(shutil.disk_usage(VECTOR_INDEX_DIR).total * 0.8)
+
+def _vi_cache_add(path: str, size: int) -> None:
+    """Datei als zuletzt benutzt eintragen und älteste entfernen, bis das Limit passt."""
+    with _VI_CACHE_LOCK:
+        _VI_CACHE[path] = size
+        _VI_CACHE.move_to_end(path)
+        limit, total = _vi_cache_limit(), sum(_VI_CACHE.values())
+        while total > limit and len(_VI_CACHE) > 1:
+            old, old_size = _VI_CACHE.popitem(last=False)
+            total -= old_size
+            _VI_CACHE_STATS["evicted"] += 1
+            try:
+                os.remove(old)      # laufende memmaps behalten ihre (unverlinkte) Datei
+            except OSError:
+                pass
+
+_VI_MEM: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()   # Datei -> (geparst, Zeilen), LRU
+
+def _vi_mem_limit() -> int:
+    """
+    Zeilen-Budget des Prozess-Caches. IVF ist nur mit warmem Cache schnell (≥ 2 Zeilen je Vektor:
+    Ids + Listen, ~100 B/Zeile) -> Suche über die eigene index-search-Funktion (Modul, 2048 MB).
+    """
+    if INDEX_MEM_CACHE_ROWS > 0:
+        return INDEX_MEM_CACHE_ROWS
+    return int(os.getenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "128")) * 2**20 // 4 // 100
+
+def _vi_mem(key: str, rows: int, load):
+    """Geparster Inhalt einer unveränderlichen Index-Datei, begrenzt auf _vi_mem_limit() Zeilen."""
+    with _VI_CACHE_LOCK:
+        hit = _VI_MEM.get(key)
+        if hit is not None:
+            _VI_MEM.move_to_end(key)
+            return hit[0]
+    val = load()
+    with _VI_CACHE_LOCK:
+        _VI_MEM[key] = (val, rows)
+        total = sum(r for _, r in _VI_MEM.values())
+        limit = _vi_mem_limit()
+        while total > limit and len(_VI_MEM) > 1:
+            total -= _VI_MEM.popitem(last=False)[1][1]
+    return val
+
+def _vi_local(tenant: str, name: str) -> str:
+    """Unveränderliche Index-Datei lokal bereitstellen (einmal laden, danach /tmp)."""
+    path = os.path.join(VECTOR_INDEX_DIR, tenant, name)
+    if os.path.exists(path):
+        _VI_CACHE_STATS["hits"] += 1
+        with _VI_CACHE_LOCK:
+            if path in _VI_CACHE:
+                _VI_CACHE.move_to_end(path)
+                return path
+        _vi_cache_add(path, os.path.getsize(path))   # von vor einem Runtime-Neustart
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    s3.download_file(VECTOR_INDEX_BUCKET, f"{_vi_base(tenant)}{name}", tmp)
+    os.replace(tmp, path)
+    _VI_CACHE_STATS["downloads"] += 1
+    _vi_cache_add(path, os.path.getsize(path))
+    return path
+
+def _vi_put(tenant: str, name: str, body: bytes, content_type: str = "application/octet-stream") -> None:
+    s3.put_object(Bucket=VECTOR_INDEX_BUCKET, Key=f"{_vi_base(tenant)}{name}", Body=body, ContentType=content_type)
+    # frisch geschrieben -> direkt lokal ablegen, spart den Download beim nächsten Search
+    path = os.path.join(VECTOR_INDEX_DIR, tenant, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(body)
+    _vi_cache_add(path, len(body))
+
+def _vi_matrix(tenant: str, name: str, rows: int, dim: int):
+    np = _np()
+    if rows == 0:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.memmap(_vi_local(tenant, name), dtype="<f4", mode="r", shape=(rows, dim))
+
+def _vi_ids(tenant: str, seg: Dict[str, Any]) -> List[str]:
+    name = f"{seg['name']}.ids.json"
+    def load():
+        with open(_vi_local(tenant, name), "rb") as f:
+            return json.load(f)
+    return _vi_mem(f"{tenant}/{name}", seg["rows"], load)
+
+def _vi_assign_name(seg: Dict[str, Any]) -> str:
+    return seg.get("assign") or f"{seg['name']}.ivf.i32"   # Manifeste vor assign-Feld
+
+def _vi_assign(tenant: str, seg: Dict[str, Any]):
+    np = _np()
+    return np.memmap(_vi_local(tenant, _vi_assign_name(seg)), dtype="<i4", mode="r", shape=(seg["rows"],))
+
+def _vi_lists(tenant: str, seg: Dict[str, Any], lists: int):
+    """Invertierte IVF-Listen eines Segments: Zeilen nach Zentroid sortiert + Offsets je Zentroid."""
+    np = _np()
+    def load():
+        assign = np.asarray(_vi_assign(tenant, seg))
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=lists))])
+        return np.argsort(assign, kind="stable").astype(np.int32), offsets
+    return _vi_mem(f"{tenant}/{_vi_assign_name(seg)}", seg["rows"], load)
+
+def _seg_files(seg: Dict[str, Any]) -> List[str]:
+    return [f"{seg['name']}.f32", f"{seg['name']}.ids.json"] + ([seg["assign"]] if seg.get("assign") else [])
+
+def _normalize(m):
+    np = _np()
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32)
+
+def _nearest(mat, centroids):
+    """Nächster Zentroid je Zeile, blockweise (Score-Matrix nie größer als Block x lists)."""
+    np = _np()
+    step = max(1, SEARCH_CHUNK_ROWS // 8)
+    return np.concatenate([np.argmax(np.asarray(mat[i:i + step]) @ centroids.T, axis=1)
+                           for i in range(0, len(mat), step)] or [np.zeros(0, dtype=np.int64)])
+
+def _assign_segment(tenant: str, seg: Dict[str, Any], mat, ivf: Dict[str, Any], centroids) -> str:
+    name = f"{seg['name']}.{ivf['centroids'][:-len('.f32')]}.i32"
+    _vi_put(tenant, name, _nearest(mat, centroids).astype("<i4").tobytes())
+    seg["assign"] = name
+    return name
+
+def _write_segment(tenant: str, mat, ids: List[str], ivf=None, centroids=None) -> Dict[str, Any]:
+    np = _np()
+    seg = {"name": f"seg-{int(time.time()*1000):013d}-{uuid.uuid4().hex[:8]}", "rows": int(mat.shape[0])}
+    _vi_put(tenant, f"{seg['name']}.f32", np.ascontiguousarray(mat, dtype="<f4").tobytes())
+    _vi_put(tenant, f"{seg['name']}.ids.json", json.dumps(ids).encode("utf-8"), "application/json")
+    if centroids is not None:
+        _assign_segment(tenant, seg, mat, ivf, centroids)
+    return seg
+
+def _train_ivf(tenant: str, man: Dict[str, Any]):
+    """Sphärisches k-means auf einer Stichprobe von höchstens IVF_TRAIN_SAMPLE Zeilen."""
+    np = _np()
+    dim, n = man["dim"], man["count"]
+    lists = IVF_LISTS or int(min(4096, max(16, 4 * np.sqrt(n))))
+    rng = np.random.default_rng(0)
+    total = min(n, IVF_TRAIN_SAMPLE, lists * 64)
+    sample = np.concatenate([
+        np.asarray(_vi_matrix(tenant, f"{s['name']}.f32", s["rows"], dim)[
+            np.sort(rng.choice(s["rows"], size=min(s["rows"], max(1, total * s["rows"] // n)), replace=False))])
+        for s in man["segments"]
+    ])
+    lists = min(lists, len(sample))
+    cent = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+    for _ in range(IVF_TRAIN_ITERS):
+        assign = _nearest(sample, cent)
+        counts = np.bincount(assign, minlength=lists)
+        nz = np.nonzero(counts)[0]
+        starts = (np.cumsum(counts) - counts)[nz]
+        sums = np.add.reduceat(sample[np.argsort(assign, kind="stable")], starts, axis=0)
+        cent[nz] = sums / counts[nz, None]          # leere Listen behalten ihren alten Zentroid
+        cent = _normalize(cent)
+    return cent
+
+def _unique_last(ids: List[str]) -> List[int]:
+    """Zeilen-Indizes mit je Id nur dem letzten (neuesten) Vorkommen, Reihenfolge bleibt."""
+    last = {i: n for n, i in enumerate(ids)}
+    return [n for n, i in enumerate(ids) if last[i] == n]
+
+def _merge_small_segments(tenant: str, man: Dict[str, Any], centroids) -> List[str]:
+    """Legt kleine Segmente zu einem zusammen (begrenzt die Dateianzahl); gibt neue Dateien zurück."""
+    np = _np()
+    small = [s for s in man["segments"] if s["rows"] < INDEX_SEGMENT_MIN_ROWS]
+    if len(small) < INDEX_MERGE_AFTER:
+        return []
+    dim = man["dim"]
+    mat = np.concatenate([np.asarray(_vi_matrix(tenant, f"{s['name']}.f32", s["rows"], dim)) for s in small])
+    ids = [i for s in small for i in _vi_ids(tenant, s)]
+    keep = _unique_last(ids)          # Redelivery/Retry derselben Mail in mehreren Flushes
+    if len(keep) < len(ids):
+        man["count"] -= len(ids) - len(keep)
+        mat, ids = mat[keep], [ids[n] for n in keep]
+    merged = _write_segment(tenant, mat, ids, man.get("ivf"), centroids)
+    names = {s["name"] for s in small}
+    man["segments"] = [s for s in man["segments"] if s["name"] not in names] + [merged]
+    return _seg_files(merged)
+
+def _index_flush(tenant: str) -> Dict[str, Any]:
+    """Pending-Vektoren als ein Segment anhängen (nur Append + Zuordnung zu bestehenden Zentroiden)."""
+    np = _np()
+    base = _vi_base(tenant)
+    r = s3.list_objects_v2(Bucket=VECTOR_INDEX_BUCKET, Prefix=f"{base}pending/", MaxKeys=INDEX_FLUSH_MAX)
+    pend_keys = [o["Key"] for o in r.get("Contents") or []]
+    if not pend_keys:
+        return {"tenantId": tenant, "appended": 0}
+
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as ex:
+        docs = list(ex.map(lambda k: json.loads(s3.get_object(Bucket=VECTOR_INDEX_BUCKET, Key=k)["Body"].read()),
+                           pend_keys))
+
+    man, etag = _vi_manifest(tenant)
+    dim = man["dim"] or docs[0]["dim"]
+    skipped = sum(len(doc["ids"]) for doc in docs if doc["dim"] != dim)
+    if skipped:
+        # Dimensionswechsel (EMBED_DIMENSIONS/Modell) -> neuer Index nötig (anderer Prefix)
+        print(f"[index] {tenant}: {skipped} vectors with dim != {dim} dropped")
+    docs = [doc for doc in docs if doc["dim"] == dim]
+    if not docs:
+        s3.delete_objects(Bucket=VECTOR_INDEX_BUCKET, Delete={"Objects": [{"Key": k} for k in pend_keys], "Quiet": True})
+        return {"tenantId": tenant, "appended": 0, "dropped": skipped}
+    ids = [i for doc in docs for i in doc["ids"]]
+    mat = _normalize(np.concatenate([
+        np.frombuffer(base64.b64decode(doc["v"]), dtype="<f4").reshape(-1, dim) for doc in docs
+    ]))
+    # Ids sind je Segment eindeutig (SQS-Redelivery/Step-Functions-Retry legen dieselbe Mail erneut
+    # in pending/); über Segmente hinweg dedupliziert _index_search
+    keep = _unique_last(ids)
+    if len(keep) < len(ids):
+        mat, ids = mat[keep], [ids[n] for n in keep]
+
+    centroids = None
+    if man.get("ivf"):
+        centroids = np.asarray(_vi_matrix(tenant, man["ivf"]["centroids"], man["ivf"]["lists"], dim))
+    seg = _write_segment(tenant, mat, ids, man.get("ivf"), centroids)
+    man["dim"] = dim
+    man["segments"].append(seg)
+    man["count"] = sum(s["rows"] for s in man["segments"])
+
+    if not _vi_commit(tenant, man, etag, _seg_files(seg)):
+        # paralleler Flush/Train war schneller: Pending bleibt, nächster Lauf hängt es an
+        return {"tenantId": tenant, "appended": 0, "conflict": True}
+    s3.delete_objects(Bucket=VECTOR_INDEX_BUCKET, Delete={"Objects": [{"Key": k} for k in pend_keys], "Quiet": True})
+    return {"tenantId": tenant, "appended": len(ids), "count": man["count"],
+            "segments": len(man["segments"]), "ivf": bool(man.get("ivf"))}
+
+def _vi_gc(tenant: str, man: Dict[str, Any]) -> int:
+    """
+    Löscht Dateien, die kein Manifest mehr referenziert (gemergte Segmente, alte Zuordnungen,
+    abgebrochene Flushes). Erst nach INDEX_GC_GRACE_S: Leser mit älterem Manifest und
+    laufende Flushes vor ihrem Commit brauchen sie noch.
+    """
+    base = _vi_base(tenant)
+    keep = {f"{base}{f}" for s in man["segments"] for f in _seg_files(s)}
+    if man.get("ivf"):
+        keep.add(f"{base}{man['ivf']['centroids']}")
+    cutoff = time.time() - INDEX_GC_GRACE_S
+    doomed: List[str] = []
+    kw: Dict[str, Any] = {"Bucket": VECTOR_INDEX_BUCKET, "Prefix": base}
+    while True:
+        r = s3.list_objects_v2(**kw)
+        for o in r.get("Contents") or []:
+            k = o["Key"]
+            if k in keep or k == f"{base}manifest.json" or k.startswith(f"{base}pending/"):
+                continue
+            lm = o.get("LastModified")
+            if lm is None or lm.timestamp() < cutoff:
+                doomed.append(k)
+        if not r.get("IsTruncated"):
+            break
+        kw["ContinuationToken"] = r["NextContinuationToken"]
+    for i in range(0, len(doomed), 1000):
+        s3.delete_objects(Bucket=VECTOR_INDEX_BUCKET, Delete={
+            "Objects": [{"Key": k} for k in doomed[i:i + 1000]], "Quiet": True})
+    return len(doomed)
+
+def _index_train(tenant: str) -> Dict[str, Any]:
+    """
+    Wartung (eigene Funktion, index_train): kleine Segmente mergen, IVF trainieren sobald
+    IVF_MIN_VECTORS erreicht bzw. neu trainieren nach IVF_RETRAIN_FACTOR-fachem Wachstum,
+    danach unreferenzierte Dateien aufräumen.
+    """
+    np = _np()
+    man, etag = _vi_manifest(tenant)
+    if not man["count"]:
+        return {"tenantId": tenant, "count": 0, "deleted": _vi_gc(tenant, man)}
+    dim, ivf = man["dim"], man.get("ivf")
+    written: List[str] = []
+    trained = False
+
+    if man["count"] >= IVF_MIN_VECTORS and (not ivf or man["count"] >= IVF_RETRAIN_FACTOR * ivf.get("trained_on", 0)):
+        centroids = _train_ivf(tenant, man)
+        ivf = {"centroids": f"ivf-{uuid.uuid4().hex[:8]}.f32", "lists": int(len(centroids)),
+               "trained_on": man["count"]}
+        _vi_put(tenant, ivf["centroids"], centroids.astype("<f4").tobytes())
+        written.append(ivf["centroids"])
+        for s in man["segments"]:
+            written.append(_assign_segment(tenant, s, _vi_matrix(tenant, f"{s['name']}.f32", s["rows"], dim),
+                                           ivf, centroids))
+        man["ivf"] = ivf
+        trained = True
+    else:
+        centroids = np.asarray(_vi_matrix(tenant, ivf["centroids"], ivf["lists"], dim)) if ivf else None
+
+    before = len(man["segments"])
+    merged_files = _merge_small_segments(tenant, man, centroids)
+    written += merged_files
+    if written and not _vi_commit(tenant, man, etag, written):
+        return {"tenantId": tenant, "conflict": True}
+    return {"tenantId": tenant, "count": man["count"], "segments": len(man["segments"]),
+            "merged": before - len(man["segments"]) + 1 if merged_files else 0,
+            "trained": trained, "lists": (man.get("ivf") or {}).get("lists"), "deleted": _vi_gc(tenant, man)}
+
+def _topk(scores, k: int):
+    np = _np()
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, k)[:k]
+    return part[np.argsort(-scores[part])]
+
+def _index_search(tenant: str, query: List[float], k: int, nprobe: Optional[int] = None) -> Dict[str, Any]:
+    np = _np()
+    man, _ = _vi_manifest(tenant)
+    if not man["count"]:
+        return {"results": [], "searched": 0, "mode": "empty"}
+    dim = man["dim"]
+    q = _normalize(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+    if len(q) != dim:
+        raise ValueError(f"query dim {len(q)} != index dim {dim}")
+
+    probe = None
+    if man.get("ivf"):
+        cent = _vi_matrix(tenant, man["ivf"]["centroids"], man["ivf"]["lists"], dim)
+        probe = _topk(np.asarray(cent @ q), min(nprobe or IVF_NPROBE, man["ivf"]["lists"]))
+
+    cand_scores, cand_refs, searched = [], [], 0
+    for si, s in enumerate(man["segments"]):
+        mat = _vi_matrix(tenant, f"{s['name']}.f32", s["rows"], dim)
+        if probe is not None:
+            order, offsets = _vi_lists(tenant, s, man["ivf"]["lists"])
+            rows = np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe]))
+            scores = np.asarray(mat[rows] @ q) if len(rows) else np.zeros(0, dtype=np.float32)
+        else:
+            rows = None
+            scores = np.concatenate([np.asarray(mat[i:i + SEARCH_CHUNK_ROWS] @ q)
+                                     for i in range(0, s["rows"], SEARCH_CHUNK_ROWS)])
+        searched += len(scores)
+        best = _topk(scores, k)
+        cand_scores.append(scores[best])
+        cand_refs.extend((si, int(rows[b]) if rows is not None else int(b)) for b in best)
+
+    all_scores = np.concatenate(cand_scores) if cand_scores else np.zeros(0)
+    # dieselbe Id kann in mehreren Segmenten liegen -> bestes Vorkommen behalten. Je Segment sind
+    # Ids eindeutig, daher enthalten die Top-k je Segment auch die Top-k eindeutigen Ids.
+    ids_cache: Dict[int, List[str]] = {}
+    results, seen = [], set()
+    for o in np.argsort(-all_scores, kind="stable"):
+        si, row = cand_refs[o]
+        if si not in ids_cache:
+            ids_cache[si] = _vi_ids(tenant, man["segments"][si])
+        doc = ids_cache[si][row]
+        if doc in seen:
+            continue
+        seen.add(doc)
+        results.append({"id": doc, "score": round(float(all_scores[o]), 6)})
+        if len(results) >= k:
+            break
+    return {"results": results, "searched": searched, "mode": "ivf" if probe is not None else "brute",
+            "count": man["count"]}
+
+def _vi_tenants(pending_only: bool = False) -> List[str]:
+    """Tenants mit Index-Prefix; pending_only: nur solche mit wartenden Pending-Vektoren."""
+    tenants, token = [], None
+    while True:
+        kw = {"Bucket": VECTOR_INDEX_BUCKET, "Prefix": VECTOR_INDEX_PREFIX, "Delimiter": "/"}
+        if token:
+            kw["ContinuationToken"] = token
+        r = s3.list_objects_v2(**kw)
+        tenants += [p["Prefix"][len(VECTOR_INDEX_PREFIX):].rstrip("/") for p in r.get("CommonPrefixes") or []]
+        token = r.get("NextContinuationToken")
+        if not token:
+            break
+    if not pending_only:
+        return tenants
+    return [t for t in tenants if s3.list_objects_v2(
+        Bucket=VECTOR_INDEX_BUCKET, Prefix=f"{_vi_base(t)}pending/", MaxKeys=1).get("Contents")]
+
+def _handle_index_action(action: str, d: Dict[str, Any], context=None) -> Dict[str, Any]:
+    if not VECTOR_INDEX_BUCKET:
+        return {"ok": False, "error": "VECTOR_INDEX_BUCKET not set"}
+    tenant = str(d.get("tenantId") or d.get("tenant_id") or "").strip()
+    if not tenant and action in ("index_flush", "index_train"):
+        # Schedule: alle (Flush: nur mit Pending) Tenants, solange Laufzeit übrig ist (Rest beim nächsten Lauf)
+        fn = _index_flush if action == "index_flush" else _index_train
+        done, errors = [], []
+        for t in _vi_tenants(pending_only=action == "index_flush"):
+            if context is not None and context.get_remaining_time_in_millis() < INDEX_FLUSH_MIN_REMAINING_MS:
+                break
+            try:
+                done.append(fn(t))
+            except Exception as e:
+                errors.append({"tenantId": t, "error": str(e)})
+        key = "flushed" if action == "index_flush" else "trained"
+        return {"ok": not errors, key: done, "errors": errors}
+    if not tenant:
+        return {"ok": False, "error": "tenantId required"}
+    try:
+        if action == "index_flush":
+            return {"ok": True, **_index_flush(tenant)}
+        if action == "index_train":
+            return {"ok": True, **_index_train(tenant)}
+
+        # search: Query als Vektor oder als Text (Text wird über den Cache embeddet)
+        query = d.get("vector")
+        if query is None:
+            text = str(d.get("text") or "").strip() or _pick_text(d)
+            if not text:
+                return {"ok": False, "tenantId": tenant, "error": "vector or text required"}
+            query = _embed_cached(text)[0]["vector"]
+        k = max(1, min(int(d.get("k") or 10), 1000))
+        return {"ok": True, "tenantId": tenant, **_index_search(tenant, query, k, d.get("nprobe")),
+                "cache": dict(_VI_CACHE_STATS)}
+    except Exception as e:
+        return {"ok": False, "tenantId": tenant, "error": str(e)}
+
+# ----------------------------
+# Chunking + Pooling (lange Texte)
+# ----------------------------
+# Kein Tokenizer im Paket: Schätzung über Wortstücke von max. 4 Zeichen + Satzzeichen.
+# Das liegt für Deutsch/Englisch leicht über den echten BPE-Zahlen, hält das Budget also ein.
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+_PARA_RE = re.compile(r"\n\s*\n")
+_SENT_RE = re.compile(r"(?<=[.!?…])\s+|\n")
+
+def _est_tokens(s: str) -> int:
+    return len(_TOKEN_RE.findall(s))
+
+def _split_hard(s: str, max_tokens: int) -> List[str]:
+    """Letzter Ausweg für Riesensätze: an Wortgrenzen (notfalls mitten im Wort) schneiden."""
+    out: List[str] = []
+    cur: List[str] = []
+    n = 0
+    for w in s.split():
+        t = _est_tokens(w)
+        while t > max_tokens:   # ein Wort allein sprengt das Budget (URLs, Base64 ...)
+            if cur:
+                out.append(" ".join(cur))
+                cur, n = [], 0
+            # an der Token-Grenze schneiden, nicht nach Zeichen: "-----" sind 1 Token je Zeichen
+            cut = [m.end() for m in _TOKEN_RE.finditer(w)][max_tokens - 1]
+            out.append(w[:cut])
+            w = w[cut:]
+            t = _est_tokens(w)
+        if n + t > max_tokens and cur:
+            out.append(" ".join(cur))
+            cur, n = [], 0
+        if w:
+            cur.append(w)
+            n += t
+    if cur:
+        out.append(" ".join(cur))
+    return out
+
+def _chunk_text(text: str, max_tokens: int) -> List[Tuple[str, int]]:
+    """
+    Zerlegt text in Chunks <= max_tokens: Absätze zusammenpacken, zu lange Absätze
+    an Satzgrenzen teilen, zu lange Sätze hart an Wortgrenzen. Rückgabe [(chunk, tokens)].
+    """
+    units: List[Tuple[str, int, str]] = []   # (text, tokens, Trenner zum Vorgänger)
+    for para in _PARA_RE.split(text):
+        para = para.strip()
+        if not para:
+            continue
+        t = _est_tokens(para)
+        if t <= max_tokens:
+            units.append((para, t, "\n\n"))
+            continue
+        first = True
+        for sent in _SENT_RE.split(para):
+            sent = sent.strip()
+            if not sent:
+                continue
+            parts = [sent] if _est_tokens(sent) <= max_tokens else _split_hard(sent, max_tokens)
+            for p in parts:
+                units.append((p, _est_tokens(p), "\n\n" if first else " "))
+                first = False
+
+    chunks: List[Tuple[str, int]] = []
+    cur, n = "", 0
+    for u, t, sep in units:
+        if cur and n + t > max_tokens:
+            chunks.append((cur, n))
+            cur, n = "", 0
+        cur = f"{cur}{sep}{u}" if cur else u
+        n += t
+    if cur:
+        chunks.append((cur, n))
+    return chunks
+
+def _pool(vecs: List[List[float]], weights: List[int]) -> List[float]:
+    """Längengewichteter Mittelwert, danach L2-normalisiert (wie die Einzel-Embeddings)."""
+    total = float(sum(weights)) or 1.0
+    acc = [0.0] * len(vecs[0])
+    for v, w in zip(vecs, weights):
+        f = w / total
+        for i, x in enumerate(v):
+            acc[i] += f * x
+    norm = math.sqrt(sum(x * x for x in acc)) or 1.0
+    return [x / norm for x in acc]
+
+def _embed_docs(texts: List[str]) -> Tuple[List[Tuple[Optional[Dict[str, Any]], Optional[str], Optional[str]]], int]:
+    """
+    Wie _embed_many, aber lange Texte werden gechunkt: alle Chunks aller Texte gehen
+    gemeinsam (parallel, gecacht) an _embed_many und werden danach je Text gepoolt.
+    Latenz ~ eine Welle paralleler Requests statt Summe über die Chunks.
+    out["chunks"] (nur bei > 1 Chunk): [{"tokens", "vector"}, ...] für den Vektor-Index.
+    """
+    per_doc = [_chunk_text(t, EMBED_CHUNK_TOKENS) or [(t, _est_tokens(t))] for t in texts]
+    flat = [c for chunks in per_doc for c, _ in chunks]
+    embedded, requests = _embed_many(flat)
+
+    out: List[Tuple[Optional[Dict[str, Any]], Optional[str], Optional[str]]] = []
+    pos = 0
+    for chunks in per_doc:
+        part = embedded[pos:pos + len(chunks)]
+        pos += len(chunks)
+        if len(part) == 1:
+            out.append(part[0])
+            continue
+        err = next((e for _, _, e in part if e), None)
+        if err:
+            out.append((None, None, f"chunk_failed: {err}"))
+            continue
+        vecs = [o["vector"] for o, _, _ in part]
+        weights = [t for _, t in chunks]
+        pooled = _pool(vecs, weights)
+        sources = {s for _, s, _ in part}
+        res: Dict[str, Any] = {"vector": pooled, "dim": len(pooled), "chunk_count": len(chunks)}
+        res["chunks"] = [{"tokens": t, "vector": v} for t, v in zip(weights, vecs)]
+        # Treffer nur, wenn alle Chunks aus dem Cache kamen
+        out.append((res, sources.pop() if len(sources) == 1 and None not in sources else None, None))
+    return out, requests
+
+def _index_entries(doc_id: str, out: Dict[str, Any]) -> Tuple[List[str], List[List[float]]]:
+    """Gepoolter Vektor unter doc_id, optional (EMBED_INDEX_CHUNKS) jeder Chunk als doc_id#<n>."""
+    ids, vecs = [doc_id], [out["vector"]]
+    if EMBED_INDEX_CHUNKS:
+        for i, c in enumerate(out.get("chunks") or []):
+            ids.append(f"{doc_id}#{i}")
+            vecs.append(c["vector"])
+    return ids, vecs
+
+# ----------------------------
+# Batch-Embedding
+# ----------------------------
+def _is_cohere() -> bool:
+    return "cohere.embed" in EMBED_MODEL.lower()
+
+def _embed_cohere_batch(texts: List[str]) -> List[List[float]]:
+    """Ein Request für bis zu COHERE_MAX_TEXTS Texte; Reihenfolge wie Eingabe."""
+    body: Dict[str, Any] = {"texts": texts, "input_type": "search_document"}
+    if EMBED_DIMENSIONS and "embed-v4" in EMBED_MODEL.lower():
+        body["output_dimension"] = EMBED_DIMENSIONS   # v3 liefert immer die volle Dimension
+    payload = _invoke_bedrock(body, sum(_est_tokens(t) for t in texts))
+    arr = payload.get("embeddings") or []
+    if len(arr) != len(texts):
+        raise RuntimeError(f"cohere returned {len(arr)} embeddings for {len(texts)} texts")
+    return arr
+
+def _embed_many(texts: List[str]) -> Tuple[List[Tuple[Optional[Dict[str, Any]], Optional[str], Optional[str]]], int]:
+    """
+    Embeddet viele Texte: identische Texte nur einmal, Cache zuerst, Rest
+    Cohere -> maximal gepackte Requests, Titan -> begrenzter Thread-Pool.
+    Rückgabe pro Eingabe (out, cache_source, error) + Anzahl Bedrock-Requests.
+    """
+    keys = [_cache_key(t) for t in texts]
+    uniq: Dict[str, str] = {}
+    for k, t in zip(keys, texts):
+        uniq.setdefault(k, t)
+
+    vecs: Dict[str, List[float]] = {}
+    source: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    # 1) Prozess-LRU
+    for k in uniq:
+        v = _MEM_CACHE.get(k)
+        if v is not None:
+            _MEM_CACHE.move_to_end(k)
+            vecs[k], source[k] = v, "memory"
+            _CACHE_STATS["memory"] += 1
+
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as ex:
+        # 2) persistenter Store (I/O parallel)
+        todo = [k for k in uniq if k not in vecs]
+        if todo and (EMBED_CACHE_BUCKET or EMBED_CACHE_SQLITE):
+            def store_get(k: str):
+                try:
+                    return _store_get(k)
+                except Exception as e:
+                    print(f"[cache] store get failed: {e}")
+                    return None, None
+            for k, (v, src) in zip(todo, ex.map(store_get, todo)):
+                if v is not None:
+                    vecs[k], source[k] = v, src
+                    _mem_put(k, v)
+                    _CACHE_STATS[src] += 1
+
+        # 3) Bedrock für den Rest
+        misses = [k for k in uniq if k not in vecs]
+        _CACHE_STATS["miss"] += len(misses)
+        fresh: Dict[str, List[float]] = {}
+        requests = 0
+        if _is_cohere():
+            chunks = [misses[i:i + COHERE_MAX_TEXTS] for i in range(0, len(misses), COHERE_MAX_TEXTS)]
+            def run_chunk(chunk: List[str]):
+                try:
+                    return chunk, _embed_cohere_batch([uniq[k] for k in chunk]), None
+                except Exception as e:
+                    return chunk, None, str(e)
+            for chunk, arr, err in ex.map(run_chunk, chunks):
+                requests += 1
+                for i, k in enumerate(chunk):
+                    if err:
+                        errors[k] = err
+                    else:
+                        fresh[k] = arr[i]
+        else:
+            def run_one(k: str):
+                try:
+                    return k, _embed(uniq[k])["vector"], None
+                except Exception as e:
+                    return k, None, str(e)
+            for k, v, err in ex.map(run_one, misses):
+                requests += 1
+                if err:
+                    errors[k] = err
+                else:
+                    fresh[k] = v
+
+        # 4) Cache füllen (Store parallel)
+        for k, v in fresh.items():
+            vecs[k] = v
+            if v:
+                _mem_put(k, v)
+        list(ex.map(lambda kv: _store_put(*kv), [(k, v) for k, v in fresh.items() if v]))
+
+    out = []
+    for k in keys:
+        if k in errors:
+            out.append((None, None, errors[k]))
+        else:
+            v = vecs[k]
+            out.append(({"vector": v, "dim": len(v)}, source.get(k), None))
+    return out, requests
+
+def _unwrap_item(x: Any) -> Any:
+    # lambda:invoke-Ergebnisse aus Step Functions liegen unter "Payload"
+    if isinstance(x, dict) and isinstance(x.get("Payload"), dict):
+        x = x["Payload"]
+    return _take_detail(x) if isinstance(x, dict) else x
+
+def _batch_items(event: Any) -> Optional[Tuple[str, List[Tuple[str, Any]]]]:
+    """
+    Erkennt Batch-Events und liefert (source, [(item_id, payload), ...]):
+      - SQS:  { Records: [ { messageId, body: "<json>" }, ... ] }
+      - Map:  [ payload, ... ]  oder  { Items: [...] } (ItemBatcher) / { items: [...] }
+    Kein Batch -> None.
+    """
+    if isinstance(event, list):
+        return "map", [(str(i), _unwrap_item(x)) for i, x in enumerate(event)]
+    if not isinstance(event, dict):
+        return None
+    recs = event.get("Records")
+    if isinstance(recs, list) and recs and all(isinstance(r, dict) and r.get("eventSource") == "aws:sqs" for r in recs):
+        out = []
+        for i, r in enumerate(recs):
+            try:
+                body = json.loads(r.get("body") or "")
+            except Exception:
+                body = None
+            out.append((str(r.get("messageId") or i), _unwrap_item(body)))
+        return "sqs", out
+    items = event.get("Items") if isinstance(event.get("Items"), list) else event.get("items")
+    if isinstance(items, list) and not event.get("action"):
+        return "map", [(str(i), _unwrap_item(x)) for i, x in enumerate(items)]
+    return None
+
+def _batch_failures(results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Partial Batch Response (ReportBatchItemFailures): nur vorübergehende Fehler (retryable)
+    erneut zustellen. Dauerhafte Fehler würden bis maxReceiveCount kreisen und in der DLQ
+    landen, ohne dass ein Retry etwas ändert -> loggen und quittieren.
+    """
+    out = []
+    for r in results:
+        if r.get("ok"):
+            continue
+        if r.get("retryable"):
+            out.append({"itemIdentifier": r["id"]})
+        else:
+            print(f"[batch] permanent failure, acknowledged: id={r.get('id')} error={r.get('error')}")
+    return out
+
+def _embed_error_retryable(err: str) -> bool:
+    # ValidationException: Eingabe selbst ungültig -> erneute Zustellung ändert nichts.
+    # Throttling/Deadline/S3 dagegen schon.
+    return "ValidationException" not in err
+
+def _handle_batch(source: str, items: List[Tuple[str, Any]]) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    idxs: List[int] = []
+    texts: List[str] = []
+    for idx, (item_id, payload) in enumerate(items):
+        if not isinstance(payload, dict):
+            results[idx] = {"id": item_id, "ok": False, "error": "invalid_payload", "retryable": False}
+            continue
+        tenant = payload.get("tenantId") or payload.get("tenant_id") or "unknown"
+        text = _pick_text(payload)
+        results[idx] = {"id": item_id, "tenantId": tenant}
+        if not text:
+            results[idx].update(ok=False, error="no_text_for_embedding", retryable=False)
+            continue
+        idxs.append(idx)
+        texts.append(text)
+
+    # Near-Duplicates: Vektor des Originals übernehmen, nur der Rest geht an Bedrock
+    reused: Dict[int, List[float]] = {}
+    if EMBED_REUSE_DUPLICATES and idxs:
+        with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as ex:
+            for idx, vec in zip(idxs, ex.map(lambda i: _reuse_duplicate(items[i][1]), idxs)):
+                if vec is not None:
+                    reused[idx] = vec
+    todo = [(idx, text) for idx, text in zip(idxs, texts) if idx not in reused]
+    fresh, requests = _embed_docs([t for _, t in todo]) if todo else ([], 0)
+    by_idx = dict(zip([idx for idx, _ in todo], fresh))
+    embedded = [({"vector": reused[idx], "dim": len(reused[idx])}, "duplicate", None) if idx in reused
+                else by_idx[idx] for idx in idxs]
+    if EMBED_REUSE_DUPLICATES:
+        with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as ex:
+            list(ex.map(lambda e: _remember_doc(items[e[0]][1], e[1][0]["vector"]),
+                        [(idx, e) for idx, e in zip(idxs, embedded) if not e[2] and e[1] != "duplicate"]))
+
+    for idx, (out, hit, err) in zip(idxs, embedded):
+        if err:
+            results[idx].update(ok=False, error=err, retryable=_embed_error_retryable(err))
+            continue
+        results[idx].update(ok=True, chunks=out.get("chunk_count", 1), cache={"hit": hit is not None, "source": hit})
+
+    # Claim-Checks parallel schreiben (ein PUT je Vektor)
+    def attach(entry: Tuple[int, str, Tuple[Optional[Dict[str, Any]], Optional[str], Optional[str]]]):
+        idx, text, (out, _, err) = entry
+        if err:
+            return
+        try:
+            results[idx]["embedding"] = _embedding_payload(results[idx]["tenantId"], text, out)
+        except Exception as e:
+            results[idx].update(ok=False, error=f"vector_store_failed: {e}", retryable=True)
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as ex:
+        list(ex.map(attach, zip(idxs, texts, embedded)))
+
+    # Vektor-Index: ein Pending-Objekt je Tenant; Fehler hier kosten nur die Indexierung
+    if VECTOR_INDEX_BUCKET:
+        by_tenant: Dict[str, Tuple[List[str], List[List[float]]]] = {}
+        for idx, text, (out, _, err) in zip(idxs, texts, embedded):
+            if err or not results[idx].get("ok") or not out["vector"]:
+                continue
+            ids, vecs = by_tenant.setdefault(results[idx]["tenantId"], ([], []))
+            more_ids, more_vecs = _index_entries(_doc_id(items[idx][1], _cache_key(text)), out)
+            ids.extend(more_ids)
+            vecs.extend(more_vecs)
+        for tenant, (ids, vecs) in by_tenant.items():
+            try:
+                _index_enqueue(tenant, ids, vecs)
+            except Exception as e:
+                print(f"[index] enqueue failed for {tenant}: {e}")
+
+    failed = [r for r in results if not r.get("ok")]
+    out: Dict[str, Any] = {
+        "ok": not failed,
+        "model": EMBED_MODEL,
+        "count": len(results),
+        "embedded": len(results) - len(failed),
+        "failed": len(failed),
+        "unique_texts": len(set(texts)),
+        "bedrock_requests": requests,
+        "cache": dict(_CACHE_STATS),
+        "bedrock": _bedrock_stats(),
+        "results": results,
+    }
+    if source == "sqs":
+        out["batchItemFailures"] = _batch_failures(results)
+    return out
+
 def lambda_handler(event, context):
+    """
+    Einzeln: { tenantId, normalized.text_for_embedding, ... } (auch EventBridge-Wrapper)
+    Batch:   [payload, ...] | { items|Items: [...] } | SQS { Records: [...] }
+    Index:   { action: "index_flush"|"index_train", tenantId? } | { action: "search", tenantId, vector|text, k?, nprobe? }
+    """
+    if isinstance(event, dict) and event.get("action") in ("index_flush", "index_train", "search"):
+        return _handle_index_action(event["action"], event, context)
+
+    batch = _batch_items(event)
+    if batch is not None:
+        return _handle_batch(*batch)
+
     d = _take_detail(event)
     tenant = (d.get("tenantId") or d.get("tenant_id") or "unknown")
 
@@ -87,15 +1356,36 @@ def lambda_handler(event, context):
         }
 
     try:
-        out = _embed(text)
+        reused = _reuse_duplicate(d)
+        if reused is not None:
+            out, hit = {"vector": reused, "dim": len(reused)}, "duplicate"
+        elif _est_tokens(text) <= EMBED_CHUNK_TOKENS:
+            out, hit = _embed_cached(text)
+        else:
+            ((out, hit, err),), _ = _embed_docs([text])
+            if err:
+                raise RuntimeError(err)
+        _remember_doc(d, out["vector"])
+        indexed = False
+        if VECTOR_INDEX_BUCKET and out["vector"]:
+            try:
+                _index_enqueue(tenant, *_index_entries(_doc_id(d, _cache_key(text)), out))
+                indexed = True
+            except Exception as e:
+                print(f"[index] enqueue failed for {tenant}: {e}")
         return {
             "ok": True,
             "tenantId": tenant,
             "model": EMBED_MODEL,
-            "embedding": {
-                "dim": out["dim"],
-                "vector": out["vector"]  # groß! In Prod evtl. nicht loggen
+            "embedding": _embedding_payload(tenant, text, out),
+            "chunks": out.get("chunk_count", 1),
+            "cache": {
+                "hit": hit is not None,
+                "source": hit,                 # memory | s3 | sqlite | duplicate | None
+                "stats": dict(_CACHE_STATS),
             },
+            "indexed": indexed,                # in pending/, sichtbar nach index_flush
+            "bedrock": _bedrock_stats(),       # Throttles/Retries/Latenz-Histogramm je Modell
             "source": {
                 "text": text[:5000]  # für Debug/Tracing begrenzen
             }
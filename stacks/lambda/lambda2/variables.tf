@@ -31,6 +31,33 @@ variable "bedrock_model_id" {
   default = "amazon.titan-embed-text-v2:0"
 }
 
+# Ausgabedimension (0 = Modell-Default; Titan v2: 256 | 512 | 1024)
+variable "embed_dimensions" { type = number, default = 0 }
+
+# Bedrock-Budget pro Container (Account-Quota / erwartete parallele Instanzen; 0 = ohne Limiter)
+variable "bedrock_rps" { type = number, default = 0 }
+variable "bedrock_tpm" { type = number, default = 0 }
+
+# Embedding-Cache in S3 (leer = nur Prozess-LRU)
+variable "embed_cache_bucket" { type = string, default = "" }
+variable "embed_cache_prefix" { type = string, default = "embeddings/cache/" }
+
+# Vektor-Claim-Check (leer = Floatliste inline in der Antwort)
+variable "vector_bucket" { type = string, default = "" }
+variable "vector_prefix" { type = string, default = "embeddings/vectors/" }
+variable "vector_dtype"  { type = string, default = "float32" }   # float32 | float16 | int8
+
+# Vektor-Index pro Tenant (leer = aus); Suche braucht NumPy (Lambda-Layer)
+variable "vector_index_bucket"  { type = string, default = "" }
+variable "vector_index_prefix"  { type = string, default = "embeddings/index/" }
+variable "index_flush_schedule" { type = string, default = "rate(5 minutes)" }
+variable "layers"               { type = list(string), default = [] }   # ARN des NumPy-Layers
+variable "index_train_schedule" { type = string, default = "rate(1 hour)" }   # Merge + IVF-Training + GC (eigene Funktion)
+variable "index_train_memory_size" { type = number, default = 3008 }
+variable "index_train_timeout"     { type = number, default = 900 }
+variable "index_search_memory_size" { type = number, default = 2048 }  # eigene Such-Funktion (<name>-index-search)
+variable "index_search_timeout"     { type = number, default = 30 }
+
 # VPC (falls Lambda2 in VPC laufen soll → hier true + IDs setzen)
 variable "attach_vpc_access"  { type = bool, default = false }
 variable "subnet_ids"         { type = list(string), default = [] }
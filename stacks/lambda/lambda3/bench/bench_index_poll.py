@@ -0,0 +1,85 @@
+"""
+Lokaler Benchmark: übertragene Bytes pro Dashboard-Poll auf files.json,
+vorher (INDEX_GZIP=0, Client lädt jedes Mal komplett) vs. nachher (gzip + If-None-Match -> 304).
+
+  python stacks/lambda/lambda3/bench/bench_index_poll.py
+
+Simuliert BENCH_MINUTES Minuten: alle BENCH_POLL_S Sekunden ein Poll, BENCH_WRITES_PER_H
+neue Items pro Stunde über _index_ki_items (legacy-Modus, Index vorab mit ROLLING_LIMIT Items
+gefüllt). S3 ist ein In-Memory-Client mit ETag = MD5(Body) und 304 bei passendem IfNoneMatch;
+gezählt werden Body-Bytes (Header sind in beiden Varianten gleich).
+"""
+import os, io, sys, hashlib, random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("KI_INDEX_MODE", "legacy")
+import lambda_function as L
+from botocore.exceptions import ClientError
+
+MINUTES = int(os.environ.get("BENCH_MINUTES", "60"))
+POLL_S = int(os.environ.get("BENCH_POLL_S", "5"))
+WRITES_PER_H = int(os.environ.get("BENCH_WRITES_PER_H", "60"))
+BUCKET, TENANT = "bench-bucket", "t-bench"
+
+class _MemS3:
+    def __init__(self):
+        self.objects: dict = {}
+
+    def put_object(self, Bucket, Key, Body, **kw):
+        self.objects[Key] = (Body, '"%s"' % hashlib.md5(Body).hexdigest(), kw.get("ContentEncoding"))
+        return {}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body, etag, enc = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}}, "GetObject")
+        return {"Body": io.BytesIO(body), "ETag": etag, "ContentEncoding": enc}
+
+def _item(i: int, ts: datetime):
+    key = f"tenants/{TENANT}/{L.PDF_TENANT_SUBFOLDER}/{ts:%Y/%m/%d}/mail-{i:06d}-{random.getrandbits(48):012x}.pdf"
+    return L._ki_item(out_bucket=BUCKET, file_key=key, title=f"Rechnung {i} / Lieferung KW{i % 52}",
+                      size=20000 + i, content_type="application/pdf",
+                      created_at_iso=ts.isoformat() + "Z", direct_cf_url=f"https://cdn.example.com/{key}")
+
+def _run(gzip_on: bool, conditional: bool):
+    random.seed(16)
+    L.INDEX_GZIP = gzip_on
+    L.s3 = _MemS3()
+    t0 = datetime(2026, 10, 18, 8, 0, 0)
+    L._index_ki_items(BUCKET, TENANT, [_item(i, t0) for i in range(L.ROLLING_LIMIT)])
+    key = L._ki_rolling_key(TENANT)
+
+    every = max(1, 3600 // WRITES_PER_H // POLL_S)   # Polls zwischen zwei Writes
+    n = L.ROLLING_LIMIT
+    polls = full = not_modified = total = 0
+    etag = None
+    for p in range(MINUTES * 60 // POLL_S):
+        if p and p % every == 0:
+            L._index_ki_items(BUCKET, TENANT, [_item(n, t0 + timedelta(seconds=p * POLL_S))])
+            n += 1
+        polls += 1
+        try:
+            r = L.s3.get_object(Bucket=BUCKET, Key=key, IfNoneMatch=etag if conditional else None)
+            total += len(r["Body"].read())
+            etag = r["ETag"]
+            full += 1
+        except ClientError:
+            not_modified += 1
+    return polls, full, not_modified, total
+
+def main():
+    print(f"{MINUTES} min, Poll alle {POLL_S}s, {WRITES_PER_H} Writes/h, files.json mit {L.ROLLING_LIMIT} Items")
+    base = None
+    for name, gz, cond in (("vorher (plain, ohne ETag)", False, False),
+                           ("nur gzip", True, False),
+                           ("nachher (gzip + If-None-Match)", True, True)):
+        polls, full, nm, total = _run(gz, cond)
+        base = base or total
+        print(f"{name:>32}: {polls} Polls, {full} x 200, {nm} x 304, {total / 1024:9.1f} KB gesamt, "
+              f"{total / polls:8.0f} B/Poll, {base / max(total, 1):6.1f}x weniger")
+
+if __name__ == "__main__":
+    main()
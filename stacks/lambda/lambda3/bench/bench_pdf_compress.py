@@ -0,0 +1,40 @@
+"""
+Lokaler Benchmark: PDF-Größe und Erzeugungszeit je Dokument für
+unkomprimiert / FlateDecode (PDF_COMPRESS) / FlateDecode + Object-Streams (PDF_OBJECT_STREAMS).
+
+  python stacks/lambda/lambda3/bench/bench_pdf_compress.py
+
+Korpus: typische Mail-Längen (2 KB bis 2 MB Text); Level = PDF_COMPRESS_LEVEL.
+"""
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import lambda_function as L
+from bench_pdf_layout import FIELDS, _body
+
+SIZES_KB = [int(x) for x in os.environ.get("BENCH_SIZES_KB", "2,20,200,2000").split(",")]
+REPEAT = int(os.environ.get("BENCH_REPEAT", "3"))
+MODES = (("plain", False, False), ("flate", True, False), ("flate+objstm", True, True))
+
+def _run(body: str, compress: bool, objstm: bool):
+    best, pdf = None, b""
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        pdf = L._make_pdf_bytes("Benchmark", FIELDS, body, compress=compress, object_streams=objstm)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return len(pdf), best
+
+def main():
+    print(f"level={L.PDF_COMPRESS_LEVEL}")
+    print(f"{'body':>7} {'mode':>13} {'bytes':>10} {'ratio':>6} {'ms':>8}")
+    for kb in SIZES_KB:
+        body = _body(kb * 1024)
+        base = None
+        for name, compress, objstm in MODES:
+            size, dt = _run(body, compress, objstm)
+            base = base or size
+            print(f"{kb:>5}KB {name:>13} {size:>10} {base / size:>5.1f}x {dt * 1000:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Lokaler Benchmark: PDF-Layout (_make_pdf_bytes) über Body-Größen von 1 KB bis 5 MB.
+
+  python stacks/lambda/lambda3/bench/bench_pdf_layout.py
+
+Misst je Größe Laufzeit (bestes von BENCH_REPEAT), Seitenzahl, PDF-Größe und Peak-Speicher
+(tracemalloc) ohne Kompression, damit nur Umbruch/Paginierung/Serialisierung zählen.
+Linear heißt: µs/KB und Peak/Body bleiben über alle Größen etwa konstant.
+"""
+import os, sys, time, random, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import lambda_function as L
+
+SIZES_KB = [int(x) for x in os.environ.get("BENCH_SIZES_KB", "1,10,100,1000,5000").split(",")]
+REPEAT = int(os.environ.get("BENCH_REPEAT", "3"))
+
+_WORDS = ("Rechnung Lieferung bitte Termin Angebot Rückfrage Anhang Vertrag Kunde Projekt "
+          "the invoice attached meeting schedule please confirm order shipment regards "
+          "Übergabeprotokoll Sachbearbeitung 2026-10-18 EUR 1.234,56 https://example.com/a/b?c=d").split()
+
+def _body(n_bytes: int) -> str:
+    rnd = random.Random(11)
+    parts, size = [], 0
+    while size < n_bytes:
+        para = " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(20, 120)))
+        parts.append(para)
+        size += len(para.encode("utf-8")) + 2
+    return "\n\n".join(parts)[:n_bytes]
+
+FIELDS = {"From": "kunde@example.com", "To": "support@example.com", "Subject": "Benchmark", "Date": "2026-10-18"}
+
+def main():
+    print(f"{'body':>8} {'pages':>6} {'pdf':>10} {'ms':>9} {'µs/KB':>7} {'peak':>10} {'peak/body':>9}")
+    for kb in SIZES_KB:
+        body = _body(kb * 1024)
+        best = None
+        for _ in range(REPEAT):
+            t0 = time.perf_counter()
+            pdf = L._make_pdf_bytes("Benchmark", FIELDS, body, compress=False, object_streams=False)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        tracemalloc.start()
+        L._make_pdf_bytes("Benchmark", FIELDS, body, compress=False, object_streams=False)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        pages = pdf.count(b"/Type /Page ")
+        print(f"{kb:>6}KB {pages:>6} {len(pdf) / 1024:>8.0f}KB {best * 1000:>9.1f} {best * 1e6 / kb:>7.0f} "
+              f"{peak / 1048576:>8.1f}MB {peak / len(body.encode('utf-8')):>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,7 @@ module "lambda3" {
       KI_RESULTS_ROLLING_LIMIT = tostring(var.ki_results_rolling_limit)
       PRESIGN_EXPIRES       = tostring(var.presign_expires)
       USE_PRESIGNED         = var.use_presigned ? "1" : "0"
+      KI_INDEX_MODE         = var.ki_index_mode
     },
     var.extra_env
   )
@@ -42,6 +43,12 @@ module "lambda3" {
   api_gateway_ids   = var.api_gateway_ids
   api_resource_path = var.api_resource_path
   api_methods       = var.api_methods
+
+  # Index-Compactor (nur der Segment-Index braucht ihn)
+  index_compaction_schedule = var.ki_index_mode == "segments" ? var.index_compaction_schedule : ""
+
+  # List/Delete für Segment-Index + Key-Migration (legacy braucht nur Get/Put)
+  index_bucket = var.ki_index_mode == "segments" || lookup(var.extra_env, "KEY_SHARD_CHARS", "0") != "0" ? var.output_bucket : ""
 }
 
 output "lambda_function_arn" { value = module.lambda3.lambda_function_arn }
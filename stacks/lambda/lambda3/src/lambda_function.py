@@ -1,12 +1,22 @@
 # lambda_function.py
 import os
+import re
 import json
+import gzip
 import time
+import hashlib
+import threading
+import uuid
+import random
+import zlib
+from collections import OrderedDict, deque
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, Tuple, List, Optional
 
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 
 # ----------------------------
 # Konfiguration über Env-Vars
@@ -25,7 +35,42 @@ ROLLING_LIMIT         = int(os.getenv("KI_RESULTS_ROLLING_LIMIT", "200"))
 PRESIGN_EXPIRES       = int(os.getenv("PRESIGN_EXPIRES", "600"))
 USE_PRESIGNED_URL     = os.getenv("USE_PRESIGNED", "0") == "1"  # 1 = S3 presigned statt CF-Domain
 
-s3 = boto3.client("s3")
+# Index-Auslieferung: gzip + kurze max-age statt no-store (Dashboards pollen per If-None-Match)
+INDEX_GZIP            = os.getenv("INDEX_GZIP", "1") == "1"
+INDEX_MAX_AGE         = int(os.getenv("INDEX_MAX_AGE", "5"))            # Sekunden
+INDEX_CACHE_CONTROL   = f"public, max-age={INDEX_MAX_AGE}, must-revalidate"
+
+# Index-Format: "segments" (append-only + Compactor) oder "legacy" (Read-Modify-Write).
+# segments braucht s3:ListBucket/DeleteObject (Modul: index_bucket), daher per Default legacy.
+KI_INDEX_MODE         = os.getenv("KI_INDEX_MODE", "legacy").strip().lower()
+KI_INDEX_DIR          = "_index"
+KI_COMPACT_MAX_SEGMENTS      = int(os.getenv("KI_COMPACT_MAX_SEGMENTS", "500"))    # pro Tenant und Lauf
+KI_COMPACT_MIN_REMAINING_MS  = int(os.getenv("KI_COMPACT_MIN_REMAINING_MS", "1500"))  # Restzeit, ab der keine Tenants mehr begonnen werden
+KI_INDEX_READ_WORKERS        = int(os.getenv("KI_INDEX_READ_WORKERS", "16"))
+
+# PDF-Ausgabe
+PDF_COMPRESS          = os.getenv("PDF_COMPRESS", "1") == "1"          # Content-Streams mit FlateDecode
+PDF_COMPRESS_LEVEL    = int(os.getenv("PDF_COMPRESS_LEVEL", "6"))      # zlib-Level 1..9
+PDF_OBJECT_STREAMS    = os.getenv("PDF_OBJECT_STREAMS", "0") == "1"    # PDF 1.5 Object-Stream + XRef-Stream
+
+# Dedup über Inhalts-Hash der Render-Eingaben
+PDF_DEDUP             = os.getenv("PDF_DEDUP", "1") == "1"
+PDF_DEDUP_CACHE_MAX   = int(os.getenv("PDF_DEDUP_CACHE_MAX", "2048"))   # Hash -> Key im Prozess-Cache
+# Near-Duplicates (Lambda1 duplicate_of): PDF des Originals verlinken statt neu rendern.
+# Aus per Default: das verlinkte PDF zeigt den Inhalt des Originals, nicht der neuen Mail.
+PDF_REUSE_DUPLICATES  = os.getenv("PDF_REUSE_DUPLICATES", "0") == "1"
+
+# API Gateway: Claim mit der Tenant-Id (Cognito: claims, HTTP-API: jwt.claims, Lambda-Authorizer: context)
+API_TENANT_CLAIM      = os.getenv("API_TENANT_CLAIM", "custom:tenantId")
+
+# Key-Sharding gegen Hot-Prefixes (0 = aus), siehe _physical_key
+KEY_SHARD_CHARS       = int(os.getenv("KEY_SHARD_CHARS", "0"))
+MIGRATE_PAGE_SIZE     = int(os.getenv("MIGRATE_PAGE_SIZE", "200"))
+
+# Batch-Modus: Render/Upload-Threads teilen sich den Connection-Pool des S3-Clients
+BATCH_WORKERS         = int(os.getenv("BATCH_WORKERS", "8"))
+
+s3 = boto3.client("s3", config=Config(max_pool_connections=max(BATCH_WORKERS, KI_INDEX_READ_WORKERS, 10)))
 
 # ----------------------------
 # Utilities
@@ -60,160 +105,288 @@ def _to_pdf_ascii(s: str) -> str:
     # PDF-Standardfont (Helvetica) ist Latin-1: non-latin1 Zeichen ersetzen
     return s.encode("latin-1", "replace").decode("latin-1")
 
-def _split_lines(s: str, width: int = 95) -> List[str]:
-    out, cur = [], ""
-    for word in s.split():
-        if len(cur) + len(word) + 1 > width:
-            out.append(cur.rstrip())
-            cur = word + " "
-        else:
-            cur += word + " "
-    if cur.strip():
-        out.append(cur.rstrip())
-    return out or [""]
-
 # ----------------------------
-# Minimaler PDF-Generator
+# Helvetica-Metriken (WinAnsiEncoding, Breiten in 1/1000 em aus der Standard-AFM)
 # ----------------------------
-def _make_pdf_bytes(title: str, fields: Dict[str, str], body: str) -> bytes:
+_HELVETICA_WIDTHS: List[int] = (
+    [0] * 32
+    + [278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,   # 32-47
+       556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,   # 48-63
+       1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,  # 64-79
+       667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,   # 80-95
+       333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,   # 96-111
+       556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584, 278]   # 112-127
+    + [556] * 32                                                                          # 128-159 (C1)
+    + [278, 333, 556, 556, 556, 556, 260, 556, 333, 737, 370, 556, 584, 333, 737, 333,   # 160-175
+       400, 584, 333, 333, 333, 556, 537, 278, 333, 333, 365, 556, 834, 834, 834, 611,   # 176-191
+       667, 667, 667, 667, 667, 667, 1000, 722, 667, 667, 667, 667, 278, 278, 278, 278,  # 192-207
+       722, 722, 778, 778, 778, 778, 778, 584, 778, 722, 722, 722, 722, 667, 667, 611,   # 208-223
+       556, 556, 556, 556, 556, 556, 889, 500, 556, 556, 556, 556, 278, 278, 278, 278,   # 224-239
+       556, 556, 556, 556, 556, 556, 556, 584, 611, 556, 556, 556, 556, 500, 556, 500]   # 240-255
+)
+
+def _text_width(s: str, size: float) -> float:
+    """Gerenderte Breite in pt (s ist bereits Latin-1, siehe _to_pdf_ascii)."""
+    w = _HELVETICA_WIDTHS
+    return sum(w[ord(ch)] for ch in s) * size / 1000.0
+
+def _wrap_text(s: str, size: float, max_width: float) -> List[str]:
     """
-    Erzeugt eine einfache PDF-Seite mit Titel + Key/Value Feldern + Body-Text.
-    Ohne externe Libs, nur ein einfacher PDF-Stream.
+    Umbruch nach gerenderter Breite statt Zeichenanzahl. Zeilenumbrüche im Text
+    bleiben erhalten, Wörter breiter als max_width werden hart getrennt.
+    Linear in len(s), jedes Wort wird genau einmal vermessen.
     """
-    # Inhalte vorbereiten (ASCII/Latin-1)
-    title = _to_pdf_ascii(title or "Email Analysis")
+    w = _HELVETICA_WIDTHS
+    limit = max_width * 1000.0 / size        # Vergleich in AFM-Einheiten
+    space = w[32]
+    out: List[str] = []
+    for para in s.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        cur: List[str] = []
+        cur_w = 0
+        for word in para.replace("\t", "    ").split():
+            ww = sum(w[ord(ch)] for ch in word)
+            if cur and cur_w + space + ww <= limit:
+                cur.append(word)
+                cur_w += space + ww
+                continue
+            if cur:
+                out.append(" ".join(cur))
+                cur, cur_w = [], 0
+            while ww > limit:                # Überlänge (URLs, Base64 ...) hart trennen
+                acc, i = 0, 0
+                while i < len(word) and acc + w[ord(word[i])] <= limit:
+                    acc += w[ord(word[i])]
+                    i += 1
+                i = max(i, 1)
+                out.append(word[:i])
+                word = word[i:]
+                ww -= acc if acc else w[ord(out[-1][0])]
+            if word:
+                cur, cur_w = [word], ww
+        out.append(" ".join(cur))
+    return out or [""]
+
+# ----------------------------
+# Minimaler PDF-Generator (mehrseitig)
+# ----------------------------
+# Seitengeometrie (Letter) und Typografie
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+PAGE_MARGIN = 72
+TITLE_SIZE, TITLE_GAP = 18, 30
+BODY_SIZE, BODY_LEADING = 10, 12
+
+def _pdf_esc(s: str) -> str:
+    """Escape für PDF-Textobjekt."""
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _layout_lines(fields: Dict[str, str], body: str) -> List[str]:
+    text_width = PAGE_WIDTH - 2 * PAGE_MARGIN
     lines: List[str] = []
     for k, v in fields.items():
+        prefix = f"{k}: "
         v = _to_pdf_ascii(v or "")
-        for i, seg in enumerate(_split_lines(v, 100)):
-            prefix = f"{k}: " if i == 0 else "    "
-            lines.append(prefix + seg)
+        segs = _wrap_text(v, BODY_SIZE, text_width - _text_width(prefix, BODY_SIZE))
+        for i, seg in enumerate(segs):
+            lines.append((prefix if i == 0 else "    ") + seg)
     if body:
-        body = _to_pdf_ascii(body)
         lines.append("")  # Leerzeile
         lines.append("Body:")
-        lines.extend(_split_lines(body, 100))
-
-    # Escape für PDF-Textobjekt
-    def esc(s: str) -> str:
-        return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
-
-    # Seitengeometrie
-    width, height = 612, 792  # Letter
-    start_y = height - 72
-    lh_title = 20
-
-    # Text-Stream bauen
-    content_lines = []
-    content_lines.append("BT")
-    content_lines.append("/F1 18 Tf")
-    content_lines.append(f"72 {start_y} Td")
-    content_lines.append(f"({esc(title)}) Tj")
-    y = start_y - (lh_title + 10)
-
-    content_lines.append("ET")
-    content_lines.append("BT")
-    content_lines.append("/F1 10 Tf")
-    content_lines.append("12 TL")                 # Leading setzen
-    content_lines.append(f"72 {y} Td")
-
-    # Zeilen schreiben
-    for i, ln in enumerate(lines):
-        if i == 0:
-            content_lines.append(f"({esc(ln)}) Tj")
-        else:
-            content_lines.append("T*")
-            content_lines.append(f"({esc(ln)}) Tj")
+        lines.extend(_wrap_text(_to_pdf_ascii(body), BODY_SIZE, text_width))
+    return lines
 
-    content_lines.append("ET")
+def _paginate(lines: List[str]) -> List[List[str]]:
+    """Verteilt die Zeilen auf Seiten; Seite 1 trägt zusätzlich den Titel."""
+    top = PAGE_HEIGHT - PAGE_MARGIN
+    first_cap = int((top - TITLE_GAP - PAGE_MARGIN) // BODY_LEADING) + 1
+    other_cap = int((top - PAGE_MARGIN) // BODY_LEADING) + 1
+    pages = [lines[:first_cap]]
+    for i in range(first_cap, len(lines), other_cap):
+        pages.append(lines[i:i + other_cap])
+    return pages
 
-    content_stream = ("\n".join(content_lines) + "\n").encode("latin-1", "replace")
-    stream_len = len(content_stream)
+def _page_content(title: Optional[str], lines: List[str]) -> bytes:
+    top = PAGE_HEIGHT - PAGE_MARGIN
+    out: List[str] = []
+    y = top
+    if title is not None:
+        out += ["BT", f"/F1 {TITLE_SIZE} Tf", f"{PAGE_MARGIN} {top} Td", f"({_pdf_esc(title)}) Tj", "ET"]
+        y = top - TITLE_GAP
+    out += ["BT", f"/F1 {BODY_SIZE} Tf", f"{BODY_LEADING} TL", f"{PAGE_MARGIN} {y} Td"]  # Leading setzen
+    for i, ln in enumerate(lines):
+        if i:
+            out.append("T*")
+        out.append(f"({_pdf_esc(ln)}) Tj")
+    out.append("ET")
+    return ("\n".join(out) + "\n").encode("latin-1", "replace")
+
+def _stream_obj(dict_extra: str, data: bytes, compress: bool) -> Tuple[bytes, bytes]:
+    """(Dictionary, Stream-Daten) eines Stream-Objekts; optional FlateDecode."""
+    if compress:
+        data = zlib.compress(data, PDF_COMPRESS_LEVEL)
+        dict_extra += " /Filter /FlateDecode"
+    return f"<<{dict_extra} /Length {len(data)} >>\n".encode("ascii"), data
 
-    # PDF-Objekte bauen
+def _serialize_classic(objs: List[Tuple[bytes, Optional[bytes]]]) -> bytes:
+    """PDF 1.4: alle Objekte direkt im Body, klassische xref-Tabelle."""
     pdf_parts: List[bytes] = []
     xref_offsets: List[int] = []
+    pos = 0
 
     def w(b: bytes):
+        nonlocal pos
         pdf_parts.append(b)
-
-    def mark():
-        xref_offsets.append(sum(len(p) for p in pdf_parts))
+        pos += len(b)
 
     w(b"%PDF-1.4\n%\xE2\xE3\xCF\xD3\n")
-
-    # 1: Catalog
-    mark()
-    w(b"1 0 obj\n")
-    w(b"<< /Type /Catalog /Pages 2 0 R >>\n")
-    w(b"endobj\n")
-
-    # 2: Pages
-    mark()
-    w(b"2 0 obj\n")
-    w(b"<< /Type /Pages /Count 1 /Kids [3 0 R] >>\n")
-    w(b"endobj\n")
-
-    # 3: Page (vor Font/Contents schreiben, damit XRef-Reihenfolge 1..5 ist)
-    mark()
-    w(b"3 0 obj\n")
-    w(b"<< /Type /Page /Parent 2 0 R ")
-    w(f"/MediaBox [0 0 {width} {height}] ".encode("ascii"))
-    w(b"/Resources << /Font << /F1 4 0 R >> >> ")
-    w(b"/Contents 5 0 R >>\n")
-    w(b"endobj\n")
-
-    # 4: Font
-    mark()
-    w(b"4 0 obj\n")
-    w(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>\n")
-    w(b"endobj\n")
-
-    # 5: Contents
-    mark()
-    w(b"5 0 obj\n")
-    w(f"<< /Length {stream_len} >>\n".encode("ascii"))
-    w(b"stream\n")
-    w(content_stream)
-    w(b"endstream\n")
-    w(b"endobj\n")
+    for num, (d, data) in enumerate(objs, 1):
+        xref_offsets.append(pos)        # laufender Offset statt pdf_parts neu aufzusummieren
+        w(f"{num} 0 obj\n".encode("ascii"))
+        w(d)
+        if data is not None:
+            w(b"stream\n")
+            w(data)
+            w(b"\nendstream\n")
+        w(b"endobj\n")
 
     # xref
-    xref_start = sum(len(p) for p in pdf_parts)
-    w(b"xref\n")
-    w(b"0 6\n")
+    size = len(xref_offsets) + 1
+    xref_start = pos
+    w(f"xref\n0 {size}\n".encode("ascii"))
     w(b"0000000000 65535 f \n")
-    for off in xref_offsets:
-        w(f"{off:010d} 00000 n \n".encode("ascii"))
+    w("".join(f"{off:010d} 00000 n \n" for off in xref_offsets).encode("ascii"))
 
     # Trailer
-    w(b"trailer\n")
-    w(b"<< /Size 6 /Root 1 0 R >>\n")
-    w(b"startxref\n")
-    w(f"{xref_start}\n".encode("ascii"))
-    w(b"%%EOF\n")
+    w(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_start}\n%%EOF\n".encode("ascii"))
+    return b"".join(pdf_parts)
 
+def _serialize_objstm(objs: List[Tuple[bytes, Optional[bytes]]], compress: bool) -> bytes:
+    """
+    PDF 1.5: Nicht-Stream-Objekte (Catalog, Pages, Font, Page-Dicts) landen gepackt
+    in einem Object-Stream, die Content-Streams bleiben indirekte Objekte.
+    Statt xref-Tabelle + Trailer folgt ein (komprimierter) XRef-Stream.
+    """
+    objstm_num = len(objs) + 1
+    xref_num = len(objs) + 2
+    entries: Dict[int, Tuple[int, int, int]] = {0: (0, 0, 0xFFFF)}
+
+    # Object-Stream aufbauen: Header "num off ..." + Objekte hintereinander
+    header: List[str] = []
+    packed: List[bytes] = []
+    off = 0
+    for num, (d, data) in enumerate(objs, 1):
+        if data is not None:
+            continue
+        entries[num] = (2, objstm_num, len(header))
+        header.append(f"{num} {off}")
+        packed.append(d)
+        off += len(d)
+    head = (" ".join(header) + "\n").encode("ascii")
+
+    pdf_parts: List[bytes] = []
+    pos = 0
+
+    def w(b: bytes):
+        nonlocal pos
+        pdf_parts.append(b)
+        pos += len(b)
+
+    def indirect(num: int, d: bytes, data: bytes):
+        entries[num] = (1, pos, 0)
+        w(f"{num} 0 obj\n".encode("ascii") + d + b"stream\n")
+        w(data)
+        w(b"\nendstream\nendobj\n")
+
+    w(b"%PDF-1.5\n%\xE2\xE3\xCF\xD3\n")
+    for num, (d, data) in enumerate(objs, 1):
+        if data is not None:
+            indirect(num, d, data)
+    d, data = _stream_obj(f" /Type /ObjStm /N {len(header)} /First {len(head)}", head + b"".join(packed), compress)
+    indirect(objstm_num, d, data)
+
+    # XRef-Stream: W [1 4 2] -> Typ, Offset bzw. ObjStm-Nr., Generation bzw. Index
+    xref_start = pos
+    entries[xref_num] = (1, xref_start, 0)
+    size = xref_num + 1
+    rows = b"".join(
+        entries[i][0].to_bytes(1, "big") + entries[i][1].to_bytes(4, "big") + entries[i][2].to_bytes(2, "big")
+        for i in range(size)
+    )
+    d, data = _stream_obj(f" /Type /XRef /Size {size} /W [1 4 2] /Root 1 0 R", rows, compress)
+    w(f"{xref_num} 0 obj\n".encode("ascii") + d + b"stream\n")
+    w(data)
+    w(b"\nendstream\nendobj\n")
+    w(f"startxref\n{xref_start}\n%%EOF\n".encode("ascii"))
     return b"".join(pdf_parts)
 
+def _make_pdf_bytes(title: str, fields: Dict[str, str], body: str, *,
+                    compress: Optional[bool] = None, object_streams: Optional[bool] = None) -> bytes:
+    """
+    Erzeugt ein PDF mit Titel + Key/Value Feldern + Body-Text über beliebig viele Seiten.
+    Ohne externe Libs: Umbruch nach Helvetica-Glyphbreiten, ein Content-Stream pro Seite.
+    compress/object_streams überschreiben PDF_COMPRESS/PDF_OBJECT_STREAMS.
+    """
+    compress = PDF_COMPRESS if compress is None else compress
+    object_streams = PDF_OBJECT_STREAMS if object_streams is None else object_streams
+
+    title = _to_pdf_ascii(title or "Email Analysis")
+    pages = _paginate(_layout_lines(fields, body))
+
+    # Objektnummern: 1 Catalog, 2 Pages, 3 Font, danach je Seite (Page, Contents)
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+
+    objs: List[Tuple[bytes, Optional[bytes]]] = [
+        (b"<< /Type /Catalog /Pages 2 0 R >>\n", None),
+        (f"<< /Type /Pages /Count {len(pages)} /Kids [{kids}] >>\n".encode("ascii"), None),
+        (b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>\n", None),
+    ]
+    for i, (pid, lines) in enumerate(zip(page_ids, pages)):
+        objs.append(((
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {pid + 1} 0 R >>\n"
+        ).encode("ascii"), None))
+        objs.append(_stream_obj("", _page_content(title if i == 0 else None, lines), compress))
+
+    if object_streams:
+        return _serialize_objstm(objs, compress)
+    return _serialize_classic(objs)
+
 # ----------------------------
 # Index-/URL-Helfer
 # ----------------------------
+def _json_body(obj: Dict[str, Any]) -> dict:
+    raw = obj["Body"].read()
+    # Indizes liegen gzip-kodiert (Content-Encoding), boto3 dekomprimiert nicht selbst
+    if obj.get("ContentEncoding") == "gzip" or raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    return json.loads(raw)
+
 def _json_get(bucket: str, key: str) -> dict:
     try:
         obj = s3.get_object(Bucket=bucket, Key=key)
-        return json.loads(obj["Body"].read())
+        return _json_body(obj)
     except ClientError as e:
         if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
             return {}
         raise
 
-def _json_put(bucket: str, key: str, doc: dict):
+def _json_put(bucket: str, key: str, doc: dict, **extra: Any):
+    """
+    Index-Objekt schreiben. Mit INDEX_GZIP gzip-kodiert (mtime=0 -> gleiche Daten,
+    gleiche Bytes, gleiche ETag) und kurzer max-age statt no-store: Dashboards pollen
+    per If-None-Match und bekommen bei unverändertem Index ein 304 ohne Body.
+    """
+    body = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if INDEX_GZIP:
+        extra["ContentEncoding"] = "gzip"
+        body = gzip.compress(body, compresslevel=9, mtime=0)
     s3.put_object(
         Bucket=bucket,
         Key=key,
-        Body=json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        Body=body,
         ContentType="application/json",
-        CacheControl="no-store, must-revalidate"   # damit das Dashboard sofort die Änderung sieht
+        CacheControl=INDEX_CACHE_CONTROL,
+        **extra                                     # z. B. IfMatch/IfNoneMatch für den Compactor
     )
 
 def _basename(key: str) -> str:
@@ -238,12 +411,9 @@ def _ymd_from_key(key: str) -> Tuple[str, str, str]:
     i = parts.index(PDF_TENANT_SUBFOLDER)  # .../KI_Results/YYYY/MM/DD/...
     return parts[i+1], parts[i+2], parts[i+3]
 
-def _update_ki_results_indexes(*, tenant_id: str, out_bucket: str, file_key: str,
-                               title: Optional[str] = None, size: Optional[int] = None,
-                               content_type: Optional[str] = None,
-                               created_at_iso: Optional[str] = None,
-                               direct_cf_url: Optional[str] = None) -> None:
-    """Hängt die frisch hochgeladene Datei an files.json + Tagesindex an."""
+def _ki_item(*, out_bucket: str, file_key: str, title: Optional[str], size: Optional[int],
+             content_type: Optional[str], created_at_iso: Optional[str],
+             direct_cf_url: Optional[str]) -> Dict[str, Any]:
     # Metadaten ergänzen
     if size is None or content_type is None:
         meta = _head(out_bucket, file_key)
@@ -251,39 +421,362 @@ def _update_ki_results_indexes(*, tenant_id: str, out_bucket: str, file_key: str
         content_type = content_type or meta.get("contentType") or "application/pdf"
 
     url = direct_cf_url or (_cf_url_for(file_key) if not USE_PRESIGNED_URL else _s3_presigned_for(out_bucket, file_key))
-    now_iso = created_at_iso or datetime.utcnow().isoformat() + "Z"
-
-    item = {
+    return {
         "title": title or _basename(file_key),
         "s3Key": file_key,
         "url": url,
         "size": size,
         "contentType": content_type,
-        "createdAt": now_iso
+        "createdAt": created_at_iso or datetime.utcnow().isoformat() + "Z"
     }
 
+def _index_ki_items(out_bucket: str, tenant_id: str, items: List[Dict[str, Any]]) -> None:
+    """
+    Ein Index-Schreibvorgang für beliebig viele Items eines Tenants.
+    segments: ein unveränderliches Segment-Objekt pro Tag (konstante Kosten, keine Races),
+              files.json/index.json schreibt der Compactor.
+    legacy:   files.json + Tagesindizes direkt per Read-Modify-Write.
+    """
+    by_day: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+    for it in items:
+        by_day.setdefault(_ymd_from_key(it["s3Key"]), []).append(it)
+
+    if KI_INDEX_MODE == "segments":
+        for ymd, day_items in by_day.items():
+            _put_ki_segment(out_bucket, tenant_id, ymd, day_items)
+        return
+
+    now_iso = max(it["createdAt"] for it in items)
+
     # 1) Rolling: tenants/<tenant>/KI_Results/files.json
-    rolling_key = f"{TENANTS_ROOT_DIR}/{tenant_id}/{PDF_TENANT_SUBFOLDER}/files.json"
+    rolling_key = _ki_rolling_key(tenant_id)
     rolling = _json_get(out_bucket, rolling_key) or {"items": []}
-    rolling["items"] = [item] + (rolling.get("items") or [])
-    rolling["items"] = rolling["items"][:ROLLING_LIMIT]
+    rolling["items"] = _merge_items(items, rolling.get("items") or [], ROLLING_LIMIT)
     rolling["updatedAt"] = now_iso
     _json_put(out_bucket, rolling_key, rolling)
 
     # 2) Daily: tenants/<tenant>/KI_Results/YYYY/MM/DD/index.json
-    y, m, d = _ymd_from_key(file_key)
-    daily_key = f"{TENANTS_ROOT_DIR}/{tenant_id}/{PDF_TENANT_SUBFOLDER}/{y}/{m}/{d}/index.json"
-    daily = _json_get(out_bucket, daily_key) or {"date": f"{y}-{m}-{d}", "items": []}
-    daily["items"] = [item] + (daily.get("items") or [])
-    _json_put(out_bucket, daily_key, daily)
+    for (y, m, d), day_items in by_day.items():
+        daily_key = _ki_daily_key(tenant_id, (y, m, d))
+        daily = _json_get(out_bucket, daily_key) or {"date": f"{y}-{m}-{d}", "items": []}
+        daily["items"] = _merge_items(day_items, daily.get("items") or [])
+        _json_put(out_bucket, daily_key, daily)
+
+# ----------------------------
+# Segmentierter Index (append-only) + Compactor
+# ----------------------------
+# Layout unter tenants/<tenant>/KI_Results/:
+#   files.json, YYYY/MM/DD/index.json          kompaktierte Basis (wie bisher)
+#   _index/segments/YYYY/MM/DD/<ms>_<rand>.json  ein Item pro Segment, nie überschrieben
+# Der Compactor mischt Segmente in die Basis (Conditional PUT per ETag) und löscht
+# erst danach die gemischten Segmente. Leser mischen Basis + verbliebene Segmente.
+def _ki_base(tenant_id: str) -> str:
+    return f"{TENANTS_ROOT_DIR}/{tenant_id}/{PDF_TENANT_SUBFOLDER}"
+
+def _ki_rolling_key(tenant_id: str) -> str:
+    return f"{_ki_base(tenant_id)}/files.json"
+
+def _ki_daily_key(tenant_id: str, ymd: Tuple[str, str, str]) -> str:
+    return f"{_ki_base(tenant_id)}/{'/'.join(ymd)}/index.json"
+
+def _ki_segment_prefix(tenant_id: str, ymd: Optional[Tuple[str, str, str]] = None) -> str:
+    p = f"{_ki_base(tenant_id)}/{KI_INDEX_DIR}/segments/"
+    return p + ("/".join(ymd) + "/" if ymd else "")
+
+def _put_ki_segment(bucket: str, tenant_id: str, ymd: Tuple[str, str, str], items: List[Dict[str, Any]]) -> str:
+    # Millisekunden vorne -> lexikografische Reihenfolge = zeitliche Reihenfolge
+    key = f"{_ki_segment_prefix(tenant_id, ymd)}{int(time.time()*1000):013d}_{uuid.uuid4().hex[:12]}.json"
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps({"items": items}, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        ContentType="application/json",
+    )
+    return key
+
+def _list_ki_segments(bucket: str, prefix: str, limit: int, newest: bool = False) -> List[str]:
+    """
+    Segment-Keys in zeitlicher Reihenfolge. newest=False: die ältesten `limit` (Compactor,
+    mischt von vorn). newest=True: die neuesten `limit` (Leser) – S3 listet nur aufsteigend,
+    daher wird der Prefix komplett gelistet und nur das Ende behalten.
+    """
+    keys: "deque[str]" = deque(maxlen=limit if newest else None)
+    kwargs: Dict[str, Any] = {"Bucket": bucket, "Prefix": prefix, "MaxKeys": 1000 if newest else min(1000, limit)}
+    while newest or len(keys) < limit:
+        r = s3.list_objects_v2(**kwargs)
+        keys.extend(o["Key"] for o in r.get("Contents") or [] if o["Key"].endswith(".json"))
+        if not r.get("IsTruncated"):
+            break
+        kwargs["ContinuationToken"] = r["NextContinuationToken"]
+    return list(keys)[:limit]
+
+def _list_prefixes(bucket: str, prefix: str) -> List[str]:
+    out: List[str] = []
+    kwargs: Dict[str, Any] = {"Bucket": bucket, "Prefix": prefix, "Delimiter": "/"}
+    while True:
+        r = s3.list_objects_v2(**kwargs)
+        out.extend(p["Prefix"] for p in r.get("CommonPrefixes") or [])
+        if not r.get("IsTruncated"):
+            return sorted(out)
+        kwargs["ContinuationToken"] = r["NextContinuationToken"]
+
+def _newest_ki_segments(bucket: str, tenant_id: str, limit: int) -> List[str]:
+    """
+    Die neuesten `limit` Segmente über alle Tage: Jahr/Monat/Tag absteigend ablaufen und
+    nur so viele Tage listen, bis `limit` erreicht ist (Rückstau alter Tage kostet nichts).
+    """
+    keys: List[str] = []
+    def walk(prefix: str, depth: int) -> None:
+        for p in reversed(_list_prefixes(bucket, prefix)):
+            if len(keys) >= limit:
+                return
+            if depth < 2:
+                walk(p, depth + 1)
+            else:
+                keys[:0] = _list_ki_segments(bucket, p, limit - len(keys), newest=True)
+    walk(_ki_segment_prefix(tenant_id), 0)
+    return keys
+
+def _read_ki_segments(bucket: str, keys: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Segmente parallel lesen; bereits gelöschte (Compactor lief parallel) werden übersprungen."""
+    def one(k: str) -> Tuple[str, Dict[str, Any]]:
+        return k, _json_get(bucket, k)
+    if not keys:
+        return []
+    with ThreadPoolExecutor(max_workers=min(KI_INDEX_READ_WORKERS, len(keys))) as ex:
+        return [(k, doc) for k, doc in ex.map(one, keys) if doc]
+
+def _segment_items(doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Segment = {"items": [...]} (Batch: mehrere Items je Tag), Einzel-Item als Altform
+    return doc["items"] if isinstance(doc.get("items"), list) else [doc]
+
+def _segment_ymd(key: str) -> Tuple[str, str, str]:
+    parts = key.split("/")
+    return parts[-4], parts[-3], parts[-2]   # .../segments/YYYY/MM/DD/<name>.json
+
+def _merge_items(newer: List[Dict[str, Any]], base: List[Dict[str, Any]],
+                 limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Neueste zuerst, Dedupe per s3Key (Segment nach abgebrochener Kompaktierung doppelt)."""
+    out: List[Dict[str, Any]] = []
+    seen = set()
+    for it in sorted(newer, key=lambda i: i.get("createdAt") or "", reverse=True) + base:
+        k = it.get("s3Key")
+        if k in seen:
+            continue
+        seen.add(k)
+        out.append(it)
+        if limit and len(out) >= limit:
+            break
+    return out
+
+def _json_get_etag(bucket: str, key: str) -> Tuple[dict, Optional[str]]:
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key)
+        return _json_body(obj), obj.get("ETag")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return {}, None
+        raise
+
+def _json_cas_update(bucket: str, key: str, fn, attempts: int = 5) -> None:
+    """Read-Modify-Write mit If-Match/If-None-Match; bei Konflikt neu lesen."""
+    for _ in range(attempts):
+        doc, etag = _json_get_etag(bucket, key)
+        before = json.dumps(doc, sort_keys=True)
+        new = fn(doc)
+        if json.dumps(new, sort_keys=True) == before:
+            return                                  # unverändert -> kein PUT, ETag bleibt
+        cond = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            _json_put(bucket, key, new, **cond)
+            return
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise
+    raise RuntimeError(f"Index-Konflikt bei {key} nach {attempts} Versuchen")
+
+def _compact_ki_index(bucket: str, tenant_id: str, max_segments: Optional[int] = None) -> Dict[str, Any]:
+    seg_keys = _list_ki_segments(bucket, _ki_segment_prefix(tenant_id), max_segments or KI_COMPACT_MAX_SEGMENTS)
+    if not seg_keys:
+        return {"tenantId": tenant_id, "merged": 0}
+    segs = _read_ki_segments(bucket, seg_keys)
+    now_iso = datetime.utcnow().isoformat() + "Z"
+
+    by_day: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+    for k, doc in segs:
+        by_day.setdefault(_segment_ymd(k), []).extend(_segment_items(doc))
+
+    # 1) Tagesindizes
+    for ymd, items in by_day.items():
+        def merge_daily(doc, items=items, ymd=ymd):
+            doc = doc or {"date": "-".join(ymd), "items": []}
+            merged = _merge_items(items, doc.get("items") or [])
+            if merged != doc.get("items"):
+                doc["items"], doc["updatedAt"] = merged, now_iso
+            return doc
+        _json_cas_update(bucket, _ki_daily_key(tenant_id, ymd), merge_daily)
+
+    # 2) Rolling
+    def merge_rolling(doc):
+        doc = doc or {"items": []}
+        merged = _merge_items([it for _, d in segs for it in _segment_items(d)],
+                              doc.get("items") or [], ROLLING_LIMIT)
+        if merged != doc.get("items"):
+            doc["items"], doc["updatedAt"] = merged, now_iso
+        return doc
+    _json_cas_update(bucket, _ki_rolling_key(tenant_id), merge_rolling)
+
+    # 3) Erst jetzt die gemischten Segmente entfernen
+    for i in range(0, len(seg_keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": k} for k in seg_keys[i:i + 1000]], "Quiet": True})
+
+    return {"tenantId": tenant_id, "merged": len(seg_keys), "days": len(by_day)}
+
+def _ki_index_tenants(bucket: str) -> List[str]:
+    tenants: List[str] = []
+    kwargs: Dict[str, Any] = {"Bucket": bucket, "Prefix": f"{TENANTS_ROOT_DIR}/", "Delimiter": "/"}
+    while True:
+        r = s3.list_objects_v2(**kwargs)
+        tenants.extend(p["Prefix"].split("/")[-2] for p in r.get("CommonPrefixes") or [])
+        if not r.get("IsTruncated"):
+            return tenants
+        kwargs["ContinuationToken"] = r["NextContinuationToken"]
+
+def _read_ki_index(bucket: str, tenant_id: str, date: Optional[str] = None) -> Dict[str, Any]:
+    """Leser-Sicht: kompaktierte Basis + noch nicht gemischte Segmente."""
+    if date:
+        ymd = tuple(date.split("-"))
+        base, _ = _json_get_etag(bucket, _ki_daily_key(tenant_id, ymd))
+        seg_keys = _list_ki_segments(bucket, _ki_segment_prefix(tenant_id, ymd), KI_COMPACT_MAX_SEGMENTS, newest=True)
+        limit = None
+    else:
+        base, _ = _json_get_etag(bucket, _ki_rolling_key(tenant_id))
+        # neueste Segmente genügen für die Rolling-Sicht (Rückstau ältester Segmente fällt weg)
+        seg_keys = _newest_ki_segments(bucket, tenant_id, ROLLING_LIMIT)
+        limit = ROLLING_LIMIT
+    items = [it for _, d in _read_ki_segments(bucket, seg_keys) for it in _segment_items(d)]
+    out = {"items": _merge_items(items, (base or {}).get("items") or [], limit), "pending": len(seg_keys)}
+    if date:
+        out["date"] = date
+    return out
+
+def _handle_index_action(action: str, data: Dict[str, Any], context) -> Dict[str, Any]:
+    bucket = OUTPUT_BUCKET or _get(data, "s3.bucket")
+    if not bucket:
+        return {"ok": False, "error": "No OUTPUT_BUCKET set and no s3.bucket provided."}
+    tenant = str(data.get("tenantId") or data.get("tenant_id") or "").strip()
+
+    if action == "migrate_keys":
+        if KEY_SHARD_CHARS <= 0:
+            return {"ok": False, "error": "KEY_SHARD_CHARS not set"}
+        results = []
+        for t in ([tenant] if tenant else _ki_index_tenants(bucket)):
+            if context is not None and context.get_remaining_time_in_millis() < KI_COMPACT_MIN_REMAINING_MS:
+                break
+            results.append(_migrate_tenant_keys(bucket, t, context))
+        return {"ok": True, "results": results, "done": all(r["done"] for r in results)}
+
+    if action == "list_index":
+        if not tenant:
+            return {"ok": False, "error": "tenantId required"}
+        return {"ok": True, "tenantId": tenant, **_read_ki_index(bucket, tenant, data.get("date"))}
+
+    # compact_index: ein Tenant oder alle, solange das Zeitbudget reicht
+    tenants = [tenant] if tenant else _ki_index_tenants(bucket)
+    random.shuffle(tenants)                     # bei knappem Budget kommt jeder Tenant mal dran
+    results, skipped = [], 0
+    for t in tenants:
+        if context is not None and context.get_remaining_time_in_millis() < KI_COMPACT_MIN_REMAINING_MS:
+            skipped = len(tenants) - len(results)
+            break
+        results.append(_compact_ki_index(bucket, t))
+    return {
+        "ok": True,
+        "compacted": [r for r in results if r.get("merged")],
+        "tenants": len(results),
+        "skipped": skipped,
+    }
+
+# ----------------------------
+# API Gateway (nur lesend)
+# ----------------------------
+# Über die API ist nur list_index erreichbar; compact_index/migrate_keys laufen ausschließlich
+# über Schedule bzw. Direkt-Invoke. Der Tenant kommt aus dem Authorizer, nie aus dem Request.
+def _api_response(status: int, obj: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "statusCode": status,
+        "headers": {"Content-Type": "application/json; charset=utf-8", "Cache-Control": "no-store"},
+        "body": json.dumps(obj, ensure_ascii=False, separators=(",", ":")),
+    }
+
+def _api_tenant(event: Dict[str, Any]) -> str:
+    auth = _get(event, "requestContext.authorizer", {}) or {}
+    for src in (auth.get("claims"), _get(auth, "jwt.claims"), auth.get("lambda"), auth):
+        if isinstance(src, dict) and src.get(API_TENANT_CLAIM):
+            return str(src[API_TENANT_CLAIM]).strip()
+    return ""
+
+def _handle_api(event: Dict[str, Any], context) -> Dict[str, Any]:
+    qs = event.get("queryStringParameters") or {}
+    if str(qs.get("action") or "list_index").strip() != "list_index":
+        return _api_response(403, {"ok": False, "error": "action not allowed"})
+    tenant = _api_tenant(event)
+    if not tenant:
+        return _api_response(401, {"ok": False, "error": "no tenant claim"})
+    date = qs.get("date")
+    if date and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", date):
+        return _api_response(400, {"ok": False, "error": "date must be YYYY-MM-DD"})
+    try:
+        res = _handle_index_action("list_index", {"tenantId": tenant, "date": date}, context)
+    except Exception as e:
+        print("[api list_index failed]", str(e)[:200])
+        return _api_response(500, {"ok": False, "error": "internal error"})
+    return _api_response(200 if res.get("ok") else 500, res)
 
 # ----------------------------
 # S3-Key bestimmen
 # ----------------------------
+# Optionales Sharding gegen Hot-Prefixes: logisch  tenants/<t>/<rest>
+#                                          physisch tenants/<t>/<shard>/<rest>
+# shard = die ersten KEY_SHARD_CHARS Hex-Zeichen von sha256(logischer Key). Der Tenant-
+# Prefix bleibt vorne (IAM-Policies pro Tenant greifen weiter), die Umkehrung ist über
+# den Hash eindeutig prüfbar. Dedup-Marker (_index/by-hash, reine Punktzugriffe) werden mit
+# geshardet; Index-Segmente und files.json/index.json nicht: Leser listen sie pro Tag, über
+# 16^n Shard-Prefixe wäre das je ein LIST mehr, und es fällt nur ein PUT pro PDF an.
+def _key_shard(logical_key: str) -> str:
+    return hashlib.sha256(logical_key.encode("utf-8")).hexdigest()[:KEY_SHARD_CHARS]
+
+def _physical_key(logical_key: str) -> str:
+    if KEY_SHARD_CHARS <= 0:
+        return logical_key
+    parts = logical_key.split("/")
+    if TENANTS_ROOT_DIR not in parts:
+        return logical_key
+    i = parts.index(TENANTS_ROOT_DIR)
+    if len(parts) < i + 3:
+        return logical_key
+    return "/".join(parts[:i + 2] + [_key_shard(logical_key)] + parts[i + 2:])
+
+def _logical_key(key: str) -> str:
+    """Physischer (oder bereits logischer) Key -> logischer Key."""
+    parts = key.split("/")
+    if TENANTS_ROOT_DIR not in parts:
+        return key
+    i = parts.index(TENANTS_ROOT_DIR)
+    if len(parts) < i + 4:
+        return key
+    logical = "/".join(parts[:i + 2] + parts[i + 3:])
+    shard = parts[i + 2]
+    if 0 < len(shard) <= 8 and hashlib.sha256(logical.encode("utf-8")).hexdigest()[:len(shard)] == shard:
+        return logical
+    return key
+
 def _choose_bucket_and_key(data: Dict[str, Any]) -> Tuple[str, str]:
     """
     Zielpfad:
       [ROOT_PREFIX/]<tenants>/<tenantId>/<PDF_TENANT_SUBFOLDER>/<YYYY>/<MM>/<DD>/<ts>_<subject>.pdf
+      mit KEY_SHARD_CHARS > 0: <tenants>/<tenantId>/<shard>/<PDF_TENANT_SUBFOLDER>/...
     """
     tenant = (data.get("tenantId") or data.get("tenant_id") or "unknown").strip()
     subject = str(_get(data, "meta.subject", "") or "").strip()
@@ -300,13 +793,472 @@ def _choose_bucket_and_key(data: Dict[str, Any]) -> Tuple[str, str]:
     parts.append(PDF_TENANT_SUBFOLDER)
     parts.append(ts_dir)
 
-    key = "/".join(parts) + "/" + filename
+    key = _physical_key("/".join(parts) + "/" + filename)
 
     bucket = OUTPUT_BUCKET or _get(data, "s3.bucket")
     if not bucket:
         raise RuntimeError("No OUTPUT_BUCKET set and no detail.s3.bucket provided.")
     return bucket, key
 
+# ----------------------------
+# Key-Migration (unge-shardet -> geshardet)
+# ----------------------------
+def _move_object(bucket: str, src: str, dst: str) -> None:
+    extra: Dict[str, Any] = {}
+    if KMS_KEY_ID:
+        extra = {"ServerSideEncryption": "aws:kms", "SSEKMSKeyId": KMS_KEY_ID}
+    s3.copy_object(Bucket=bucket, CopySource={"Bucket": bucket, "Key": src}, Key=dst, **extra)
+    s3.delete_object(Bucket=bucket, Key=src)
+
+def _remap_items(items: List[Dict[str, Any]], moved: Dict[str, str]) -> List[Dict[str, Any]]:
+    out = []
+    for it in items:
+        old = it.get("s3Key")
+        if old in moved:
+            new_key = moved[old]
+            it = dict(it, s3Key=new_key)
+            if CF_DOMAIN and it.get("url") == _cf_url_for(old):
+                it["url"] = _cf_url_for(new_key)
+        out.append(it)
+    return out
+
+def _migrate_tenant_keys(bucket: str, tenant_id: str, context) -> Dict[str, Any]:
+    """
+    Verschiebt die PDFs eines Tenants seitenweise parallel auf das geshardete Layout
+    und zieht files.json + betroffene Tagesindizes nach. Idempotent: verschobene
+    Objekte verschwinden aus dem Quell-Prefix, ein erneuter Aufruf macht weiter.
+    Raw-Mails (emails/) bleiben, wo sie sind; der AgentControlHandler sucht beim Laden
+    im jeweils anderen Layout nach (_raw_email_keys).
+    """
+    # offene Segmente zuerst in die Basis, damit nur dort umgeschrieben werden muss
+    _compact_ki_index(bucket, tenant_id)
+
+    prefix = f"{_ki_base(tenant_id)}/"
+    moved_total, done, start_after = 0, False, ""
+    while not done:
+        if context is not None and context.get_remaining_time_in_millis() < KI_COMPACT_MIN_REMAINING_MS:
+            break
+        kwargs: Dict[str, Any] = {"Bucket": bucket, "Prefix": prefix, "MaxKeys": MIGRATE_PAGE_SIZE}
+        if start_after:
+            kwargs["StartAfter"] = start_after      # verschobene Keys sind gelöscht, der Rest bleibt davor
+        r = s3.list_objects_v2(**kwargs)
+        contents = r.get("Contents") or []
+        done = not r.get("IsTruncated")
+        if not contents:
+            break
+        start_after = contents[-1]["Key"]
+        pairs = [(o["Key"], _physical_key(o["Key"])) for o in contents
+                 if o["Key"].endswith(".pdf") and f"/{KI_INDEX_DIR}/" not in o["Key"]]
+        pairs = [(src, dst) for src, dst in pairs if src != dst]
+        if not pairs:
+            continue
+
+        with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(pairs))) as ex:
+            list(ex.map(lambda p: _move_object(bucket, *p), pairs))
+        moved = dict(pairs)
+        moved_total += len(pairs)
+
+        def remap(doc, moved=moved):
+            if doc:
+                doc["items"] = _remap_items(doc.get("items") or [], moved)
+            return doc
+        _json_cas_update(bucket, _ki_rolling_key(tenant_id), remap)
+        for ymd in {_ymd_from_key(src) for src in moved}:
+            _json_cas_update(bucket, _ki_daily_key(tenant_id, ymd), remap)
+
+    return {"tenantId": tenant_id, "moved": moved_total, "done": done}
+
+# ----------------------------
+# Inhalts-Hash-Dedup (Retries/Replays)
+# ----------------------------
+# Pro gerendertem PDF liegt ein leeres Marker-Objekt _index/by-hash/<sha256>, dessen
+# Metadaten auf den PDF-Key zeigen. Ein Replay kostet damit genau ein HEAD (oder
+# nichts, wenn der Hash im Prozess-Cache liegt) statt Render + Upload + Index.
+_DEDUP_CACHE: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+_DEDUP_LOCK = threading.Lock()
+
+def _content_hash(job: Dict[str, Any]) -> str:
+    """sha256 über die normalisierten Render-Eingaben (Tenant steckt in fields)."""
+    norm = {
+        "title": str(job["title"]).strip(),
+        "fields": {k: str(v or "").strip() for k, v in job["fields"].items()},
+        "body": str(job["body"] or "").strip(),
+    }
+    raw = json.dumps(norm, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _doc_hash(doc_id: str) -> str:
+    # Marker pro Roh-Mail (duplicate_of.id), gleicher Marker-Ordner wie die Inhalts-Hashes
+    return "doc-" + hashlib.sha256(doc_id.encode("utf-8")).hexdigest()
+
+def _dedup_marker_key(tenant_id: str, h: str, sharded: bool = True) -> str:
+    key = f"{_ki_base(tenant_id)}/{KI_INDEX_DIR}/by-hash/{h}"
+    return _physical_key(key) if sharded else key
+
+def _dedup_remember(bucket: str, h: str, hit: Dict[str, Any]) -> None:
+    with _DEDUP_LOCK:
+        _DEDUP_CACHE[(bucket, h)] = hit
+        _DEDUP_CACHE.move_to_end((bucket, h))
+        while len(_DEDUP_CACHE) > PDF_DEDUP_CACHE_MAX:
+            _DEDUP_CACHE.popitem(last=False)
+
+def _dedup_lookup(bucket: str, tenant_id: str, h: str) -> Optional[Dict[str, Any]]:
+    with _DEDUP_LOCK:
+        hit = _DEDUP_CACHE.get((bucket, h))
+        if hit is not None:
+            _DEDUP_CACHE.move_to_end((bucket, h))
+            return hit
+    # Marker von vor KEY_SHARD_CHARS liegen noch unge-shardet (migrate_keys verschiebt nur PDFs)
+    keys = [_dedup_marker_key(tenant_id, h)]
+    if keys[0] != _dedup_marker_key(tenant_id, h, sharded=False):
+        keys.append(_dedup_marker_key(tenant_id, h, sharded=False))
+    r = None
+    for key in keys:
+        try:
+            r = s3.head_object(Bucket=bucket, Key=key)
+            break
+        except ClientError as e:
+            # ohne s3:ListBucket (legacy ohne index_bucket) meldet S3 fehlende Keys als 403 -> Miss
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound", "403", "AccessDenied"):
+                print("[dedup head failed]", str(e)[:200])
+                return None
+    if r is None:
+        return None
+    md = r.get("Metadata") or {}
+    if not md.get("pdf-key"):
+        return None
+    key = md["pdf-key"]
+    sharded = _physical_key(_logical_key(key))
+    if sharded != key and _head(bucket, sharded):     # Marker von vor migrate_keys
+        key = sharded
+    hit = {"key": key, "bytes": int(md.get("pdf-bytes") or 0)}
+    _dedup_remember(bucket, h, hit)
+    return hit
+
+def _dedup_mark(bucket: str, tenant_id: str, h: str, key: str, size: int) -> None:
+    # erst nach PDF-Upload UND Index-Eintrag schreiben (_mark_job) -> ein Treffer ist immer indexiert
+    s3.put_object(
+        Bucket=bucket,
+        Key=_dedup_marker_key(tenant_id, h),
+        Body=b"",
+        ContentType="application/octet-stream",
+        Metadata={"pdf-key": key, "pdf-bytes": str(size)},
+    )
+    _dedup_remember(bucket, h, {"key": key, "bytes": size})
+
+# ----------------------------
+# Render/Upload-Bausteine (Einzel- und Batch-Pfad)
+# ----------------------------
+def _prepare_job(data: Dict[str, Any], lookup: bool = True) -> Dict[str, Any]:
+    """
+    Payload -> Render-Eingaben + Ziel (billig, ohne Rendering). lookup=False: Dedup-HEADs
+    übernimmt der Aufrufer (_resolve_dedup, im Batch parallel).
+    """
+    tenant = (data.get("tenantId") or data.get("tenant_id") or "unknown").strip()
+    meta: Dict[str, Any] = data.get("meta") or {}
+    analysis: Dict[str, Any] = data.get("analysis") or {}
+
+    bedrock_json: Dict[str, Any] = _get(analysis, "bedrock.bedrock_json", {}) or {}
+    summary  = str(bedrock_json.get("summary", "") or "")
+    intent   = str(bedrock_json.get("intent", "") or "")
+    priority = str(bedrock_json.get("priority", "") or "")
+    entities = bedrock_json.get("entities", [])
+
+    # Text-Kandidat für Body: bevorzugt meta.text (falls vorhanden), sonst summary
+    meta_text = str(meta.get("text", "") or "")
+    body_text = meta_text.strip() or summary
+
+    # Titel & Felder fürs PDF
+    title = meta.get("subject") or "Email Analysis"
+    fields = {
+        "Tenant": tenant,
+        "Subject": meta.get("subject", "") or "",
+        "From": meta.get("from", "") or "",
+        "To": meta.get("to", "") or "",
+        "CC": meta.get("cc", "") or "",
+        "Summary": summary,
+        "Intent": intent,
+        "Priority": priority,
+    }
+    if isinstance(entities, list) and entities:
+        try:
+            fields["Entities"] = ", ".join(
+                [e if isinstance(e, str) else (e.get("Text") or e.get("text") or "") for e in entities]
+            )
+        except Exception:
+            pass
+
+    bucket, key = _choose_bucket_and_key(data)
+    job = {
+        "tenant": tenant, "bucket": bucket, "key": key,
+        "title": title, "fields": fields, "body": body_text,
+        "meta": meta, "intent": intent, "priority": priority,
+        "summary": summary, "entities": entities,
+        "hash": None, "deduplicated": False,
+        "doc_hash": None, "duplicate_of": None,
+    }
+    if PDF_DEDUP:
+        job["hash"] = _content_hash(job)
+    if PDF_REUSE_DUPLICATES:
+        doc_id = str(_get(data, "s3.key", "") or "")
+        dup = data.get("duplicate_of")
+        if not (isinstance(dup, dict) and dup.get("id")) and doc_id:
+            job["doc_hash"] = _doc_hash(doc_id)   # Original -> Marker nach dem Upload
+    return _resolve_dedup(job, data) if lookup else job
+
+def _resolve_dedup(job: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Dedup-Marker per HEAD prüfen (Inhalts-Hash, dann Near-Duplicate-Original); I/O-gebunden."""
+    bucket, tenant = job["bucket"], job["tenant"]
+    if job["hash"]:
+        hit = _dedup_lookup(bucket, tenant, job["hash"])
+        if hit:
+            job.update(key=hit["key"], bytes=hit["bytes"], deduplicated=True)
+    dup = data.get("duplicate_of")
+    if PDF_REUSE_DUPLICATES and not job["deduplicated"] and isinstance(dup, dict) and dup.get("id"):
+        hit = _dedup_lookup(bucket, tenant, _doc_hash(str(dup["id"])))
+        if hit:
+            job.update(key=hit["key"], bytes=hit["bytes"], deduplicated=True, duplicate_of=str(dup["id"]))
+    return job
+
+def _render_and_upload(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Rendert das PDF und lädt es hoch; ergänzt job um bytes/render_ms/cf_url."""
+    if job["deduplicated"]:
+        job.update(render_ms=0.0, cf_url=f"https://{CF_DOMAIN}/{job['key']}" if CF_DOMAIN else None)
+        print(f"[pdf-dedup] key={job['key']} hash={(job['hash'] or '')[:16]} duplicate_of={job['duplicate_of']}")
+        return job
+
+    t_render = time.perf_counter()
+    pdf_bytes = _make_pdf_bytes(title=job["title"], fields=job["fields"], body=job["body"])
+    render_ms = round((time.perf_counter() - t_render) * 1000, 1)
+
+    put_kwargs: Dict[str, Any] = {
+        "Bucket": job["bucket"],
+        "Key": job["key"],
+        "Body": pdf_bytes,
+        "ContentType": "application/pdf",
+    }
+    if KMS_KEY_ID:
+        put_kwargs["ServerSideEncryption"] = "aws:kms"
+        put_kwargs["SSEKMSKeyId"] = KMS_KEY_ID
+
+    # PDF hochladen
+    s3.put_object(**put_kwargs)
+    print(f"[pdf-upload] key={job['key']} bytes={len(pdf_bytes)} render_ms={render_ms} "
+          f"compress={PDF_COMPRESS} objstm={PDF_OBJECT_STREAMS}")
+
+    job["bytes"] = len(pdf_bytes)
+    job["render_ms"] = render_ms
+    job["cf_url"] = f"https://{CF_DOMAIN}/{job['key']}" if CF_DOMAIN else None
+    job["created_at"] = datetime.utcnow().isoformat() + "Z"
+    return job
+
+def _mark_job(job: Dict[str, Any]) -> None:
+    """
+    Dedup-Marker als letzter Schritt, nach Upload und Index-Eintrag: stirbt die Lambda
+    dazwischen, fehlt der Marker und der Replay rendert + indexiert neu (statt auf ein
+    nie indexiertes PDF zu verweisen). Marker-Fehler kosten nur einen späteren Dedup-Treffer.
+    """
+    hashes = [] if job["deduplicated"] else [job["hash"]]
+    # Original, dessen Inhalt schon existiert: Near-Duplicates sollen trotzdem hierher finden
+    hashes.append(job["doc_hash"])
+    for h in hashes:
+        if not h:
+            continue
+        try:
+            _dedup_mark(job["bucket"], job["tenant"], h, job["key"], job["bytes"])
+        except Exception as e:
+            print("[dedup mark failed]", job["key"], str(e)[:200])
+
+def _job_index_item(job: Dict[str, Any]) -> Dict[str, Any]:
+    return _ki_item(out_bucket=job["bucket"], file_key=job["key"], title=_basename(job["key"]),
+                    size=job["bytes"], content_type="application/pdf",
+                    created_at_iso=job["created_at"], direct_cf_url=job["cf_url"])
+
+def _job_result(job: Dict[str, Any]) -> Dict[str, Any]:
+    meta, entities = job["meta"], job["entities"]
+    return {
+        "ok": True,
+        "tenantId": job["tenant"],
+        "bucket": job["bucket"],
+        "key": job["key"],
+        "bytes": job["bytes"],
+        "deduplicated": job["deduplicated"],
+        "duplicate_of": job["duplicate_of"],     # Roh-Mail-Id des Originals, wenn dessen PDF verlinkt ist
+        "pdf": {
+            "render_ms": job["render_ms"],
+            "compressed": PDF_COMPRESS,
+            "object_streams": PDF_OBJECT_STREAMS,
+        },
+        "s3_url": f"s3://{job['bucket']}/{job['key']}",
+        "cf_url": job["cf_url"],
+        "meta": {
+            "subject": meta.get("subject", ""),
+            "from": meta.get("from", ""),
+            "to": meta.get("to", ""),
+            "cc": meta.get("cc", ""),
+        },
+        "analysis": {
+            "intent": job["intent"],
+            "priority": job["priority"],
+            "summary_len": len(job["summary"]),
+            "entities_count": len(entities) if isinstance(entities, list) else 0,
+        }
+    }
+
+# ----------------------------
+# Batch-Modus
+# ----------------------------
+def _unwrap_item(x: Any) -> Any:
+    # lambda:invoke-Ergebnisse aus Step Functions liegen unter "Payload"
+    if isinstance(x, dict) and isinstance(x.get("Payload"), dict):
+        x = x["Payload"]
+    return _take_detail(x) if isinstance(x, dict) else x
+
+def _batch_items(event: Any) -> Optional[Tuple[str, List[Tuple[str, Any]]]]:
+    """
+    Erkennt Batch-Events und liefert (source, [(item_id, payload), ...]):
+      - SQS:  { Records: [ { messageId, body: "<json>" }, ... ] }
+      - Map:  [ payload, ... ]  oder  { Items: [...] } (ItemBatcher) / { items: [...] }
+    Kein Batch -> None.
+    """
+    if isinstance(event, list):
+        return "map", [(str(i), _unwrap_item(x)) for i, x in enumerate(event)]
+    if not isinstance(event, dict):
+        return None
+    recs = event.get("Records")
+    if isinstance(recs, list) and recs and all(isinstance(r, dict) and r.get("eventSource") == "aws:sqs" for r in recs):
+        out = []
+        for i, r in enumerate(recs):
+            try:
+                body = json.loads(r.get("body") or "")
+            except Exception:
+                body = None
+            out.append((str(r.get("messageId") or i), _unwrap_item(body)))
+        return "sqs", out
+    items = event.get("Items") if isinstance(event.get("Items"), list) else event.get("items")
+    if isinstance(items, list) and not event.get("action"):
+        return "map", [(str(i), _unwrap_item(x)) for i, x in enumerate(items)]
+    return None
+
+def _batch_failures(results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Partial Batch Response (ReportBatchItemFailures): nur vorübergehende Fehler (retryable)
+    erneut zustellen. Dauerhafte Fehler würden bis maxReceiveCount kreisen und in der DLQ
+    landen, ohne dass ein Retry etwas ändert -> loggen und quittieren.
+    """
+    out = []
+    for r in results:
+        if r.get("ok"):
+            continue
+        if r.get("retryable"):
+            out.append({"itemIdentifier": r["id"]})
+        else:
+            print(f"[batch] permanent failure, acknowledged: id={r.get('id')} error={r.get('error')}")
+    return out
+
+def _is_transient(e: Exception) -> bool:
+    # S3/Netzwerk heilen bei erneuter Zustellung; Render-/Payload-Fehler nicht
+    return isinstance(e, (ClientError, BotoCoreError))
+
+def _handle_batch(source: str, items: List[Tuple[str, Any]]) -> Dict[str, Any]:
+    """
+    Rendert + lädt alle PDFs parallel hoch (ein Thread-Pool, ein gemeinsamer
+    S3-Connection-Pool) und schreibt danach den Index EINMAL pro Tenant.
+    """
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    jobs: List[Tuple[int, Dict[str, Any]]] = []
+    used_keys = set()
+    first_by_hash: Dict[str, int] = {}
+    batch_dups: List[Tuple[int, int]] = []
+    prepared: List[Tuple[int, Dict[str, Any], Dict[str, Any]]] = []
+    for idx, (item_id, payload) in enumerate(items):
+        if not isinstance(payload, dict):
+            results[idx] = {"id": item_id, "ok": False, "error": "invalid_payload", "retryable": False}
+            continue
+        try:
+            prepared.append((idx, _prepare_job(payload, lookup=False), payload))
+        except Exception as e:
+            results[idx] = {"id": item_id, "ok": False, "error": str(e), "retryable": _is_transient(e)}
+
+    # Dedup-HEADs (bis zu zwei je Item) parallel statt nacheinander
+    def resolve(entry: Tuple[int, Dict[str, Any], Dict[str, Any]]) -> Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]:
+        idx, job, payload = entry
+        try:
+            return idx, _resolve_dedup(job, payload), None
+        except Exception as e:
+            return idx, None, e
+    resolved = []
+    if prepared:
+        with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(prepared))) as ex:
+            resolved = list(ex.map(resolve, prepared))
+
+    for idx, job, err in resolved:
+        if err:
+            results[idx] = {"id": items[idx][0], "ok": False, "error": str(err), "retryable": _is_transient(err)}
+            continue
+        if job["hash"] and not job["deduplicated"]:
+            if job["hash"] in first_by_hash:          # identischer Inhalt im selben Batch
+                batch_dups.append((idx, first_by_hash[job["hash"]]))
+                continue
+            first_by_hash[job["hash"]] = idx
+        # gleiche ms + gleicher Betreff im selben Batch -> Key eindeutig machen
+        if job["key"] in used_keys:
+            stem = job["key"][:-len(".pdf")]
+            job["key"] = f"{stem}_{idx}.pdf"
+        used_keys.add(job["key"])
+        jobs.append((idx, job))
+
+    def run(entry: Tuple[int, Dict[str, Any]]) -> Tuple[int, Optional[Dict[str, Any]], Optional[Exception]]:
+        idx, job = entry
+        try:
+            return idx, _render_and_upload(job), None
+        except Exception as e:
+            return idx, None, e
+
+    done: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(jobs))) as ex:
+            for idx, job, err in ex.map(run, jobs):
+                if err:
+                    results[idx] = {"id": items[idx][0], "ok": False, "error": str(err),
+                                    "retryable": _is_transient(err)}
+                    continue
+                results[idx] = {"id": items[idx][0], **_job_result(job)}
+                if job["deduplicated"]:
+                    _mark_job(job)
+                else:
+                    done.setdefault((job["bucket"], job["tenant"]), []).append(job)
+    for idx, first in batch_dups:
+        results[idx] = {**results[first], "id": items[idx][0]}
+        if results[idx].get("ok"):
+            results[idx]["deduplicated"] = True
+
+    # Index: ein Schreibvorgang pro Tenant (PDFs liegen bereits, daher nicht hart failen)
+    index_errors = 0
+    for (bucket, tenant), tjobs in done.items():
+        try:
+            _index_ki_items(bucket, tenant, [_job_index_item(j) for j in tjobs])
+        except Exception as idx_e:
+            index_errors += 1
+            print("[index update failed]", tenant, str(idx_e)[:200])
+            continue                                # ohne Marker: Replay indexiert nach
+        for j in tjobs:
+            _mark_job(j)
+
+    failed = [r for r in results if not r.get("ok")]
+    out: Dict[str, Any] = {
+        "ok": not failed,
+        "count": len(results),
+        "stored": len(results) - len(failed),
+        "failed": len(failed),
+        "tenants": len(done),
+        "index_errors": index_errors,
+        "results": results,
+    }
+    if source == "sqs":
+        out["batchItemFailures"] = _batch_failures(results)
+    return out
+
 # ----------------------------
 # Lambda-Handler
 # ----------------------------
@@ -315,107 +1267,49 @@ def lambda_handler(event, context):
     Erwartete Eingabe:
       - Entweder direkt { tenantId, meta, analysis, ... }
       - Oder EventBridge-Wrapper { detail: { ... } }
+      - Oder Batch: [payload, ...] | { items|Items: [...] } | SQS { Records: [...] }
 
     Verwendete Felder:
       - tenantId
       - meta.subject|from|to|cc|text (text optional)
       - analysis.bedrock.bedrock_json.summary|intent|priority|entities (optional)
       - s3.bucket (optional, falls OUTPUT_BUCKET nicht gesetzt ist)
+
+    Index-Aktionen (action=..., nur Direkt-Invoke/Schedule):
+      - compact_index [tenantId]      Segmente in files.json/index.json mischen (Schedule)
+      - list_index tenantId [date]    Basis + offene Segmente gemischt lesen
+      - migrate_keys [tenantId]       Bestands-PDFs parallel ins geshardete Layout verschieben
+
+    API Gateway (Proxy-Event mit requestContext): nur GET ?action=list_index[&date=...],
+    Tenant aus den Authorizer-Claims, Antwort als {statusCode, headers, body}.
     """
     try:
-        data = _take_detail(event)
-        tenant = (data.get("tenantId") or data.get("tenant_id") or "unknown").strip()
-        meta: Dict[str, Any] = data.get("meta") or {}
-        analysis: Dict[str, Any] = data.get("analysis") or {}
-
-        bedrock_json: Dict[str, Any] = _get(analysis, "bedrock.bedrock_json", {}) or {}
-        summary  = str(bedrock_json.get("summary", "") or "")
-        intent   = str(bedrock_json.get("intent", "") or "")
-        priority = str(bedrock_json.get("priority", "") or "")
-        entities = bedrock_json.get("entities", [])
-
-        # Text-Kandidat für Body: bevorzugt meta.text (falls vorhanden), sonst summary
-        meta_text = str(meta.get("text", "") or "")
-        body_text = meta_text.strip() or summary
-
-        # Titel & Felder fürs PDF
-        title = meta.get("subject") or "Email Analysis"
-        fields = {
-            "Tenant": tenant,
-            "Subject": meta.get("subject", "") or "",
-            "From": meta.get("from", "") or "",
-            "To": meta.get("to", "") or "",
-            "CC": meta.get("cc", "") or "",
-            "Summary": summary,
-            "Intent": intent,
-            "Priority": priority,
-        }
-        if isinstance(entities, list) and entities:
-            try:
-                fields["Entities"] = ", ".join(
-                    [e if isinstance(e, str) else (e.get("Text") or e.get("text") or "") for e in entities]
-                )
-            except Exception:
-                pass
+        batch = _batch_items(event)
+        if batch is not None:
+            return _handle_batch(*batch)
 
-        pdf_bytes = _make_pdf_bytes(title=title, fields=fields, body=body_text)
+        if isinstance(event, dict) and isinstance(event.get("requestContext"), dict):
+            return _handle_api(event, context)
 
-        bucket, key = _choose_bucket_and_key(data)
-
-        put_kwargs: Dict[str, Any] = {
-            "Bucket": bucket,
-            "Key": key,
-            "Body": pdf_bytes,
-            "ContentType": "application/pdf",
-        }
-        if KMS_KEY_ID:
-            put_kwargs["ServerSideEncryption"] = "aws:kms"
-            put_kwargs["SSEKMSKeyId"] = KMS_KEY_ID
+        data = _take_detail(event)
+        action = str(data.get("action") or "").strip()
+        if action in ("compact_index", "list_index", "migrate_keys"):
+            return _handle_index_action(action, data, context)
 
-        # PDF hochladen
-        s3.put_object(**put_kwargs)
-        print(f"[pdf-upload] key={key} bytes={len(pdf_bytes)}")
+        job = _render_and_upload(_prepare_job(data))
 
-        # URLs
-        s3_url = f"s3://{bucket}/{key}"
-        cf_url = f"https://{CF_DOMAIN}/{key}" if CF_DOMAIN else None
+        # Indexdateien aktualisieren (nicht hart failen, damit Haupt-Flow liefert);
+        # Duplikate sind bereits indexiert. Dedup-Marker erst danach.
+        if job["deduplicated"]:
+            _mark_job(job)
+        else:
+            try:
+                _index_ki_items(job["bucket"], job["tenant"], [_job_index_item(job)])
+                _mark_job(job)
+            except Exception as idx_e:
+                print("[index update failed]", str(idx_e)[:200])
 
-        # Indexdateien aktualisieren (nicht hart failen, damit Haupt-Flow liefert)
-        try:
-            _update_ki_results_indexes(
-                tenant_id=tenant,
-                out_bucket=bucket,
-                file_key=key,
-                title=_basename(key),
-                size=len(pdf_bytes),                 # optional; sonst via head geholt
-                content_type="application/pdf",
-                created_at_iso=datetime.utcnow().isoformat() + "Z",
-                direct_cf_url=cf_url
-            )
-        except Exception as idx_e:
-            print("[index update failed]", str(idx_e)[:200])
-
-        return {
-            "ok": True,
-            "tenantId": tenant,
-            "bucket": bucket,
-            "key": key,
-            "bytes": len(pdf_bytes),
-            "s3_url": s3_url,
-            "cf_url": cf_url,
-            "meta": {
-                "subject": meta.get("subject", ""),
-                "from": meta.get("from", ""),
-                "to": meta.get("to", ""),
-                "cc": meta.get("cc", ""),
-            },
-            "analysis": {
-                "intent": intent,
-                "priority": priority,
-                "summary_len": len(summary),
-                "entities_count": len(entities) if isinstance(entities, list) else 0,
-            }
-        }
+        return _job_result(job)
 
     except ClientError as ce:
         return {"ok": False, "error": f"AWS error: {str(ce)}"}
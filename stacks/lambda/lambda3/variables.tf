@@ -27,6 +27,8 @@ variable "kms_key_id"    { type = string, default = "" }            # optional S
 variable "ki_results_rolling_limit" { type = number, default = 200 }
 variable "presign_expires"          { type = number, default = 600 }
 variable "use_presigned"            { type = bool,   default = false }
+variable "ki_index_mode"            { type = string, default = "legacy" }           # legacy | segments (wie Code-Default)
+variable "index_compaction_schedule" { type = string, default = "rate(5 minutes)" }  # nur bei segments; leer = kein Compactor-Schedule
 variable "extra_env"                { type = map(string), default = {} }
 
 # API Gateway Trigger (entspricht deiner Konsole)
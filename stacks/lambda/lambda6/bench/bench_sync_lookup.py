@@ -0,0 +1,136 @@
+"""
+Lokaler Benchmark: update_status / Tenant-Lookup vor und nach den Index-Migrationen
+(file_sync v2 = s3_key_hash + Indizes, tenants v1 = email_lc).
+
+Braucht eine lokale MySQL 8 (kein Aurora/IAM), z. B.:
+  docker run -d --name bench-mysql -e MYSQL_ROOT_PASSWORD=bench -p 3306:3306 mysql:8.0
+  BENCH_MYSQL_PASSWORD=bench python stacks/lambda/lambda6/bench/bench_sync_lookup.py
+
+Ablauf: Tabellen im Stand vor user-004 anlegen (file_sync v1, tenants ohne email_lc),
+BENCH_ROWS Zeilen laden, _update_sync_status / _resolve_tenant aus dem Handler messen,
+Migrationen über _run_migrations einspielen, identisch erneut messen. Ausgabe: p50/p95 in ms
+plus EXPLAIN-Zugriffstyp je Phase. Die Datenbank BENCH_MYSQL_DB wird dabei neu angelegt.
+"""
+import os, sys, time, random, statistics
+
+# ----------------------------
+# Konfiguration
+# ----------------------------
+HOST = os.environ.get("BENCH_MYSQL_HOST", "127.0.0.1")
+PORT = int(os.environ.get("BENCH_MYSQL_PORT", "3306"))
+USER = os.environ.get("BENCH_MYSQL_USER", "root")
+PASSWORD = os.environ.get("BENCH_MYSQL_PASSWORD", "")
+DB = os.environ.get("BENCH_MYSQL_DB", "bench_file_sync")
+ROWS = int(os.environ.get("BENCH_ROWS", "1000000"))          # file_sync-Zeilen gesamt
+TENANTS = int(os.environ.get("BENCH_TENANTS", "20"))         # Zeilen verteilen sich gleichmäßig
+TENANT_ROWS = int(os.environ.get("BENCH_TENANT_ROWS", "100000"))  # Zeilen in `tenants`
+QUERIES = int(os.environ.get("BENCH_QUERIES", "200"))        # Messungen je Phase
+INSERT_CHUNK = 2000
+
+# Handler braucht diese Variablen beim Import; Verbindungen baut der Benchmark selbst
+os.environ.setdefault("DB_HOST", HOST)
+os.environ.setdefault("META_DB_USER", USER)
+os.environ["META_DB_NAME"] = DB
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import pymysql
+import handler as H
+
+TABLE = "file_sync"
+
+# ----------------------------
+# Daten
+# ----------------------------
+def _key(i: int) -> str:
+    return f"tenants/t{i % TENANTS:03d}/emails/2026/10/{i:09d}-{random.getrandbits(32):08x}.eml"
+
+def _seed(cur):
+    cur.execute(f"DROP DATABASE IF EXISTS `{DB}`")
+    cur.execute(f"CREATE DATABASE `{DB}` DEFAULT CHARSET utf8mb4")
+    cur.execute(f"USE `{DB}`")
+    H._run_migrations(cur, DB, TABLE, H._file_sync_migrations(TABLE)[:1])   # Stand vor user-004
+    cur.execute("""
+        CREATE TABLE tenants (
+            tenant_id VARCHAR(128) PRIMARY KEY,
+            email VARCHAR(320) NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    now = int(time.time() * 1000)
+    keys = []
+    for start in range(0, ROWS, INSERT_CHUNK):
+        rows = []
+        for i in range(start, min(start + INSERT_CHUNK, ROWS)):
+            k = _key(i)
+            keys.append((f"t{i % TENANTS:03d}", k))
+            rows.append((now - i, now - i, f"t{i % TENANTS:03d}", k.rsplit("/", 1)[1], "bench", k, 4096, "stored"))
+        cur.executemany(
+            f"INSERT INTO `{TABLE}` (created_at, updated_at, tenant_id, filename, s3_bucket, s3_key, "
+            f"size_bytes, sync_status) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", rows)
+    emails = []
+    for start in range(0, TENANT_ROWS, INSERT_CHUNK):
+        rows = [(f"tn{i:07d}", f"User{i}@Example.COM") for i in range(start, min(start + INSERT_CHUNK, TENANT_ROWS))]
+        emails.extend(e for _, e in rows)
+        cur.executemany("INSERT INTO tenants (tenant_id, email) VALUES (%s, %s)", rows)
+    cur.execute("ANALYZE TABLE `file_sync`, tenants")
+    cur.fetchall()
+    return keys, emails
+
+# ----------------------------
+# Messung
+# ----------------------------
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+def _explain(cur, sql, params) -> str:
+    cur.execute("EXPLAIN " + sql, params)
+    cols = [d[0] for d in cur.description]
+    row = dict(zip(cols, cur.fetchone()))
+    return f"type={row.get('type')} key={row.get('key')} rows={row.get('rows')}"
+
+def _measure(conn, cur, phase, keys, emails):
+    sample = random.sample(keys, QUERIES)
+    t_upd = []
+    for tenant, k in sample:
+        t0 = time.perf_counter()
+        n = H._update_sync_status(cur, TABLE, tenant, "completed", k, None)
+        t_upd.append((time.perf_counter() - t0) * 1000)
+        assert n == 1, (k, n)
+    t_res = []
+    for e in random.sample(emails, QUERIES):
+        t0 = time.perf_counter()
+        assert H._resolve_tenant(conn, e.upper()) is not None
+        t_res.append((time.perf_counter() - t0) * 1000)
+    cur.execute(f"USE `{DB}`")
+
+    tenant, k = sample[0]
+    if phase == "vorher":
+        ex_upd = _explain(cur, f"SELECT 1 FROM `{TABLE}` WHERE tenant_id=%s AND (s3_key=%s)", (tenant, k))
+        ex_res = _explain(cur, "SELECT tenant_id FROM tenants WHERE LOWER(email)=%s", (emails[0].lower(),))
+    else:
+        ex_upd = _explain(cur, f"SELECT 1 FROM `{TABLE}` WHERE tenant_id=%s AND (s3_key_hash=%s AND s3_key=%s)",
+                          (tenant, H._s3_key_hash(k), k))
+        ex_res = _explain(cur, "SELECT tenant_id FROM tenants WHERE email_lc=%s", (emails[0].lower(),))
+    print(f"[{phase}] update_status  p50={statistics.median(t_upd):8.2f} ms  p95={_pct(t_upd, .95):8.2f} ms  {ex_upd}")
+    print(f"[{phase}] resolve_tenant p50={statistics.median(t_res):8.2f} ms  p95={_pct(t_res, .95):8.2f} ms  {ex_res}")
+
+def main():
+    random.seed(4)
+    conn = pymysql.connect(host=HOST, port=PORT, user=USER, password=PASSWORD, autocommit=True, charset="utf8mb4")
+    cur = conn.cursor()
+    t0 = time.perf_counter()
+    keys, emails = _seed(cur)
+    print(f"seed: {ROWS} file_sync + {TENANT_ROWS} tenants in {time.perf_counter() - t0:.1f}s")
+
+    _measure(conn, cur, "vorher", keys, emails)
+
+    t0 = time.perf_counter()
+    H._run_migrations(cur, DB, TABLE, H._file_sync_migrations(TABLE)[:3])   # v2 Hash/Indizes, v3 Keyset
+    H._ensure_tenants_indexes(cur)
+    cur.execute(f"USE `{DB}`")
+    print(f"migration: {time.perf_counter() - t0:.1f}s")
+
+    _measure(conn, cur, "nachher", keys, emails)
+    conn.close()
+
+if __name__ == "__main__":
+    main()
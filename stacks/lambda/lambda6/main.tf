@@ -25,10 +25,12 @@ module "lambda6" {
   attach_vpc_access  = var.attach_vpc_access
 
   # Capabilities
-  kms_key_alias        = var.kms_key_alias
-  layer_arns           = var.layer_arns
-  s3_read_bucket_names = var.s3_read_bucket_names
-  add_elbv2_describe   = var.add_elbv2_describe
+  kms_key_alias         = var.kms_key_alias
+  layer_arns            = var.layer_arns
+  s3_read_bucket_names  = var.s3_read_bucket_names
+  s3_write_bucket_names = var.s3_write_bucket_names
+  s3_write_prefixes     = var.s3_write_prefixes
+  add_elbv2_describe    = var.add_elbv2_describe
 
   # Invoke permissions
   api_gateway_ids               = var.api_gateway_ids
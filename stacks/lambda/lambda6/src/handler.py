@@ -1,5 +1,7 @@
-import os, json, logging
-from typing import Optional, Dict, Any, Tuple
+import os, json, logging, time, base64, gzip, tempfile, shutil
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Tuple, List
 import boto3, pymysql
 
 logger = logging.getLogger()
@@ -11,6 +13,9 @@ logger.setLevel(logging.INFO)
 REGION = os.environ.get("REGION") or os.environ.get("AWS_REGION") or "us-east-1"
 DB_HOST = os.environ["DB_HOST"]
 DB_PORT = int(os.environ.get("DB_PORT", "3306"))
+DB_READER_HOST = os.environ.get("DB_READER_HOST", "")  # Aurora Reader-Endpoint; leer = alles auf Writer
+READER_CONNECT_TIMEOUT = int(os.environ.get("READER_CONNECT_TIMEOUT", "3"))  # kurz, danach Fallback auf Writer
+READER_RETRY_SECONDS = int(os.environ.get("READER_RETRY_SECONDS", "30"))    # so lange Reader nach Fehler meiden
 META_DB_NAME = os.environ.get("META_DB_NAME", "miraedrive_db")
 META_DB_USER = os.environ["META_DB_USER"]             # z.B. app_meta_user (IAM)
 TENANT_SCHEMA_PREFIX = os.environ.get("TENANT_SCHEMA_PREFIX", "tenant_")
@@ -21,13 +26,55 @@ READ_TIMEOUT = int(os.environ.get("READ_TIMEOUT", "5"))
 WRITE_TIMEOUT = int(os.environ.get("WRITE_TIMEOUT", "5"))
 S3_BUCKET = os.environ.get("S3_BUCKET", "my-tenant-ingest-bucket")
 S3_PREFIX_TEMPLATE = os.environ.get("S3_PREFIX_TEMPLATE", "tenants/{tenant_id}/emails/")
+S3_KEY_SHARD_CHARS = os.environ.get("S3_KEY_SHARD_CHARS", "")  # gesetzt: Vorgabe an den Mover (tenants/<id>/<shard>/emails/); leer = dessen KEY_SHARD_CHARS
 SES_IDENTITY_PREFIX = os.environ.get("SES_IDENTITY_PREFIX", "tenant-")
 
 # Neu: Einstellungen für Write-/Update-Pfad
 TARGET_TABLE = os.environ.get("TARGET_TABLE", "file_sync")
 AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "0") == "1"  # default AUS, da Tabelle existiert
 
+# Connection-Pool (bleibt über warme Invocations erhalten)
+POOL_MAX_CONNECTIONS = int(os.environ.get("POOL_MAX_CONNECTIONS", "16"))    # LRU-Grenze über (user, schema)
+POOL_PING_AFTER_SECONDS = int(os.environ.get("POOL_PING_AFTER_SECONDS", "30"))  # länger idle -> ping vor Reuse
+TOKEN_TTL_SECONDS = int(os.environ.get("TOKEN_TTL_SECONDS", "840"))         # IAM-Token gilt 15 min -> 1 min Puffer
+
+# Batch-Write (SQS-Batch / Step Functions Map)
+BATCH_INSERT_CHUNK = int(os.environ.get("BATCH_INSERT_CHUNK", "500"))       # Zeilen pro Multi-Row-INSERT
+
+# Tenant-Lookup-Cache (E-Mail -> Tenant), inkl. Negativ-Cache für unbekannte Adressen
+TENANT_CACHE_TTL_SECONDS = int(os.environ.get("TENANT_CACHE_TTL_SECONDS", "300"))
+TENANT_NEG_CACHE_TTL_SECONDS = int(os.environ.get("TENANT_NEG_CACHE_TTL_SECONDS", "60"))
+TENANT_CACHE_MAX = int(os.environ.get("TENANT_CACHE_MAX", "10000"))
+TENANT_CACHE_WARMUP = os.environ.get("TENANT_CACHE_WARMUP", "0") == "1"      # Bulk-Load aus `tenants` beim ersten Lookup
+TENANT_CACHE_WARMUP_LIMIT = int(os.environ.get("TENANT_CACHE_WARMUP_LIMIT", "50000"))  # effektiv höchstens TENANT_CACHE_MAX
+
+# Lese-API (list_files)
+LIST_DEFAULT_LIMIT = int(os.environ.get("LIST_DEFAULT_LIMIT", "50"))
+LIST_MAX_LIMIT = int(os.environ.get("LIST_MAX_LIMIT", "500"))
+
+# Bulk-Statuswechsel (update_status mit keys/filter)
+BULK_UPDATE_CHUNK = int(os.environ.get("BULK_UPDATE_CHUNK", "500"))         # Keys bzw. Zeilen pro UPDATE
+
+# Materialisierte Tenant-Statistik (<TARGET_TABLE>_stats)
+STATS_USER_COUNT_TTL_SECONDS = int(os.environ.get("STATS_USER_COUNT_TTL_SECONDS", "3600"))  # users-Zähler neu zählen nach
+
+# Monatliche Partitionierung + Archivierung nach S3
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "3"))  # so viele Monate im Voraus anlegen
+ARCHIVE_AFTER_MONTHS = int(os.environ.get("ARCHIVE_AFTER_MONTHS", "12"))     # Partitionen älter als N Monate
+ARCHIVE_MAX_PARTITIONS = int(os.environ.get("ARCHIVE_MAX_PARTITIONS", "1"))  # pro Invocation (Lambda-Timeout!)
+ARCHIVE_FETCH_ROWS = int(os.environ.get("ARCHIVE_FETCH_ROWS", "5000"))       # fetchmany-Größe (Server-Side-Cursor)
+ARCHIVE_PREFIX_TEMPLATE = os.environ.get("ARCHIVE_PREFIX_TEMPLATE", "tenants/{tenant_id}/archive/")
+KMS_KEY_ID = os.environ.get("KMS_KEY_ID", "")                               # optional: SSE-KMS für Uploads
+
+# Analytics-Export (Parquet, inkrementell über updated_at)
+EXPORT_TARGET = os.environ.get("EXPORT_TARGET", f"s3://{S3_BUCKET}/analytics/file_sync/")  # s3://bucket/prefix/ oder lokaler Pfad
+EXPORT_MAX_ROWS = int(os.environ.get("EXPORT_MAX_ROWS", "200000"))         # pro Invocation; Rest beim nächsten Lauf
+EXPORT_OVERLAP_SECONDS = int(os.environ.get("EXPORT_OVERLAP_SECONDS", "300"))  # Nachlese vor dem Watermark (späte Commits)
+PARQUET_ROW_GROUP_ROWS = int(os.environ.get("PARQUET_ROW_GROUP_ROWS", "50000"))  # Zeilen pro Row-Group (Puffer im RAM)
+EXPORT_MAX_OPEN_SEGMENTS = int(os.environ.get("EXPORT_MAX_OPEN_SEGMENTS", "4"))  # offene Tages-Writer je Export (je ein Puffer)
+
 RDS_CLIENT = boto3.client("rds", region_name=REGION)
+S3_CLIENT = boto3.client("s3", region_name=REGION)
 
 # ----------------------------
 # Utils (bestehend)
@@ -66,20 +113,112 @@ def _debug_fs():
     except Exception as e:
         logger.exception(f"[TLS DEBUG] FS check failed: {e}")
 
-def _token(user: str) -> str:
-    return RDS_CLIENT.generate_db_auth_token(
-        DBHostname=DB_HOST, Port=DB_PORT, DBUsername=user, Region=REGION
+# ----------------------------
+# Connection-Pool + Token-Cache
+# ----------------------------
+# Modul-Level, damit warme Lambda-Container Verbindungen und IAM-Tokens wiederverwenden.
+# Endpoints: "writer" = DB_HOST, "reader" = DB_READER_HOST (nur für Read-only-Pfade).
+_TOKEN_CACHE: Dict[Tuple[str, str], Tuple[str, float]] = {}  # (host, user) -> (token, expires_monotonic)
+_POOL: "OrderedDict[Tuple[str, str, Optional[str]], Dict[str, Any]]" = OrderedDict()  # (endpoint, user, db)
+_POOL_STATS: Dict[str, Dict[str, int]] = {
+    ep: {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "discards": 0, "fallbacks": 0}
+    for ep in ("writer", "reader")
+}
+_reader_down_until = 0.0
+
+def _host_for(endpoint: str) -> str:
+    return DB_READER_HOST if endpoint == "reader" else DB_HOST
+
+def _token(user: str, host: str = DB_HOST) -> str:
+    now = time.monotonic()
+    cached = _TOKEN_CACHE.get((host, user))
+    if cached and cached[1] > now:
+        return cached[0]
+    tok = RDS_CLIENT.generate_db_auth_token(
+        DBHostname=host, Port=DB_PORT, DBUsername=user, Region=REGION
     )
+    _TOKEN_CACHE[(host, user)] = (tok, now + TOKEN_TTL_SECONDS)
+    return tok
+
+def _close_quietly(c):
+    try: c.close()
+    except: pass
+
+def _alive(c) -> bool:
+    # reconnect=False: ein Reconnect würde das (evtl. abgelaufene) Token der alten Verbindung nutzen
+    try:
+        c.ping(reconnect=False)
+        return True
+    except Exception:
+        return False
+
+def _pool_stats() -> Dict[str, Dict[str, int]]:
+    out = {}
+    for ep, st in _POOL_STATS.items():
+        out[ep] = dict(st, size=sum(1 for k in _POOL if k[0] == ep))
+    return out
+
+def _discard(c):
+    """Verbindung nach Fehler aus dem Pool nehmen (Zustand unklar) und schließen."""
+    for key, entry in list(_POOL.items()):
+        if entry["conn"] is c:
+            del _POOL[key]
+            _POOL_STATS[key[0]]["discards"] += 1
+            break
+    _close_quietly(c)
 
-def _conn(user: str, database: Optional[str]):
+def _conn(user: str, database: Optional[str], readonly: bool = False):
+    """
+    Liefert eine gepoolte Verbindung für (user, database).
+    readonly=True nutzt den Reader-Endpoint (falls DB_READER_HOST gesetzt) und fällt
+    auf den Writer zurück, wenn der Reader nicht erreichbar ist.
+    Aufrufer schließen NICHT selbst; bei Fehlern _discard(conn) aufrufen.
+    """
+    global _reader_down_until
+    if readonly and DB_READER_HOST and time.monotonic() >= _reader_down_until:
+        try:
+            return _pooled("reader", user, database)
+        except Exception as e:
+            _reader_down_until = time.monotonic() + READER_RETRY_SECONDS
+            _POOL_STATS["reader"]["fallbacks"] += 1
+            logger.warning(f"[DB] Reader nicht erreichbar, nutze Writer ({READER_RETRY_SECONDS}s): {type(e).__name__}: {e}")
+    return _pooled("writer", user, database)
+
+def _pooled(endpoint: str, user: str, database: Optional[str]):
+    key = (endpoint, user, database)
+    stats = _POOL_STATS[endpoint]
+    now = time.monotonic()
+    entry = _POOL.get(key)
+    if entry is not None:
+        c = entry["conn"]
+        if now - entry["last_used"] < POOL_PING_AFTER_SECONDS or _alive(c):
+            entry["last_used"] = now
+            _POOL.move_to_end(key)
+            stats["hits"] += 1
+            return c
+        del _POOL[key]
+        _close_quietly(c)
+        stats["stale"] += 1
+
+    stats["misses"] += 1
+    c = _connect(_host_for(endpoint), user, database,
+                 READER_CONNECT_TIMEOUT if endpoint == "reader" else CONNECT_TIMEOUT)
+    _POOL[key] = {"conn": c, "last_used": now}
+    while len(_POOL) > POOL_MAX_CONNECTIONS:
+        old_key, old = _POOL.popitem(last=False)  # least recently used
+        _close_quietly(old["conn"])
+        _POOL_STATS[old_key[0]]["evictions"] += 1
+    return c
+
+def _connect(host: str, user: str, database: Optional[str], connect_timeout: int = CONNECT_TIMEOUT):
     return pymysql.connect(
-        host=DB_HOST,
+        host=host,
         user=user,
-        password=_token(user),
+        password=_token(user, host),
         database=database,
         port=DB_PORT,
         ssl={"ca": CA_PATH},
-        connect_timeout=CONNECT_TIMEOUT,
+        connect_timeout=connect_timeout,
         read_timeout=READ_TIMEOUT,
         write_timeout=WRITE_TIMEOUT,
         charset="utf8mb4",
@@ -90,17 +229,69 @@ def _resolve_tenant(meta_conn, email: str) -> Optional[Tuple[str, str, str]]:
     email_norm = email.strip().lower()
     with meta_conn.cursor() as cur:
         cur.execute(f"USE `{META_DB_NAME}`;")
-        cur.execute("""
-            SELECT tenant_id, email, '' as name
-            FROM tenants
-            WHERE LOWER(email) = %s
-            LIMIT 1
-        """, (email_norm,))
+        try:
+            cur.execute("""
+                SELECT tenant_id, email, '' as name
+                FROM tenants
+                WHERE email_lc = %s
+                LIMIT 1
+            """, (email_norm,))
+        except Exception as e:
+            if not _is_unknown_column(e):
+                raise
+            cur.execute("""
+                SELECT tenant_id, email, '' as name
+                FROM tenants
+                WHERE LOWER(email) = %s
+                LIMIT 1
+            """, (email_norm,))
         row = cur.fetchone()
         if not row:
             return None
         return str(row[0]), str(row[1]), ""  # (tenant_id, email, name)
 
+# ----------------------------
+# Tenant-Lookup-Cache (TTL + LRU)
+# ----------------------------
+# email_norm -> (result|None, expires_monotonic); None = "tenant_not_found" (kürzere TTL)
+_TENANT_CACHE: "OrderedDict[str, Tuple[Optional[Tuple[str, str, str]], float]]" = OrderedDict()
+_TENANT_CACHE_STATS = {"hits": 0, "negative_hits": 0, "misses": 0, "warmed": 0}
+_tenant_cache_warmed = False
+
+def _tenant_cache_get(email_norm: str) -> Tuple[bool, Optional[Tuple[str, str, str]]]:
+    entry = _TENANT_CACHE.get(email_norm)
+    if entry is None or entry[1] <= time.monotonic():
+        if entry is not None:
+            del _TENANT_CACHE[email_norm]
+        _TENANT_CACHE_STATS["misses"] += 1
+        return False, None
+    _TENANT_CACHE.move_to_end(email_norm)
+    _TENANT_CACHE_STATS["hits" if entry[0] else "negative_hits"] += 1
+    return True, entry[0]
+
+def _tenant_cache_put(email_norm: str, res: Optional[Tuple[str, str, str]]):
+    ttl = TENANT_CACHE_TTL_SECONDS if res else TENANT_NEG_CACHE_TTL_SECONDS
+    _TENANT_CACHE[email_norm] = (res, time.monotonic() + ttl)
+    _TENANT_CACHE.move_to_end(email_norm)
+    while len(_TENANT_CACHE) > TENANT_CACHE_MAX:
+        _TENANT_CACHE.popitem(last=False)
+
+def _warm_tenant_cache(meta_conn) -> int:
+    """Einmaliger Bulk-Load (Cold Start) aller Tenant-Adressen bis TENANT_CACHE_WARMUP_LIMIT."""
+    global _tenant_cache_warmed
+    _tenant_cache_warmed = True
+    # nie mehr laden als der Cache hält: der Rest würde sofort wieder per LRU verdrängt
+    limit = min(TENANT_CACHE_WARMUP_LIMIT, TENANT_CACHE_MAX)
+    with meta_conn.cursor() as cur:
+        cur.execute(f"USE `{META_DB_NAME}`;")
+        cur.execute("SELECT tenant_id, email FROM tenants LIMIT %s", (limit,))
+        rows = cur.fetchall()
+    for tenant_id, email in rows:
+        if email:
+            _tenant_cache_put(str(email).strip().lower(), (str(tenant_id), str(email), ""))
+    _TENANT_CACHE_STATS["warmed"] = len(rows)
+    return len(rows)
+
 # ----------------------------
 # Helpers für EventBridge/StepFunctions-Wrapper
 # ----------------------------
@@ -112,47 +303,282 @@ def _take_detail(e: Dict[str, Any]) -> Dict[str, Any]:
 # ----------------------------
 # Write-/Update-Pfad (NEU)
 # ----------------------------
-def _ensure_file_sync_table(cur, table: str):
+# Versionierte Migrationen: (version, beschreibung, [statements]); nur anhängen, nie ändern.
+# ALTERs laufen online (ALGORITHM=INPLACE, LOCK=NONE); virtuelle Spalten brauchen keinen Table-Rebuild.
+# Ausnahme: Versionen in _FILE_SYNC_COPY_VERSIONS kopieren die Tabelle und laufen nur per action=migrate;
+# der Schreibpfad (AUTO_MIGRATE, READ_TIMEOUT 5 s) bleibt davor stehen.
+SCHEMA_MIGRATIONS_TABLE = "schema_migrations"
+_FILE_SYNC_COPY_VERSIONS = (5,)                        # PK-Wechsel + PARTITION BY (Table-Copy)
+_MIGRATED: Dict[Tuple[Optional[str], str], int] = {}   # (schema, name) -> version, pro Container
+
+# dim -> SQL-Ausdruck für den Backfill (muss zu _stats_key/_insert_deltas passen)
+_STATS_BACKFILL_DIMS = (
+    ("docs", "''"),
+    # UTC ohne Session-Zeitzone: DATETIME-Arithmetik statt FROM_UNIXTIME (hängt an time_zone, und ein
+    # SET time_zone bliebe auf der gepoolten Verbindung hängen)
+    ("day", "DATE_FORMAT(DATE_ADD('1970-01-01', INTERVAL created_at DIV 1000 SECOND), '%Y-%m-%d')"),
+    ("intent", "COALESCE(analysis_intent, '')"),
+    ("priority", "COALESCE(analysis_priority, '')"),
+    ("status", "sync_status"),
+)
+
+def _file_sync_migrations(table: str) -> List[Tuple[int, str, List[Any]]]:
+    return [
+        (1, "create table", [f"""
+            CREATE TABLE IF NOT EXISTS `{table}` (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                created_at BIGINT NOT NULL,
+                updated_at BIGINT NOT NULL,
+                tenant_id VARCHAR(128) NOT NULL,
+                filename VARCHAR(512) NOT NULL,
+                s3_url TEXT,
+                cf_url TEXT,
+                s3_bucket VARCHAR(256),
+                s3_key TEXT,
+                size_bytes BIGINT,
+                delivered_to JSON,
+                sync_status VARCHAR(32) NOT NULL, -- pending|dispatched|failed|stored|completed
+                meta_subject TEXT,
+                meta_from TEXT,
+                meta_to TEXT,
+                meta_cc TEXT,
+                analysis_summary TEXT,
+                analysis_intent VARCHAR(64),
+                analysis_priority VARCHAR(32),
+                analysis_entities JSON
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """]),
+        (2, "s3_key_hash + lookup indexes", [
+            f"ALTER TABLE `{table}` ADD COLUMN s3_key_hash BINARY(16) AS (UNHEX(MD5(s3_key))) VIRTUAL, "
+            f"ALGORITHM=INPLACE, LOCK=NONE",
+            f"ALTER TABLE `{table}` "
+            f"ADD INDEX idx_tenant_s3key_hash (tenant_id, s3_key_hash), "
+            f"ADD INDEX idx_tenant_filename (tenant_id, filename), "
+            f"ADD INDEX idx_tenant_status_created (tenant_id, sync_status, created_at), "
+            f"ALGORITHM=INPLACE, LOCK=NONE",
+        ]),
+        (3, "keyset listing index", [
+            # InnoDB hängt den PK (id) implizit an -> deckt ORDER BY created_at, id ab
+            f"ALTER TABLE `{table}` ADD INDEX idx_tenant_created (tenant_id, created_at), "
+            f"ALGORITHM=INPLACE, LOCK=NONE",
+        ]),
+        (4, "materialized tenant stats", [
+            f"""
+            CREATE TABLE IF NOT EXISTS `{table}_stats` (
+                tenant_id VARCHAR(128) NOT NULL,
+                dim VARCHAR(16) NOT NULL,      -- docs|day|intent|priority|status|users
+                k VARCHAR(64) NOT NULL DEFAULT '',
+                cnt BIGINT NOT NULL DEFAULT 0,
+                updated_at BIGINT NOT NULL,
+                PRIMARY KEY (tenant_id, dim, k)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """,
+            # Einmaliges Backfill aus dem Bestand; danach inkrementell über _apply_stats
+            *[
+                f"INSERT INTO `{table}_stats` (tenant_id, dim, k, cnt, updated_at) "
+                f"SELECT tenant_id, '{dim}', LEFT({expr}, 64), COUNT(*), UNIX_TIMESTAMP() * 1000 "
+                f"FROM `{table}` GROUP BY tenant_id, LEFT({expr}, 64) "
+                f"ON DUPLICATE KEY UPDATE cnt = VALUES(cnt), updated_at = VALUES(updated_at)"
+                for dim, expr in _STATS_BACKFILL_DIMS
+            ],
+        ]),
+        # Achtung: PK-Wechsel + PARTITION BY kopieren die Tabelle (kein INPLACE möglich).
+        # Bei großen Tenants explizit per action=migrate im Wartungsfenster ausführen.
+        (5, "monthly range partitions on created_at", [
+            lambda cur: _partition_table(cur, table),
+        ]),
+        (6, "incremental export index", [
+            f"ALTER TABLE `{table}` ADD INDEX idx_tenant_updated (tenant_id, updated_at), "
+            f"ALGORITHM=INPLACE, LOCK=NONE",
+        ]),
+    ]
+
+def _tenants_migrations() -> List[Tuple[int, str, List[str]]]:
+    return [
+        (1, "email_lc + index", [
+            "ALTER TABLE tenants ADD COLUMN email_lc VARCHAR(320) AS (LOWER(email)) VIRTUAL, "
+            "ALGORITHM=INPLACE, LOCK=NONE",
+            "ALTER TABLE tenants ADD INDEX idx_tenants_email_lc (email_lc), ALGORITHM=INPLACE, LOCK=NONE",
+        ]),
+    ]
+
+def _run_migrations(cur, schema: Optional[str], name: str,
+                    migrations: List[Tuple[int, str, List[Any]]], stop_before: Optional[int] = None) -> int:
+    """
+    Spielt alle noch fehlenden Migrationen für `name` ein und liefert die aktuelle Version.
+    stop_before: ab dieser Version nichts einspielen (Schreibpfad vor Table-Copy-Migrationen).
+    """
+    pending = [m for m in migrations if stop_before is None or m[0] < stop_before]
+    latest = pending[-1][0]
+    if _MIGRATED.get((schema, name), 0) >= latest:
+        return _MIGRATED[(schema, name)]
+
     cur.execute(f"""
-        CREATE TABLE IF NOT EXISTS `{table}` (
-            id BIGINT AUTO_INCREMENT PRIMARY KEY,
-            created_at BIGINT NOT NULL,
-            updated_at BIGINT NOT NULL,
-            tenant_id VARCHAR(128) NOT NULL,
-            filename VARCHAR(512) NOT NULL,
-            s3_url TEXT,
-            cf_url TEXT,
-            s3_bucket VARCHAR(256),
-            s3_key TEXT,
-            size_bytes BIGINT,
-            delivered_to JSON,
-            sync_status VARCHAR(32) NOT NULL, -- pending|dispatched|failed|stored|completed
-            meta_subject TEXT,
-            meta_from TEXT,
-            meta_to TEXT,
-            meta_cc TEXT,
-            analysis_summary TEXT,
-            analysis_intent VARCHAR(64),
-            analysis_priority VARCHAR(32),
-            analysis_entities JSON
+        CREATE TABLE IF NOT EXISTS `{SCHEMA_MIGRATIONS_TABLE}` (
+            name VARCHAR(64) NOT NULL,
+            version INT NOT NULL,
+            description VARCHAR(255),
+            applied_at BIGINT NOT NULL,
+            PRIMARY KEY (name, version)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
     """)
+    cur.execute(f"SELECT COALESCE(MAX(version), 0) FROM `{SCHEMA_MIGRATIONS_TABLE}` WHERE name=%s", (name,))
+    current = int(cur.fetchone()[0])
 
-def _insert_file_sync(cur, table: str, rec: Dict[str, Any]):
-    sql = f"""
-        INSERT INTO `{table}` (
-          created_at, updated_at, tenant_id, filename, s3_url, cf_url,
-          s3_bucket, s3_key, size_bytes, delivered_to, sync_status,
-          meta_subject, meta_from, meta_to, meta_cc,
-          analysis_summary, analysis_intent, analysis_priority, analysis_entities
-        ) VALUES (
-          %(created_at)s, %(updated_at)s, %(tenant_id)s, %(filename)s, %(s3_url)s, %(cf_url)s,
-          %(s3_bucket)s, %(s3_key)s, %(size_bytes)s, CAST(%(delivered_to)s AS JSON), %(sync_status)s,
-          %(meta_subject)s, %(meta_from)s, %(meta_to)s, %(meta_cc)s,
-          %(analysis_summary)s, %(analysis_intent)s, %(analysis_priority)s, CAST(%(analysis_entities)s AS JSON)
+    for version, desc, stmts in pending:
+        if version <= current:
+            continue
+        for sql in stmts:
+            try:
+                sql(cur) if callable(sql) else cur.execute(sql)
+            except pymysql.err.MySQLError as e:
+                # 1060 duplicate column / 1061 duplicate key: Schritt lief schon (z. B. abgebrochene Migration)
+                if e.args and e.args[0] in (1060, 1061):
+                    continue
+                raise
+        cur.execute(
+            f"INSERT INTO `{SCHEMA_MIGRATIONS_TABLE}` (name, version, description, applied_at) VALUES (%s, %s, %s, %s)",
+            (name, version, desc, int(time.time() * 1000)),
         )
+        logger.info(f"[MIGRATE] {schema}.{name} -> v{version} ({desc})")
+        current = version
+
+    if stop_before is not None and current < stop_before <= migrations[-1][0]:
+        logger.warning(f"[MIGRATE] {schema}.{name}: v{stop_before}+ kopiert die Tabelle -> action=migrate ausführen")
+    _MIGRATED[(schema, name)] = current
+    return current
+
+def _ensure_file_sync_table(cur, table: str, schema: Optional[str] = None, online_only: bool = True) -> int:
+    """
+    online_only (Schreibpfad): nur Migrationen vor der ersten Table-Copy-Version; die laufen
+    ausschließlich über action=migrate (_handle_migrate, online_only=False).
+    """
+    stop = min(_FILE_SYNC_COPY_VERSIONS) if online_only else None
+    version = _run_migrations(cur, schema, table, _file_sync_migrations(table), stop_before=stop)
+    _ensure_partitions(cur, table, schema)
+    return version
+
+# ----------------------------
+# Partitionierung (RANGE über created_at, ein Partition pro Monat)
+# ----------------------------
+# Partition pYYYYMM enthält created_at < Monatsanfang des Folgemonats (epoch ms, UTC);
+# pmax fängt alles Spätere ab und wird per REORGANIZE vorausschauend aufgeteilt.
+_PARTITIONS_CHECKED: Dict[Tuple[Optional[str], str], str] = {}   # (schema, table) -> "YYYYMM" zuletzt geprüft
+
+def _add_months(y: int, m: int, n: int) -> Tuple[int, int]:
+    idx = y * 12 + (m - 1) + n
+    return idx // 12, idx % 12 + 1
+
+def _month_start_ms(y: int, m: int) -> int:
+    return int(datetime(y, m, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+def _partition_defs(first: Tuple[int, int], last: Tuple[int, int]) -> List[str]:
+    defs = []
+    y, m = first
+    while (y, m) <= last:
+        ny, nm = _add_months(y, m, 1)
+        defs.append(f"PARTITION p{y:04d}{m:02d} VALUES LESS THAN ({_month_start_ms(ny, nm)})")
+        y, m = ny, nm
+    return defs
+
+def _partitions(cur, table: str) -> List[Tuple[str, str]]:
+    cur.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+          FROM information_schema.PARTITIONS
+         WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+         ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    return [(str(r[0]), str(r[1])) for r in cur.fetchall()]
+
+def _partition_table(cur, table: str):
+    if _partitions(cur, table):
+        return
+    now = datetime.now(timezone.utc)
+    cur.execute(f"SELECT MIN(created_at) FROM `{table}`")
+    min_created = cur.fetchone()[0]
+    first = (now.year, now.month)
+    if min_created is not None:
+        dt = datetime.fromtimestamp(int(min_created) / 1000, tz=timezone.utc)
+        first = min(first, (dt.year, dt.month))
+    last = _add_months(now.year, now.month, PARTITION_MONTHS_AHEAD)
+    # Jeder Unique-Key muss die Partitionsspalte enthalten -> PK (id, created_at)
+    cur.execute(f"ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)")
+    cur.execute(
+        f"ALTER TABLE `{table}` PARTITION BY RANGE (created_at) ("
+        + ", ".join(_partition_defs(first, last) + ["PARTITION pmax VALUES LESS THAN MAXVALUE"])
+        + ")"
+    )
+
+def _ensure_partitions(cur, table: str, schema: Optional[str] = None):
+    """Legt fehlende Monats-Partitionen bis PARTITION_MONTHS_AHEAD an (max. 1x pro Monat/Container)."""
+    now = datetime.now(timezone.utc)
+    month = f"{now.year:04d}{now.month:02d}"
+    if _PARTITIONS_CHECKED.get((schema, table)) == month:
+        return
+    parts = [name for name, _ in _partitions(cur, table) if name != "pmax"]
+    if parts:
+        ly, lm = int(parts[-1][1:5]), int(parts[-1][5:7])
+        target = _add_months(now.year, now.month, PARTITION_MONTHS_AHEAD)
+        if (ly, lm) < target:
+            defs = _partition_defs(_add_months(ly, lm, 1), target)
+            cur.execute(
+                f"ALTER TABLE `{table}` REORGANIZE PARTITION pmax INTO ("
+                + ", ".join(defs + ["PARTITION pmax VALUES LESS THAN MAXVALUE"]) + ")"
+            )
+            logger.info(f"[PARTITION] {schema}.{table}: +{len(defs)} Monate bis p{target[0]:04d}{target[1]:02d}")
+    _PARTITIONS_CHECKED[(schema, table)] = month
+
+def _roll_partitions(cur, table: str, schema: Optional[str] = None):
     """
-    cur.execute(sql, rec)
+    Regulärer Schreibpfad: Monats-Partitionen vor dem Insert nachziehen, damit Inserts nach
+    dem Horizont nicht in pmax landen. Dank _PARTITIONS_CHECKED höchstens ein information_schema-
+    Read pro Container und Monat; Fehler (paralleles REORGANIZE, fehlende ALTER-Rechte) blockieren
+    den Insert nicht und werden erst im nächsten Monat bzw. Container erneut versucht.
+    """
+    try:
+        _ensure_partitions(cur, table, schema)
+    except Exception as e:
+        now = datetime.now(timezone.utc)
+        _PARTITIONS_CHECKED[(schema, table)] = f"{now.year:04d}{now.month:02d}"
+        logger.warning(f"[PARTITION] {schema}.{table}: roll-forward failed: {type(e).__name__}: {e}")
+
+def _ensure_tenants_indexes(cur) -> int:
+    cur.execute(f"USE `{META_DB_NAME}`;")
+    return _run_migrations(cur, META_DB_NAME, "tenants", _tenants_migrations())
+
+def _is_unknown_column(e: Exception) -> bool:
+    # 1054: Spalte fehlt -> Migration in diesem Schema noch nicht eingespielt
+    return isinstance(e, pymysql.err.MySQLError) and bool(e.args) and e.args[0] == 1054
+
+def _s3_key_hash(s3_key: str) -> bytes:
+    # identisch zu UNHEX(MD5(s3_key)) der generierten Spalte (utf8mb4 == UTF-8 Bytes)
+    return hashlib.md5(s3_key.encode("utf-8")).digest()
+
+_FILE_SYNC_INSERT_FIELDS = (
+    "created_at", "updated_at", "tenant_id", "filename", "s3_url", "cf_url",
+    "s3_bucket", "s3_key", "size_bytes", "delivered_to", "sync_status",
+    "meta_subject", "meta_from", "meta_to", "meta_cc",
+    "analysis_summary", "analysis_intent", "analysis_priority", "analysis_entities",
+)
+_FILE_SYNC_JSON_FIELDS = ("delivered_to", "analysis_entities")
+_FILE_SYNC_ROW = "(" + ", ".join(
+    "CAST(%s AS JSON)" if f in _FILE_SYNC_JSON_FIELDS else "%s" for f in _FILE_SYNC_INSERT_FIELDS
+) + ")"
+
+def _insert_file_sync_many(cur, table: str, recs: List[Dict[str, Any]]) -> int:
+    """Ein Multi-Row-INSERT für alle recs (Aufrufer begrenzt die Anzahl)."""
+    if not recs:
+        return 0
+    sql = (
+        f"INSERT INTO `{table}` ({', '.join(_FILE_SYNC_INSERT_FIELDS)}) VALUES "
+        + ", ".join([_FILE_SYNC_ROW] * len(recs))
+    )
+    params = [rec[f] for rec in recs for f in _FILE_SYNC_INSERT_FIELDS]
+    cur.execute(sql, params)
+    return cur.rowcount
+
+def _insert_file_sync(cur, table: str, rec: Dict[str, Any]):
+    _insert_file_sync_many(cur, table, [rec])
 
 def _is_write_payload(event_like: Dict[str, Any]) -> bool:
     d = _take_detail(event_like)
@@ -200,6 +626,270 @@ def _build_record_from_payload(d: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
     }
     return tenant_id, rec
 
+# ----------------------------
+# Materialisierte Tenant-Statistik
+# ----------------------------
+# Zählerzeilen (tenant_id, dim, k) -> cnt im Tenant-Schema, gepflegt in derselben
+# Transaktion wie INSERT/UPDATE auf file_sync. get_stats liest alles mit einem PK-Range-Read.
+def _stats_key(v: Any) -> str:
+    return str(v or "")[:64]
+
+def _insert_deltas(recs: List[Dict[str, Any]]) -> Dict[Tuple[str, str], int]:
+    deltas: Dict[Tuple[str, str], int] = {}
+    for rec in recs:
+        day = datetime.fromtimestamp(rec["created_at"] / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+        for dk in (("docs", ""), ("day", day),
+                   ("intent", _stats_key(rec.get("analysis_intent"))),
+                   ("priority", _stats_key(rec.get("analysis_priority"))),
+                   ("status", _stats_key(rec.get("sync_status")))):
+            deltas[dk] = deltas.get(dk, 0) + 1
+    return deltas
+
+def _status_deltas(old_statuses: List[str], new_status: str) -> Dict[Tuple[str, str], int]:
+    deltas: Dict[Tuple[str, str], int] = {}
+    for old in old_statuses:
+        if old == new_status:
+            continue
+        deltas[("status", _stats_key(old))] = deltas.get(("status", _stats_key(old)), 0) - 1
+        deltas[("status", _stats_key(new_status))] = deltas.get(("status", _stats_key(new_status)), 0) + 1
+    return deltas
+
+def _is_missing_table(e: Exception) -> bool:
+    # 1146: Tabelle fehlt -> Stats-Migration (v4) in diesem Schema noch nicht eingespielt
+    return isinstance(e, pymysql.err.MySQLError) and bool(e.args) and e.args[0] == 1146
+
+def _apply_stats(cur, table: str, tenant_id: str, deltas: Dict[Tuple[str, str], int]) -> bool:
+    """Ein Multi-Row-Upsert mit allen Zähler-Deltas. False, wenn die Stats-Tabelle fehlt."""
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return True
+    now = int(time.time() * 1000)
+    params: List[Any] = []
+    for (dim, k), n in deltas.items():
+        params.extend([tenant_id, dim, k, n, now])
+    sql = (
+        f"INSERT INTO `{table}_stats` (tenant_id, dim, k, cnt, updated_at) VALUES "
+        + ", ".join(["(%s, %s, %s, %s, %s)"] * len(deltas))
+        + " ON DUPLICATE KEY UPDATE cnt = cnt + VALUES(cnt), updated_at = VALUES(updated_at)"
+    )
+    try:
+        cur.execute(sql, params)
+    except Exception as e:
+        if not _is_missing_table(e):
+            raise
+        return False
+    return True
+
+def _user_count(tenant_id: str, t_user: str, schema: str, tconn) -> int:
+    """
+    users-Zähler aus der Stats-Tabelle; nur wenn er fehlt oder älter als
+    STATS_USER_COUNT_TTL_SECONDS ist, einmal COUNT(*) und zurückschreiben (Writer).
+    """
+    now = int(time.time() * 1000)
+    with tconn.cursor() as cur:
+        try:
+            cur.execute(f"SELECT cnt, updated_at FROM `{TARGET_TABLE}_stats` "
+                        f"WHERE tenant_id=%s AND dim='users' AND k=''", (tenant_id,))
+            row = cur.fetchone()
+        except Exception as e:
+            if not _is_missing_table(e):
+                raise
+            row, stats_missing = None, True
+        else:
+            stats_missing = False
+        if row and now - int(row[1]) < STATS_USER_COUNT_TTL_SECONDS * 1000:
+            return int(row[0])
+        cur.execute("SELECT COUNT(*) FROM users;")
+        user_count = int(cur.fetchone()[0])
+
+    if not stats_missing:
+        try:
+            with _conn(t_user, schema).cursor() as wcur:
+                wcur.execute(
+                    f"INSERT INTO `{TARGET_TABLE}_stats` (tenant_id, dim, k, cnt, updated_at) "
+                    f"VALUES (%s, 'users', '', %s, %s) "
+                    f"ON DUPLICATE KEY UPDATE cnt = VALUES(cnt), updated_at = VALUES(updated_at)",
+                    (tenant_id, user_count, now))
+        except Exception as e:
+            logger.warning(f"[STATS] users-Zähler nicht gespeichert: {type(e).__name__}: {e}")
+    return user_count
+
+def _get_stats(cur, table: str, tenant_id: str) -> Dict[str, Any]:
+    cur.execute(f"SELECT dim, k, cnt FROM `{table}_stats` WHERE tenant_id=%s", (tenant_id,))
+    out: Dict[str, Any] = {"documents": 0, "users": None, "by_status": {}, "by_intent": {},
+                           "by_priority": {}, "by_day": {}}
+    for dim, k, cnt in cur.fetchall():
+        cnt = int(cnt)
+        if dim == "docs":
+            out["documents"] = cnt
+        elif dim == "users":
+            out["users"] = cnt
+        elif f"by_{dim}" in out and cnt:
+            out[f"by_{dim}"][k] = cnt
+    return out
+
+def _handle_get_stats(d: Dict[str, Any]) -> Dict[str, Any]:
+    tenant_id = (d.get("tenantId") or d.get("tenant_id") or "").strip()
+    if not tenant_id:
+        return {"ok": False, "error": "missing tenantId"}
+    schema = f"{TENANT_SCHEMA_PREFIX}{tenant_id}"
+    t_user = TENANT_DB_USER_TEMPLATE.format(tenant_id=tenant_id)
+    try:
+        tconn = _conn(t_user, schema, readonly=True)
+    except Exception as e:
+        logger.exception("[DB] Connect failed (get_stats)")
+        return {"ok": False, "tenantId": tenant_id, "error": f"connect_failed: {type(e).__name__}: {e}"}
+    try:
+        with tconn.cursor() as cur:
+            stats = _get_stats(cur, TARGET_TABLE, tenant_id)
+    except Exception as e:
+        if _is_missing_table(e):
+            return {"ok": False, "tenantId": tenant_id, "error": "stats_not_migrated"}
+        logger.exception("[DB] Query failed (get_stats)")
+        _discard(tconn)
+        return {"ok": False, "tenantId": tenant_id, "error": f"query_failed: {type(e).__name__}: {e}"}
+    return {"ok": True, "tenantId": tenant_id, "stats": stats}
+
+# ----------------------------
+# Batch-Write-Pfad (SQS-Batch / Step Functions Map)
+# ----------------------------
+def _unwrap_item(x: Any) -> Any:
+    # lambda:invoke-Ergebnisse aus Step Functions liegen unter "Payload"
+    if isinstance(x, dict) and isinstance(x.get("Payload"), dict):
+        x = x["Payload"]
+    return _take_detail(x) if isinstance(x, dict) else x
+
+def _batch_items(event: Any) -> Optional[Tuple[str, List[Tuple[str, Any]]]]:
+    """
+    Erkennt Batch-Events und liefert (source, [(item_id, payload), ...]):
+      - SQS:  { Records: [ { messageId, body: "<json>" }, ... ] }
+      - Map:  [ payload, ... ]  oder  { Items: [...] } (ItemBatcher) / { items: [...] }
+    Kein Batch -> None.
+    """
+    if isinstance(event, list):
+        return "map", [(str(i), _unwrap_item(x)) for i, x in enumerate(event)]
+    if not isinstance(event, dict):
+        return None
+    recs = event.get("Records")
+    if isinstance(recs, list) and recs and all(isinstance(r, dict) and r.get("eventSource") == "aws:sqs" for r in recs):
+        out = []
+        for i, r in enumerate(recs):
+            try:
+                body = json.loads(r.get("body") or "")
+            except Exception:
+                body = None
+            out.append((str(r.get("messageId") or i), _unwrap_item(body)))
+        return "sqs", out
+    items = event.get("Items") if isinstance(event.get("Items"), list) else event.get("items")
+    if isinstance(items, list) and not event.get("action"):
+        return "map", [(str(i), _unwrap_item(x)) for i, x in enumerate(items)]
+    return None
+
+def _batch_failures(results: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Partial Batch Response (ReportBatchItemFailures): nur vorübergehende Fehler (retryable)
+    erneut zustellen. Dauerhafte Fehler würden bis maxReceiveCount kreisen und in der DLQ
+    landen, ohne dass ein Retry etwas ändert -> loggen und quittieren.
+    """
+    out = []
+    for r in results:
+        if r.get("ok"):
+            continue
+        if r.get("retryable"):
+            out.append({"itemIdentifier": r["id"]})
+        else:
+            print(f"[batch] permanent failure, acknowledged: id={r.get('id')} error={r.get('error')}")
+    return out
+
+def _is_transient_db_error(e: Exception) -> bool:
+    # Verbindung/Lock/Deadlock (Operational/Interface) und fehlende Tabelle (Migration folgt)
+    # heilen bei erneuter Zustellung; Daten-/Constraint-Fehler nicht
+    return isinstance(e, (pymysql.err.OperationalError, pymysql.err.InterfaceError)) or _is_missing_table(e)
+
+def _store_tenant_group(tenant_id: str, recs: List[Dict[str, Any]]) -> List[Optional[Tuple[str, bool]]]:
+    """
+    Schreibt alle Records eines Tenants über EINE Verbindung in EINER Transaktion.
+    Schlägt das fehl, wird zeilenweise nachgeschrieben, damit nur fehlerhafte
+    Datensätze scheitern. Rückgabe pro Record: None = ok, sonst (Fehlertext, retryable).
+    """
+    schema = f"{TENANT_SCHEMA_PREFIX}{tenant_id}"
+    t_user = TENANT_DB_USER_TEMPLATE.format(tenant_id=tenant_id)
+    try:
+        tconn = _conn(t_user, schema)
+    except Exception as e:
+        logger.exception(f"[DB] Connect failed (batch) tenant={tenant_id}")
+        return [(f"connect_failed: {type(e).__name__}: {e}", True)] * len(recs)
+
+    try:
+        with tconn.cursor() as cur:
+            if AUTO_MIGRATE:
+                _ensure_file_sync_table(cur, TARGET_TABLE, schema)  # DDL committet implizit -> vor BEGIN
+            else:
+                _roll_partitions(cur, TARGET_TABLE, schema)
+            tconn.begin()
+            for i in range(0, len(recs), BATCH_INSERT_CHUNK):
+                _insert_file_sync_many(cur, TARGET_TABLE, recs[i:i + BATCH_INSERT_CHUNK])
+            _apply_stats(cur, TARGET_TABLE, tenant_id, _insert_deltas(recs))
+            tconn.commit()
+        return [None] * len(recs)
+    except Exception as e:
+        logger.warning(f"[DB] Batch insert failed tenant={tenant_id}, fallback row-by-row: {type(e).__name__}: {e}")
+        try:
+            tconn.rollback()
+        except Exception as re:
+            _discard(tconn)
+            return [(f"insert_failed: {type(re).__name__}: {re}", True)] * len(recs)
+
+    errs: List[Optional[Tuple[str, bool]]] = []
+    with tconn.cursor() as cur:
+        for rec in recs:
+            try:
+                tconn.begin()
+                _insert_file_sync(cur, TARGET_TABLE, rec)
+                _apply_stats(cur, TARGET_TABLE, tenant_id, _insert_deltas([rec]))
+                tconn.commit()
+                errs.append(None)
+            except Exception as e:
+                try: tconn.rollback()
+                except: pass
+                errs.append((f"insert_failed: {type(e).__name__}: {e}", _is_transient_db_error(e)))
+    if all(errs):
+        _discard(tconn)  # vermutlich Verbindung kaputt, nicht wiederverwenden
+    return errs
+
+def _handle_write_batch(source: str, items: List[Tuple[str, Any]]) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    groups: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for idx, (item_id, payload) in enumerate(items):
+        if not isinstance(payload, dict) or not _is_write_payload(payload):
+            results[idx] = {"id": item_id, "ok": False, "error": "invalid_payload", "retryable": False}
+            continue
+        tenant_id, rec = _build_record_from_payload(payload)
+        groups.setdefault(tenant_id, []).append((idx, rec))
+
+    for tenant_id, members in groups.items():
+        errs = _store_tenant_group(tenant_id, [rec for _, rec in members])
+        for (idx, rec), err in zip(members, errs):
+            res = {"id": items[idx][0], "ok": err is None, "tenantId": tenant_id,
+                   "file": {"s3_key": rec["s3_key"], "filename": rec["filename"]}}
+            if err:
+                res["error"], res["retryable"] = err
+            results[idx] = res
+
+    failed = [r for r in results if not r.get("ok")]
+    out: Dict[str, Any] = {
+        "ok": not failed,
+        "count": len(results),
+        "stored": len(results) - len(failed),
+        "failed": len(failed),
+        "tenants": len(groups),
+        "results": results,
+        "db": {"table": TARGET_TABLE, "pool": _pool_stats()},
+    }
+    if source == "sqs":
+        out["batchItemFailures"] = _batch_failures(results)
+    return out
+
 def _match_keys(d: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
     f = d.get("file") or {}
     s3_key = f.get("s3_key") or f.get("key")
@@ -210,23 +900,639 @@ def _update_sync_status(cur, table: str, tenant_id: str,
                         new_status: str, s3_key: Optional[str], filename: Optional[str]) -> int:
     import time as _time
     now = int(_time.time() * 1000)
-    conds = []
-    params = [new_status, now, tenant_id]
-    if s3_key:
-        conds.append("s3_key=%s")
-        params.append(s3_key)
-    if filename:
-        conds.append("filename=%s")
-        params.append(filename)
-    if not conds:
-        raise ValueError("need file.s3_key or file.filename for update_status")
+
+    def run(indexed: bool) -> int:
+        conds = []
+        params = [new_status, now, tenant_id]
+        if s3_key:
+            if indexed:
+                # (tenant_id, s3_key_hash)-Index; s3_key-Vergleich schützt gegen Hash-Kollisionen
+                conds.append("(s3_key_hash=%s AND s3_key=%s)")
+                params.extend([_s3_key_hash(s3_key), s3_key])
+            else:
+                conds.append("s3_key=%s")
+                params.append(s3_key)
+        if filename:
+            conds.append("filename=%s")
+            params.append(filename)
+        if not conds:
+            raise ValueError("need file.s3_key or file.filename for update_status")
+        where = f"tenant_id=%s AND ({' OR '.join(conds)})"
+        cur.execute(f"SELECT sync_status FROM `{table}` WHERE {where} FOR UPDATE", params[2:])
+        old_statuses = [r[0] for r in cur.fetchall()]
+        sql = f"""
+            UPDATE `{table}`
+               SET sync_status=%s, updated_at=%s
+             WHERE {where}
+        """
+        cur.execute(sql, params)
+        affected = cur.rowcount
+        _apply_stats(cur, table, tenant_id, _status_deltas(old_statuses, new_status))
+        return affected
+
+    conn = cur.connection
+    conn.begin()
+    try:
+        try:
+            affected = run(indexed=True)
+        except Exception as e:
+            if not _is_unknown_column(e):
+                raise
+            affected = run(indexed=False)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return affected
+
+def _bulk_update_by_keys(conn, table: str, tenant_id: str, new_status: str,
+                         keys: List[str]) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Ein UPDATE pro Chunk über den (tenant_id, s3_key_hash)-Index.
+    Die betroffenen Keys werden vorher per SELECT ... FOR UPDATE in derselben
+    Transaktion bestimmt, damit das Ergebnis pro Key exakt ist.
+    """
+    now = int(time.time() * 1000)
+    keys = list(dict.fromkeys(k for k in keys if k))   # dedupe, Reihenfolge behalten
+    matched: set = set()
+    total = 0
+
+    def run_chunk(cur, chunk: List[str], indexed: bool) -> int:
+        marks = ", ".join(["%s"] * len(chunk))
+        if indexed:
+            where = f"tenant_id=%s AND s3_key_hash IN ({marks}) AND s3_key IN ({marks})"
+            wparams = [tenant_id] + [_s3_key_hash(k) for k in chunk] + chunk
+        else:
+            where = f"tenant_id=%s AND s3_key IN ({marks})"
+            wparams = [tenant_id] + chunk
+        cur.execute(f"SELECT s3_key, sync_status FROM `{table}` WHERE {where} FOR UPDATE", wparams)
+        rows = cur.fetchall()
+        matched.update(r[0] for r in rows)
+        cur.execute(f"UPDATE `{table}` SET sync_status=%s, updated_at=%s WHERE {where}",
+                    [new_status, now] + wparams)
+        affected = cur.rowcount
+        _apply_stats(cur, table, tenant_id, _status_deltas([r[1] for r in rows], new_status))
+        return affected
+
+    with conn.cursor() as cur:
+        for i in range(0, len(keys), BULK_UPDATE_CHUNK):
+            chunk = keys[i:i + BULK_UPDATE_CHUNK]
+            conn.begin()
+            try:
+                try:
+                    total += run_chunk(cur, chunk, indexed=True)
+                except Exception as e:
+                    if not _is_unknown_column(e):
+                        raise
+                    total += run_chunk(cur, chunk, indexed=False)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    results = [{"s3_key": k, "status": "updated" if k in matched else "no_row_matched"} for k in keys]
+    return total, results
+
+def _bulk_update_by_filter(conn, table: str, tenant_id: str, new_status: str,
+                           flt: Dict[str, Any]) -> int:
+    """
+    Filter-Variante, z. B. { sync_status: "pending", older_than: <epoch-ms|ISO> }.
+    Läuft in LIMIT-Chunks (je eine kurze Transaktion) über den
+    (tenant_id, sync_status, created_at)-Index, damit Sperren kurz bleiben.
+    """
+    statuses = _as_list(flt.get("sync_status"))
+    older_than = _to_epoch_ms(flt.get("older_than"))
+    if not statuses and older_than is None:
+        raise ValueError("filter needs sync_status and/or older_than")
+
+    # sync_status<>new_status: sonst matcht der LIMIT-Loop dieselben Zeilen endlos
+    conds = ["tenant_id=%s", "sync_status<>%s"]
+    params: List[Any] = [tenant_id, new_status]
+    if statuses:
+        conds.append(f"sync_status IN ({', '.join(['%s'] * len(statuses))})")
+        params.extend(statuses)
+    if older_than is not None:
+        conds.append("created_at < %s")
+        params.append(older_than)
+
+    now = int(time.time() * 1000)
+    # Pro Chunk: Zeilen sperren (alter Status für die Stats-Deltas), dann per id updaten
+    select_sql = f"SELECT id, sync_status FROM `{table}` WHERE {' AND '.join(conds)} LIMIT %s FOR UPDATE"
+    total = 0
+    with conn.cursor() as cur:
+        while True:
+            conn.begin()
+            try:
+                cur.execute(select_sql, params + [BULK_UPDATE_CHUNK])
+                rows = cur.fetchall()
+                if rows:
+                    cur.execute(
+                        f"UPDATE `{table}` SET sync_status=%s, updated_at=%s "
+                        f"WHERE tenant_id=%s AND id IN ({', '.join(['%s'] * len(rows))})",
+                        [new_status, now, tenant_id] + [r[0] for r in rows])
+                    total += cur.rowcount
+                    _apply_stats(cur, table, tenant_id, _status_deltas([r[1] for r in rows], new_status))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if len(rows) < BULK_UPDATE_CHUNK:
+                break
+    return total
+
+def _handle_bulk_update(d: Dict[str, Any], tenant_id: str, new_status: str) -> Dict[str, Any]:
+    keys = _as_list(d.get("keys"))
+    flt = d.get("filter") if isinstance(d.get("filter"), dict) else None
+    schema = f"{TENANT_SCHEMA_PREFIX}{tenant_id}"
+    t_user = TENANT_DB_USER_TEMPLATE.format(tenant_id=tenant_id)
+    try:
+        tconn = _conn(t_user, schema)
+    except Exception as e:
+        logger.exception("[DB] Connect failed (bulk update_status)")
+        return {"ok": False, "tenantId": tenant_id, "error": f"connect_failed: {type(e).__name__}: {e}"}
+
+    results: List[Dict[str, Any]] = []
+    try:
+        if keys:
+            rowcount, results = _bulk_update_by_keys(tconn, TARGET_TABLE, tenant_id, new_status, keys)
+        else:
+            rowcount = _bulk_update_by_filter(tconn, TARGET_TABLE, tenant_id, new_status, flt or {})
+    except ValueError as e:
+        return {"ok": False, "tenantId": tenant_id, "error": f"bad_request: {e}"}
+    except Exception as e:
+        logger.exception("[DB] Update failed (bulk update_status)")
+        _discard(tconn)
+        return {"ok": False, "tenantId": tenant_id, "error": f"update_failed: {type(e).__name__}: {e}"}
+
+    out: Dict[str, Any] = {
+        "ok": True,
+        "tenantId": tenant_id,
+        "sync": {"status": new_status},
+        "rowcount": rowcount,
+        "db": {"schema": schema, "table": TARGET_TABLE, "status": "updated", "pool": _pool_stats()},
+    }
+    if keys:
+        out["results"] = results
+        out["matched"] = sum(1 for r in results if r["status"] == "updated")
+    return out
+
+# ----------------------------
+# Lese-Pfad: list_files (Keyset-Pagination über file_sync)
+# ----------------------------
+# Projektion: nur diese Spalten dürfen angefragt werden (keine breiten TEXT/JSON-Felder per Default)
+_LIST_COLUMNS = (
+    "id", "created_at", "updated_at", "filename", "s3_bucket", "s3_key", "cf_url", "size_bytes",
+    "sync_status", "meta_subject", "meta_from", "meta_to", "analysis_intent", "analysis_priority",
+    "analysis_summary",
+)
+_LIST_DEFAULT_COLUMNS = (
+    "id", "created_at", "filename", "s3_key", "cf_url", "size_bytes",
+    "sync_status", "meta_subject", "meta_from", "analysis_intent", "analysis_priority",
+)
+
+def _encode_cursor(created_at: int, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at}:{row_id}".encode("ascii")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Tuple[int, int]:
+    created_at, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii").split(":", 1)
+    return int(created_at), int(row_id)
+
+def _to_epoch_ms(v: Any) -> Optional[int]:
+    """Epoch-ms (int/str) oder ISO-8601 ('2025-01-31', '2025-01-31T12:00:00Z') -> epoch ms."""
+    if v is None or v == "":
+        return None
+    if isinstance(v, (int, float)) or (isinstance(v, str) and v.strip().isdigit()):
+        return int(v)
+    dt = datetime.fromisoformat(str(v).strip().replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+def _as_list(v: Any) -> List[str]:
+    if v is None or v == "":
+        return []
+    return [str(x) for x in v] if isinstance(v, (list, tuple)) else [str(v)]
+
+def _list_files(cur, table: str, tenant_id: str, d: Dict[str, Any]) -> Dict[str, Any]:
+    fields = [f for f in _as_list(d.get("fields")) if f in _LIST_COLUMNS] or list(_LIST_DEFAULT_COLUMNS)
+    select_cols = list(dict.fromkeys(fields + ["id", "created_at"]))  # Cursor-Spalten immer mitlesen
+    limit = max(1, min(int(d.get("limit") or LIST_DEFAULT_LIMIT), LIST_MAX_LIMIT))
+    asc = str(d.get("order") or "desc").lower() == "asc"
+
+    conds = ["tenant_id=%s"]
+    params: List[Any] = [tenant_id]
+    for col, key in (("sync_status", "sync_status"), ("analysis_priority", "analysis_priority"),
+                     ("analysis_intent", "analysis_intent")):
+        vals = _as_list(d.get(key))
+        if vals:
+            conds.append(f"{col} IN ({', '.join(['%s'] * len(vals))})")
+            params.extend(vals)
+    created_from = _to_epoch_ms(d.get("from"))
+    created_to = _to_epoch_ms(d.get("to"))
+    if created_from is not None:
+        conds.append("created_at >= %s")
+        params.append(created_from)
+    if created_to is not None:
+        conds.append("created_at < %s")
+        params.append(created_to)
+    if d.get("cursor"):
+        c_created, c_id = _decode_cursor(str(d["cursor"]))
+        op = ">" if asc else "<"
+        conds.append(f"(created_at {op} %s OR (created_at = %s AND id {op} %s))")
+        params.extend([c_created, c_created, c_id])
+
+    direction = "ASC" if asc else "DESC"
     sql = f"""
-        UPDATE `{table}`
-           SET sync_status=%s, updated_at=%s
-         WHERE tenant_id=%s AND ({' OR '.join(conds)})
+        SELECT {', '.join(select_cols)}
+          FROM `{table}`
+         WHERE {' AND '.join(conds)}
+         ORDER BY created_at {direction}, id {direction}
+         LIMIT %s
     """
-    cur.execute(sql, params)
-    return cur.rowcount
+    cur.execute(sql, params + [limit + 1])   # +1: gibt es eine weitere Seite?
+    rows = cur.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [{c: row[i] for i, c in enumerate(select_cols) if c in fields} for row in rows]
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = _encode_cursor(int(last[select_cols.index("created_at")]), int(last[select_cols.index("id")]))
+    return {"items": items, "count": len(items), "next_cursor": next_cursor}
+
+def _handle_list_files(d: Dict[str, Any]) -> Dict[str, Any]:
+    tenant_id = (d.get("tenantId") or d.get("tenant_id") or "").strip()
+    if not tenant_id:
+        return {"ok": False, "error": "missing tenantId"}
+    schema = f"{TENANT_SCHEMA_PREFIX}{tenant_id}"
+    t_user = TENANT_DB_USER_TEMPLATE.format(tenant_id=tenant_id)
+    try:
+        tconn = _conn(t_user, schema, readonly=True)
+    except Exception as e:
+        logger.exception("[DB] Connect failed (list_files)")
+        return {"ok": False, "tenantId": tenant_id, "error": f"connect_failed: {type(e).__name__}: {e}"}
+    try:
+        with tconn.cursor() as cur:
+            page = _list_files(cur, TARGET_TABLE, tenant_id, d)
+    except (ValueError, TypeError) as e:
+        return {"ok": False, "tenantId": tenant_id, "error": f"bad_request: {e}"}
+    except Exception as e:
+        logger.exception("[DB] Query failed (list_files)")
+        _discard(tconn)
+        return {"ok": False, "tenantId": tenant_id, "error": f"query_failed: {type(e).__name__}: {e}"}
+    return {"ok": True, "tenantId": tenant_id, **page}
+
+# ----------------------------
+# Segment-Writer (gzip JSON Lines / Parquet) für Archiv und Export
+# ----------------------------
+# Feste Spaltenliste (ohne virtuelle Spalten wie s3_key_hash), Typen für Parquet
+_SEGMENT_COLUMNS = ("id",) + _FILE_SYNC_INSERT_FIELDS
+_SEGMENT_INT_COLUMNS = ("id", "created_at", "updated_at", "size_bytes")
+
+def _iter_rows(cur, size: int = ARCHIVE_FETCH_ROWS):
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+class _JsonlGzSegment:
+    """Inkrementeller Writer: gzip JSON Lines, eine Zeile pro Datensatz."""
+    def __init__(self, path: str):
+        self.f = gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+        self.rows = 0
+
+    def write(self, rows):
+        for row in rows:
+            self.f.write(json.dumps(dict(zip(_SEGMENT_COLUMNS, row)), ensure_ascii=False, default=str))
+            self.f.write("\n")
+        self.rows += len(rows)
+
+    def close(self):
+        self.f.close()
+
+class _ParquetSegment:
+    """
+    Inkrementeller Writer: Parquet (zstd). Zeilen werden bis PARQUET_ROW_GROUP_ROWS gepuffert,
+    damit nicht jeder fetchmany()-Batch (bzw. jeder Tag daraus) eine Mini-Row-Group wird.
+    """
+    def __init__(self, path: str):
+        # pyarrow ist optional (nur im Analytics-Layer); Import erst bei Bedarf
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.schema = pa.schema([(c, pa.int64() if c in _SEGMENT_INT_COLUMNS else pa.string())
+                                 for c in _SEGMENT_COLUMNS])
+        self.w = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.buf: List[Any] = []
+        self.rows = 0
+        self.row_groups = 0
+
+    def _flush(self):
+        if not self.buf:
+            return
+        pa = self.pa
+        cols = list(zip(*self.buf))
+        self.w.write_table(pa.Table.from_arrays(
+            [pa.array([None if v is None else (v if c in _SEGMENT_INT_COLUMNS else str(v)) for v in col],
+                      type=self.schema.field(c).type)
+             for c, col in zip(_SEGMENT_COLUMNS, cols)],
+            schema=self.schema), row_group_size=len(self.buf))
+        self.buf = []
+        self.row_groups += 1
+
+    def write(self, rows):
+        self.buf.extend(rows)
+        self.rows += len(rows)
+        if len(self.buf) >= PARQUET_ROW_GROUP_ROWS:
+            self._flush()
+
+    def close(self):
+        try:
+            self._flush()
+        finally:
+            self.w.close()
+
+def _write_segment(seg_cls, batches, path: str) -> int:
+    seg = seg_cls(path)
+    try:
+        for rows in batches:
+            seg.write(rows)
+    finally:
+        seg.close()
+    return seg.rows
+
+_SEGMENT_FORMATS = {
+    "jsonl": (".jsonl.gz", "application/gzip", _JsonlGzSegment),
+    "parquet": (".parquet", "application/vnd.apache.parquet", _ParquetSegment),
+}
+
+def _upload_segment(path: str, bucket: str, key: str, content_type: str, rows: int):
+    extra: Dict[str, Any] = {"ContentType": content_type, "Metadata": {"rows": str(rows)}}
+    if KMS_KEY_ID:
+        extra["ServerSideEncryption"] = "aws:kms"
+        extra["SSEKMSKeyId"] = KMS_KEY_ID
+    S3_CLIENT.upload_file(path, bucket, key, ExtraArgs=extra)
+
+# ----------------------------
+# Archivierung: alte Monats-Partitionen -> S3, dann DROP PARTITION
+# ----------------------------
+def _archive_partitions(tconn, table: str, tenant_id: str, older_than_months: int,
+                        fmt: str, dry_run: bool) -> Tuple[List[Dict[str, Any]], int]:
+    """Liefert (verarbeitete Partitionen, Anzahl noch offener archivierbarer Partitionen)."""
+    now = datetime.now(timezone.utc)
+    cutoff = _month_start_ms(*_add_months(now.year, now.month, -older_than_months))
+    ext, content_type, seg_cls = _SEGMENT_FORMATS[fmt]
+    prefix = ARCHIVE_PREFIX_TEMPLATE.format(tenant_id=tenant_id)
+
+    with tconn.cursor() as cur:
+        parts = [(name, int(desc)) for name, desc in _partitions(cur, table)
+                 if name != "pmax" and desc.isdigit() and int(desc) <= cutoff]
+
+    done: List[Dict[str, Any]] = []
+    for name, _upper in parts[:ARCHIVE_MAX_PARTITIONS]:
+        key = f"{prefix}{table}/{name[1:5]}/{name[5:7]}/{table}-{name}{ext}"
+        with tempfile.NamedTemporaryFile(dir="/tmp", suffix=ext) as tmp:
+            # Server-Side-Cursor: Zeilen werden gestreamt, nicht komplett in den Speicher geladen
+            with tconn.cursor(pymysql.cursors.SSCursor) as scur:
+                scur.execute(f"SELECT {', '.join(_SEGMENT_COLUMNS)} FROM `{table}` PARTITION ({name}) ORDER BY id")
+                rows = _write_segment(seg_cls, _iter_rows(scur), tmp.name)
+            size = os.path.getsize(tmp.name)
+            if rows and not dry_run:
+                _upload_segment(tmp.name, S3_BUCKET, key, content_type, rows)
+        entry = {"partition": name, "rows": rows, "bytes": size,
+                 "s3_key": key if rows else None, "dropped": False}
+        if not dry_run:
+            with tconn.cursor() as cur:
+                cur.execute(f"ALTER TABLE `{table}` DROP PARTITION {name}")
+            entry["dropped"] = True
+        logger.info(f"[ARCHIVE] {tenant_id} {entry}")
+        done.append(entry)
+    return done, len(parts) - len(done)
+
+def _handle_archive(d: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    { action: "archive", tenantId, older_than_months?: 12, format?: "jsonl"|"parquet", dry_run?: false }
+    Verarbeitet max. ARCHIVE_MAX_PARTITIONS pro Aufruf; "remaining" > 0 -> erneut aufrufen.
+    """
+    tenant_id = (d.get("tenantId") or d.get("tenant_id") or "").strip()
+    if not tenant_id:
+        return {"ok": False, "error": "missing tenantId"}
+    fmt = str(d.get("format") or "jsonl").lower()
+    if fmt not in _SEGMENT_FORMATS:
+        return {"ok": False, "tenantId": tenant_id, "error": f"bad_request: unknown format {fmt}"}
+    older_than = int(d.get("older_than_months") or ARCHIVE_AFTER_MONTHS)
+    dry_run = bool(d.get("dry_run"))
+
+    schema = f"{TENANT_SCHEMA_PREFIX}{tenant_id}"
+    t_user = TENANT_DB_USER_TEMPLATE.format(tenant_id=tenant_id)
+    try:
+        tconn = _conn(t_user, schema)
+    except Exception as e:
+        logger.exception("[DB] Connect failed (archive)")
+        return {"ok": False, "tenantId": tenant_id, "error": f"connect_failed: {type(e).__name__}: {e}"}
+    try:
+        archived, remaining = _archive_partitions(tconn, TARGET_TABLE, tenant_id, older_than, fmt, dry_run)
+    except ImportError as e:
+        return {"ok": False, "tenantId": tenant_id, "error": f"format_unavailable: {e}"}
+    except Exception as e:
+        logger.exception("[DB] Archive failed")
+        _discard(tconn)
+        return {"ok": False, "tenantId": tenant_id, "error": f"archive_failed: {type(e).__name__}: {e}"}
+    return {"ok": True, "tenantId": tenant_id, "format": fmt, "dry_run": dry_run,
+            "archived": archived, "remaining": remaining,
+            "s3": {"bucket": S3_BUCKET, "prefix": ARCHIVE_PREFIX_TEMPLATE.format(tenant_id=tenant_id)}}
+
+# ----------------------------
+# Analytics-Export: file_sync -> Parquet, partitioniert nach Datum, inkrementell
+# ----------------------------
+# Layout: <target>/tenant_id=<id>/dt=YYYY-MM-DD/part-<run>.parquet (+ _checkpoint.json)
+# Geänderte Zeilen werden erneut exportiert -> Auswertungen deduplizieren per id (max updated_at).
+# updated_at ist der Zeitpunkt des Statements, nicht des Commits: eine Transaktion, die nach dem
+# letzten Lauf committet, kann einen updated_at < Watermark tragen. Jeder Lauf liest daher ab
+# Watermark - EXPORT_OVERLAP_SECONDS erneut und überspringt (id, updated_at)-Paare, die der
+# Checkpoint aus diesem Fenster schon kennt. Länger laufende Transaktionen bleiben ein Restrisiko.
+def _split_target(target: str) -> Tuple[Optional[str], str]:
+    if target.startswith("s3://"):
+        bucket, _, prefix = target[5:].partition("/")
+        return bucket, prefix.rstrip("/") + "/" if prefix else ""
+    return None, target.rstrip("/") + "/"
+
+def _load_checkpoint(bucket: Optional[str], path: str) -> Dict[str, Any]:
+    try:
+        if bucket:
+            return json.loads(S3_CLIENT.get_object(Bucket=bucket, Key=path)["Body"].read())
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        code = getattr(e, "response", {}).get("Error", {}).get("Code")
+        if code in ("NoSuchKey", "404"):
+            return {}
+        if code in ("AccessDenied", "403"):
+            # ohne s3:ListBucket meldet S3 fehlende Keys als 403 -> wie "noch kein Checkpoint"
+            logger.warning(f"[EXPORT] checkpoint {path}: {code}, treating as missing (s3:ListBucket granted?)")
+            return {}
+        raise
+
+def _save_checkpoint(bucket: Optional[str], path: str, doc: Dict[str, Any]):
+    body = json.dumps(doc, separators=(",", ":")).encode("utf-8")
+    if bucket:
+        S3_CLIENT.put_object(Bucket=bucket, Key=path, Body=body, ContentType="application/json")
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(body)
+    os.replace(tmp, path)   # atomar: halbe Checkpoints gibt es nicht
+
+def _export_tenant(tconn, table: str, tenant_id: str, fmt: str, target: str, max_rows: int) -> Dict[str, Any]:
+    ext, content_type, seg_cls = _SEGMENT_FORMATS[fmt]
+    bucket, base = _split_target(target)
+    tenant_rel = f"tenant_id={tenant_id}/"
+    ckpt_path = f"{base}{tenant_rel}_checkpoint.json"
+    ckpt = _load_checkpoint(bucket, ckpt_path)
+    last_upd = int(ckpt.get("updated_at") or 0)
+    since = max(0, last_upd - EXPORT_OVERLAP_SECONDS * 1000) if last_upd else 0
+    seen = {(int(i), int(u)) for i, u in ckpt.get("recent") or []}   # im Fenster schon exportiert
+
+    # Zufallsanteil: Folgeaufrufe ("more") in derselben Sekunde dürfen keine Dateien überschreiben
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + os.urandom(3).hex()
+    workdir = tempfile.mkdtemp(dir="/tmp") + "/" if bucket else base
+    try:
+        i_created, i_updated = _SEGMENT_COLUMNS.index("created_at"), _SEGMENT_COLUMNS.index("updated_at")
+        # Zeilen kommen nach updated_at, nicht nach Tag: höchstens EXPORT_MAX_OPEN_SEGMENTS Writer offen
+        # (LRU). Kommt ein geschlossener Tag erneut vor, bekommt er eine weitere Datei (part-<run>-<n>).
+        segments: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()   # day -> (rel_path, offener Writer)
+        closed: List[Tuple[str, Any]] = []
+        parts: Dict[str, int] = {}
+        n = fetched = 0
+        exported: List[Tuple[int, int]] = []
+        # übersprungene Zeilen zählen nicht gegen max_rows: höchstens len(seen) davon
+        limit = max_rows + len(seen)
+        try:
+            # Server-Side-Cursor auf dem Reader: streamt ohne Puffer, belastet den Writer nicht
+            with tconn.cursor(pymysql.cursors.SSCursor) as cur:
+                cur.execute(f"""
+                    SELECT {', '.join(_SEGMENT_COLUMNS)}
+                      FROM `{table}`
+                     WHERE tenant_id=%s AND updated_at >= %s
+                     ORDER BY updated_at, id
+                     LIMIT %s
+                """, (tenant_id, since, limit))
+                for rows in _iter_rows(cur):
+                    fetched += len(rows)
+                    by_day: Dict[str, List[Any]] = {}
+                    for row in rows:
+                        key = (int(row[0]), int(row[i_updated]))
+                        if key in seen:
+                            continue
+                        exported.append(key)
+                        day = datetime.fromtimestamp(int(row[i_created]) / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+                        by_day.setdefault(day, []).append(row)
+                    for day, day_rows in by_day.items():
+                        if day in segments:
+                            segments.move_to_end(day)
+                        else:
+                            while len(segments) >= max(1, EXPORT_MAX_OPEN_SEGMENTS):
+                                rel, seg = segments.popitem(last=False)[1]
+                                seg.close()
+                                closed.append((rel, seg))
+                            parts[day] = parts.get(day, 0) + 1
+                            suffix = f"-{parts[day]}" if parts[day] > 1 else ""
+                            rel = f"{tenant_rel}dt={day}/part-{run_id}{suffix}{ext}"
+                            os.makedirs(os.path.dirname(workdir + rel), exist_ok=True)
+                            segments[day] = (rel, seg_cls(workdir + rel))
+                        segments[day][1].write(day_rows)
+                        n += len(day_rows)
+                    last_upd = max(last_upd, int(rows[-1][i_updated]))
+        finally:
+            for rel, seg in segments.values():
+                seg.close()
+                closed.append((rel, seg))
+
+        files = []
+        for rel, seg in sorted(closed, key=lambda c: c[0]):
+            if bucket:
+                _upload_segment(workdir + rel, bucket, base + rel, content_type, seg.rows)
+                os.remove(workdir + rel)
+            files.append({"path": (f"s3://{bucket}/" if bucket else "") + base + rel, "rows": seg.rows})
+
+        # Checkpoint erst nach erfolgreichem Schreiben aller Dateien; "recent" = Paare im nächsten Fenster
+        if n:
+            window = last_upd - EXPORT_OVERLAP_SECONDS * 1000
+            recent = sorted(k for k in seen.union(exported) if k[1] >= window)
+            _save_checkpoint(bucket, ckpt_path, {"updated_at": last_upd, "recent": recent,
+                                                 "exported_at": run_id, "rows": n})
+        return {"rows": n, "skipped": fetched - n, "files": files, "more": fetched >= limit,
+                "checkpoint": {"updated_at": last_upd, "overlap_s": EXPORT_OVERLAP_SECONDS}}
+    finally:
+        if bucket:
+            shutil.rmtree(workdir, ignore_errors=True)   # warme Container: /tmp nicht volllaufen lassen
+
+def _handle_export(d: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    { action: "export", tenantId, target?: "s3://bucket/prefix/" | "/local/path", format?: "parquet"|"jsonl",
+      max_rows?: EXPORT_MAX_ROWS }
+    "more": true -> erneut aufrufen, der Checkpoint setzt nahtlos fort.
+    """
+    tenant_id = (d.get("tenantId") or d.get("tenant_id") or "").strip()
+    if not tenant_id:
+        return {"ok": False, "error": "missing tenantId"}
+    fmt = str(d.get("format") or "parquet").lower()
+    if fmt not in _SEGMENT_FORMATS:
+        return {"ok": False, "tenantId": tenant_id, "error": f"bad_request: unknown format {fmt}"}
+    target = str(d.get("target") or EXPORT_TARGET)
+    max_rows = max(1, int(d.get("max_rows") or EXPORT_MAX_ROWS))
+
+    schema = f"{TENANT_SCHEMA_PREFIX}{tenant_id}"
+    t_user = TENANT_DB_USER_TEMPLATE.format(tenant_id=tenant_id)
+    try:
+        tconn = _conn(t_user, schema, readonly=True)
+    except Exception as e:
+        logger.exception("[DB] Connect failed (export)")
+        return {"ok": False, "tenantId": tenant_id, "error": f"connect_failed: {type(e).__name__}: {e}"}
+    try:
+        res = _export_tenant(tconn, TARGET_TABLE, tenant_id, fmt, target, max_rows)
+    except ImportError as e:
+        return {"ok": False, "tenantId": tenant_id, "error": f"format_unavailable: {e}"}
+    except Exception as e:
+        logger.exception("[DB] Export failed")
+        _discard(tconn)
+        return {"ok": False, "tenantId": tenant_id, "error": f"export_failed: {type(e).__name__}: {e}"}
+    logger.info(f"[EXPORT] {tenant_id} rows={res['rows']} files={len(res['files'])} more={res['more']}")
+    return {"ok": True, "tenantId": tenant_id, "format": fmt, "target": target, **res}
+
+def _handle_migrate(d: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    { action: "migrate", target: "meta" }          -> tenants-Tabelle im Meta-Schema
+    { action: "migrate", tenantId: "<id>" }         -> file_sync im Tenant-Schema
+    """
+    if d.get("target") == "meta":
+        user, schema, name = META_DB_USER, META_DB_NAME, "tenants"
+    else:
+        tenant_id = (d.get("tenantId") or d.get("tenant_id") or "").strip()
+        if not tenant_id:
+            return {"ok": False, "error": "missing tenantId or target=meta"}
+        user = TENANT_DB_USER_TEMPLATE.format(tenant_id=tenant_id)
+        schema, name = f"{TENANT_SCHEMA_PREFIX}{tenant_id}", TARGET_TABLE
+    try:
+        c = _conn(user, schema)
+    except Exception as e:
+        logger.exception("[DB] Connect failed (migrate)")
+        return {"ok": False, "schema": schema, "error": f"connect_failed: {type(e).__name__}: {e}"}
+    try:
+        with c.cursor() as cur:
+            if name == "tenants":
+                version = _ensure_tenants_indexes(cur)
+            else:
+                version = _ensure_file_sync_table(cur, TARGET_TABLE, schema, online_only=False)
+    except Exception as e:
+        logger.exception("[DB] Migration failed")
+        _discard(c)
+        return {"ok": False, "schema": schema, "table": name, "error": f"migrate_failed: {type(e).__name__}: {e}"}
+    return {"ok": True, "schema": schema, "table": name, "version": version}
 
 # =========================
 # Lambda-Handler (kombiniert)
@@ -234,7 +1540,41 @@ def _update_sync_status(cur, table: str, tenant_id: str,
 def lambda_handler(event, context):
     _debug_fs()  # wie gehabt: TLS/Layer-Diagnostik
 
+    # --- BATCH-Write-Pfad (SQS-Batch / Step Functions Map) ---
+    batch = _batch_items(event)
+    if batch is not None:
+        source, items = batch
+        return _handle_write_batch(source, items)
+
     d = _take_detail(event)
+    # API Gateway (Proxy): Aktion steckt im JSON-Body
+    if isinstance(d, dict) and isinstance(d.get("body"), str) and not d.get("action"):
+        try:
+            body = json.loads(d["body"])
+            if isinstance(body, dict) and body.get("action"):
+                d = body
+        except Exception:
+            pass
+
+    # --- READ-Pfad: aggregierte Tenant-Statistik (ein PK-Range-Read) ---
+    if isinstance(d, dict) and d.get("action") == "get_stats":
+        return _handle_get_stats(d)
+
+    # --- READ-Pfad: Dateiliste mit Keyset-Pagination ---
+    if isinstance(d, dict) and d.get("action") == "list_files":
+        return _handle_list_files(d)
+
+    # --- ARCHIVE-Pfad: alte Monats-Partitionen nach S3 auslagern und droppen ---
+    if isinstance(d, dict) and d.get("action") == "archive":
+        return _handle_archive(d)
+
+    # --- EXPORT-Pfad: inkrementeller Analytics-Export (Parquet) vom Reader ---
+    if isinstance(d, dict) and d.get("action") == "export":
+        return _handle_export(d)
+
+    # --- MIGRATE-Pfad: Schema-Migrationen explizit einspielen (AUTO_MIGRATE ist default aus) ---
+    if isinstance(d, dict) and d.get("action") == "migrate":
+        return _handle_migrate(d)
 
     # --- UPDATE-Status-Pfad ---
     if isinstance(d, dict) and d.get("action") == "update_status":
@@ -245,6 +1585,10 @@ def lambda_handler(event, context):
         if not tenant_id or not new_status:
             return {"ok": False, "error": "missing tenantId or new_status"}
 
+        # Bulk: Liste von s3_keys oder Filter (z. B. alle pending älter als X)
+        if d.get("keys") or d.get("filter"):
+            return _handle_bulk_update(d, tenant_id, new_status)
+
         schema = f"{TENANT_SCHEMA_PREFIX}{tenant_id}"
         t_user = TENANT_DB_USER_TEMPLATE.format(tenant_id=tenant_id)
         try:
@@ -261,17 +1605,15 @@ def lambda_handler(event, context):
                             "file": {"s3_key": s3_key, "filename": filename}}
         except Exception as e:
             logger.exception("[DB] Update failed (update_status)")
+            _discard(tconn)
             return {"ok": False, "tenantId": tenant_id, "error": f"update_failed: {type(e).__name__}: {e}"}
-        finally:
-            try: tconn.close()
-            except: pass
 
         return {
             "ok": True,
             "tenantId": tenant_id,
             "sync": {"status": new_status},
             "file": {"s3_key": s3_key, "filename": filename},
-            "db": {"schema": schema, "table": TARGET_TABLE, "status": "updated"}
+            "db": {"schema": schema, "table": TARGET_TABLE, "status": "updated", "pool": _pool_stats()}
         }
 
     # --- INSERT/Write-Pfad (Lambda5 -> Lambda6) ---
@@ -289,19 +1631,24 @@ def lambda_handler(event, context):
         try:
             with tconn.cursor() as cur:
                 if AUTO_MIGRATE:
-                    _ensure_file_sync_table(cur, TARGET_TABLE)
+                    _ensure_file_sync_table(cur, TARGET_TABLE, schema)
+                else:
+                    _roll_partitions(cur, TARGET_TABLE, schema)   # DDL committet implizit -> vor BEGIN
+                tconn.begin()
                 _insert_file_sync(cur, TARGET_TABLE, rec)
+                _apply_stats(cur, TARGET_TABLE, tenant_id, _insert_deltas([rec]))
+                tconn.commit()
         except Exception as e:
             logger.exception("[DB] Insert failed (write path)")
-            return {"ok": False, "tenantId": tenant_id, "error": f"insert_failed: {type(e).__name__}: {e}"}
-        finally:
-            try: tconn.close()
+            try: tconn.rollback()
             except: pass
+            _discard(tconn)
+            return {"ok": False, "tenantId": tenant_id, "error": f"insert_failed: {type(e).__name__}: {e}"}
 
         return {
             "ok": True,
             "tenantId": tenant_id,
-            "db": {"schema": schema, "table": TARGET_TABLE, "status": "stored"},
+            "db": {"schema": schema, "table": TARGET_TABLE, "status": "stored", "pool": _pool_stats()},
             "file": d.get("file") or {},
             "meta": d.get("meta") or {},
             "analysis": d.get("analysis") or {},
@@ -314,53 +1661,71 @@ def lambda_handler(event, context):
         logger.warning("Keine E-Mail-Adresse im Event.")
         return {"tenant_id": "unknown", "reason": "email_missing"}
 
-    # 1) Meta-Lookup
-    try:
-        meta = _conn(META_DB_USER, META_DB_NAME)
-    except Exception as e:
-        logger.exception(f"Meta-DB Verbindung fehlgeschlagen: {type(e).__name__}: {e}")
-        return {"tenant_id": "unknown", "reason": "meta_connect_error"}
+    # 1) Meta-Lookup (zuerst Cache, erst bei Miss auf die Meta-DB)
+    email_norm = email.strip().lower()
+    cached, res = _tenant_cache_get(email_norm)
+    if not cached:
+        try:
+            if AUTO_MIGRATE:
+                # DDL nur auf dem Writer; danach gecacht (_MIGRATED)
+                with _conn(META_DB_USER, META_DB_NAME).cursor() as cur:
+                    _ensure_tenants_indexes(cur)
+            meta = _conn(META_DB_USER, META_DB_NAME, readonly=True)
+        except Exception as e:
+            logger.exception(f"Meta-DB Verbindung fehlgeschlagen: {type(e).__name__}: {e}")
+            return {"tenant_id": "unknown", "reason": "meta_connect_error"}
 
-    try:
-        res = _resolve_tenant(meta, email)
-        if not res:
-            logger.warning(f"Kein Tenant für {email} gefunden.")
-            return {"tenant_id": "unknown", "reason": "tenant_not_found"}
+        try:
+            if TENANT_CACHE_WARMUP and not _tenant_cache_warmed:
+                logger.info(f"[CACHE] warm-up: {_warm_tenant_cache(meta)} tenants")
+                cached, res = _tenant_cache_get(email_norm)
+            if not cached:
+                res = _resolve_tenant(meta, email)
+                _tenant_cache_put(email_norm, res)
+        except Exception:
+            _discard(meta)
+            raise
 
-        tenant_id, user_email, user_name = res
-        schema = f"{TENANT_SCHEMA_PREFIX}{tenant_id}"
-    finally:
-        try: meta.close()
-        except: pass
+    if not res:
+        logger.warning(f"Kein Tenant für {email} gefunden.")
+        return {"tenant_id": "unknown", "reason": "tenant_not_found"}
+
+    tenant_id, user_email, user_name = res
+    schema = f"{TENANT_SCHEMA_PREFIX}{tenant_id}"
 
     # 2) Strikt getrennt: neue Verbindung mit tenant-spezifischem IAM-DB-User
     t_user = TENANT_DB_USER_TEMPLATE.format(tenant_id=tenant_id)
     try:
-        tconn = _conn(t_user, schema)
+        tconn = _conn(t_user, schema, readonly=True)
     except Exception as e:
         logger.exception(f"Tenant-DB Verbindung fehlgeschlagen: {type(e).__name__}: {e}")
         return {"tenant_id": tenant_id, "schema": schema, "reason": "tenant_connect_error"}
 
     try:
-        with tconn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM users;")
-            user_count = int(cur.fetchone()[0])
-    finally:
-        try: tconn.close()
-        except: pass
+        user_count = _user_count(tenant_id, t_user, schema, tconn)
+    except Exception:
+        _discard(tconn)
+        raise
+
+    logger.info(f"[POOL] {_pool_stats()} [CACHE] {dict(_TENANT_CACHE_STATS, size=len(_TENANT_CACHE))}")
 
     s3_prefix = S3_PREFIX_TEMPLATE.format(tenant_id=tenant_id)
     ses_identity_hint = f"{SES_IDENTITY_PREFIX}{tenant_id}"
 
+    routing = {
+        "s3_bucket": S3_BUCKET,
+        "s3_prefix": s3_prefix,
+        "ses_identity_hint": ses_identity_hint
+    }
+    if S3_KEY_SHARD_CHARS.strip():
+        # logischer Prefix, physischer Key per Hash-Shard (Mover); nur wenn hier konfiguriert,
+        # sonst würde ein 0 den KEY_SHARD_CHARS-Default des Movers überschreiben
+        routing["s3_shard_chars"] = int(S3_KEY_SHARD_CHARS)
     return {
         "tenant_id": tenant_id,
         "schema": schema,
         "user_count": user_count,
         "user": {"email": user_email, "name": user_name},
-        "routing": {
-            "s3_bucket": S3_BUCKET,
-            "s3_prefix": s3_prefix,
-            "ses_identity_hint": ses_identity_hint
-        },
+        "routing": routing,
         "mode": "A_strict_isolation"
     }
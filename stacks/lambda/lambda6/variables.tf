@@ -26,6 +26,7 @@ variable "env" {
     CONNECT_TIMEOUT         = "30"
     DB_HOST                 = "miraedrive.cluster-col0w04g2rbq.us-east-1.rds.amazonaws.com"
     DB_PORT                 = "3306"
+    DB_READER_HOST          = "miraedrive.cluster-ro-col0w04g2rbq.us-east-1.rds.amazonaws.com"
     META_DB_NAME            = "miraedrive_db"
     META_DB_USER            = "admin_miraedrive"
     RDS_CA_PATH             = "/opt/python/rds-combined-ca-bundle.pem"
@@ -57,6 +58,8 @@ variable "layer_arns"           { type = list(string), default = [
   "arn:${data.aws_partition.current.partition}:lambda:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:layer:pymysql-layer:4"
 ] }
 variable "s3_read_bucket_names" { type = list(string), default = ["miraedrive-assets"] }
+variable "s3_write_bucket_names" { type = list(string), default = [] }  # archive/export; leer = keine Schreibrechte
+variable "s3_write_prefixes"    { type = list(string), default = ["tenants/*/archive/", "analytics/file_sync/"] }
 variable "add_elbv2_describe"   { type = bool, default = true }
 
 # API-Gateway / Lambda-Invoke Permissions
@@ -1,5 +1,6 @@
 import base64
 import boto3
+import hashlib
 import json
 import os
 import re
@@ -8,6 +9,7 @@ from typing import Any, Dict, Tuple, List, Optional
 from email import policy
 from email.parser import BytesParser
 from email.message import EmailMessage
+from botocore.exceptions import ClientError
 
 import urllib3
 from urllib3.util import Retry
@@ -74,6 +76,8 @@ except ValueError:
 
 TENANT_SECRET_NAME = os.getenv("TENANT_SECRET_NAME", "")
 TENANT_PARAM_PREFIX = os.getenv("TENANT_PARAM_PREFIX", "")
+# Wie beim Mover (stacks/lambda/lambda): nur für die Fallback-Suche im jeweils anderen Key-Layout
+KEY_SHARD_CHARS = int(os.getenv("KEY_SHARD_CHARS", "0") or "0")
 
 # --- Force urllib3 to use IPv4 sockets only ---
 import urllib3.util.connection as urllib3_connection
@@ -98,9 +102,40 @@ http = urllib3.PoolManager(
 def _b2s(b: Optional[bytes]) -> str:
     return b.decode("utf-8", errors="replace") if b is not None else ""
 
-def _load_raw_email(bucket: str, key: str) -> bytes:
-    resp = s3.get_object(Bucket=bucket, Key=key)
-    return resp["Body"].read()
+def _raw_email_keys(key: str, tenant_id: str) -> List[str]:
+    """
+    Kandidaten für eine Raw-Mail: der übergebene Key, danach das andere Layout.
+    Der Mover legt Mails mit KEY_SHARD_CHARS > 0 unter tenants/<id>/<shard>/emails/ ab
+    (shard = sha256(logischer Key)); migrate_keys (Lambda3) verschiebt nur PDFs, Mails von
+    vor der Umstellung bleiben unter tenants/<id>/emails/.
+    """
+    keys = [key]
+    parts = key.split("/")
+    if tenant_id not in parts[:-1]:
+        return keys
+    i = parts.index(tenant_id) + 1
+    # geshardet -> logisch (Shard über den Hash verifiziert, kein echter Ordnername)
+    logical = "/".join(parts[:i] + parts[i + 1:])
+    shard = parts[i]
+    if len(parts) > i + 2 and 0 < len(shard) <= 8 and hashlib.sha256(logical.encode("utf-8")).hexdigest()[:len(shard)] == shard:
+        keys.append(logical)
+    elif KEY_SHARD_CHARS > 0:
+        keys.append("/".join(parts[:i] + [hashlib.sha256(key.encode("utf-8")).hexdigest()[:KEY_SHARD_CHARS]] + parts[i:]))
+    return keys
+
+def _load_raw_email(bucket: str, key: str, tenant_id: str = "") -> bytes:
+    keys = _raw_email_keys(key, tenant_id) if tenant_id else [key]
+    for n, k in enumerate(keys):
+        try:
+            resp = s3.get_object(Bucket=bucket, Key=k)
+        except ClientError as e:
+            # ohne s3:ListBucket meldet S3 fehlende Keys als 403
+            if n + 1 < len(keys) and e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "403", "AccessDenied"):
+                continue
+            raise
+        if k != key:
+            print(f"[raw-email] {key} nicht gefunden, gelesen aus {k}")
+        return resp["Body"].read()
 
 def _parse_email(raw: bytes) -> Tuple[EmailMessage, Dict[str, Any]]:
     msg: EmailMessage = BytesParser(policy=policy.default).parsebytes(raw)
@@ -312,7 +347,7 @@ def handler(event, context):
     # --- END CONNECTIVITY DEBUG CALL ---
 
     # 1) Lade & parse E-Mail (JETZT erst)
-    raw = _load_raw_email(bucket, key)
+    raw = _load_raw_email(bucket, key, tenant_id)
     _, parsed = _parse_email(raw)
 
     # 3) Payload